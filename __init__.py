@@ -4,15 +4,25 @@ Jules Programming Language
 A friendly programming language designed for beginners.
 """
 
-import sys
-from jules.core.interpreter import JulesInterpreter, run_file, run_interactive
+# Loaded on first use, so 'import jules' doesn't pay for the interpreter
+_INTERPRETER_NAMES = ('JulesInterpreter', 'run_file', 'run_interactive')
+_PROGRAM_NAMES = ('compile', 'Program')
+
+
+def __getattr__(name):
+    if name in _INTERPRETER_NAMES:
+        from jules.core import interpreter
+        return getattr(interpreter, name)
+    if name in _PROGRAM_NAMES:
+        from jules.core import program
+        return getattr(program, name)
+    raise AttributeError(f"module 'jules' has no attribute '{name}'")
+
 
 def main():
     """Entry point for the Jules language"""
-    if len(sys.argv) > 1:
-        run_file(sys.argv[1])
-    else:
-        run_interactive()
+    from jules.core.cli import main as cli_main
+    cli_main()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Jules Benchmarks
+
+Runs the workloads in workloads.py on each engine and reports wall time,
+statements per second and peak memory:
+
+    interpreter    core/interpreter.py
+    vm             core/vm.py
+    python         core/transpiler.py
+    jules.py       the line-by-line interpreter in jules.py
+    run_simple.py  the demonstration interpreter
+
+Every run happens in a fresh Python, and the best of --repeat runs counts.
+Peak memory comes from one more run under tracemalloc. The number of
+statements is what the core interpreter runs, so statements per second
+compares engines on the same work. Output that differs from the core
+interpreter's is reported, since its timing means little.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --json results.json
+    python benchmarks/run.py --engines vm python --compare results.json
+
+With --compare, the exit status is 1 when any wall time got slower than
+the saved one by more than --tolerance.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from workloads import WORKLOADS
+
+ENGINES = ('interpreter', 'vm', 'python', 'jules.py', 'run_simple.py')
+
+# The core module that runs each core engine
+CORE_ENGINES = {'interpreter': 'interpreter', 'vm': 'vm', 'python': 'transpiler'}
+
+# How long one run may take before it's given up on, in seconds
+RUN_TIMEOUT = 60
+
+# How much slower than a saved result a run may be before --compare fails
+REGRESSION_TOLERANCE = 0.25
+
+
+class StatementCounter:
+    """A tracer sink that only counts the statements run"""
+    def __init__(self):
+        self.statements = 0
+
+    def write(self, event):
+        if event.kind not in ('call', 'import'):
+            self.statements += 1
+
+    def close(self):
+        pass
+
+
+def run_engine(engine, path):
+    """Run a program file on an engine, returning everything it showed"""
+    if engine in CORE_ENGINES:
+        import importlib
+        from core.output import Output
+        module = importlib.import_module(f"core.{CORE_ENGINES[engine]}")
+        output = Output.capture()
+        module.run_file(path, output=output, cache=False)
+        return output.getvalue()
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        if engine == 'jules.py':
+            import jules
+            jules.run_file(path)
+        else:
+            import run_simple
+            run_simple.run_simple_jules(path)
+    return buffer.getvalue()
+
+
+def child(mode, engine, path):
+    """What a fresh Python reports back about one run, as a dict"""
+    if mode == 'count':
+        from core.interpreter import run_file
+        from core.output import Output
+        from core.tracing import Tracer, STATEMENTS
+        counter = StatementCounter()
+        output = Output.capture()
+        run_file(path, tracer=Tracer(STATEMENTS, counter), output=output, cache=False)
+        return {'statements': counter.statements, 'output': output.getvalue()}
+    if mode == 'memory':
+        import tracemalloc
+        tracemalloc.start()
+        shown = run_engine(engine, path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'peak_bytes': peak, 'output': shown}
+    start = time.perf_counter()
+    shown = run_engine(engine, path)
+    return {'wall_s': time.perf_counter() - start, 'output': shown}
+
+
+class RunFailed(Exception):
+    pass
+
+
+def spawn(mode, engine, path, drawing_file, timeout):
+    """Run child() in a fresh Python; raises RunFailed if it failed or took too long"""
+    env = dict(os.environ, JULES_DRAWING_BACKEND='svg', JULES_DRAWING_FILE=drawing_file)
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, engine, path]
+    try:
+        finished = subprocess.run(command, env=env, stdout=subprocess.PIPE, universal_newlines=True,
+                                  timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RunFailed(f"over {timeout:g}s")
+    if finished.returncode != 0:
+        raise RunFailed('failed')
+    return json.loads(finished.stdout.splitlines()[-1])
+
+
+def benchmark(workload, engines, repeat, timeout, directory):
+    """Result dicts for one workload on each of the engines that understand it"""
+    path = os.path.join(directory, f"{workload.name}.jules")
+    with open(path, 'w') as file:
+        file.write(workload.source)
+    drawing_file = os.path.join(directory, f"{workload.name}.svg")
+    try:
+        reference = spawn('count', 'interpreter', path, drawing_file, timeout)
+    except RunFailed:
+        reference = None
+    results = []
+    for engine in engines:
+        if engine not in workload.engines:
+            continue
+        result = {'workload': workload.name, 'engine': engine,
+                  'statements': reference['statements'] if reference else None,
+                  'wall_s': None, 'statements_per_s': None, 'peak_bytes': None}
+        try:
+            runs = [spawn('time', engine, path, drawing_file, timeout) for _ in range(repeat)]
+            memory = spawn('memory', engine, path, drawing_file, timeout)
+        except RunFailed as failure:
+            result['status'] = str(failure)
+        else:
+            result['wall_s'] = min(run['wall_s'] for run in runs)
+            result['peak_bytes'] = memory['peak_bytes']
+            if result['statements']:
+                result['statements_per_s'] = result['statements'] / result['wall_s']
+            same = reference is not None and runs[0]['output'] == reference['output']
+            result['status'] = 'ok' if same else 'wrong output'
+        results.append(result)
+        print(format_result(result), flush=True)
+    return results
+
+
+def format_result(result):
+    def number(value, scale, width, form):
+        return format(value * scale, f">{width}{form}") if value is not None else '-'.rjust(width)
+    return (f"{result['workload']:<22}{result['engine']:<15}"
+            f"{number(result['wall_s'], 1000, 10, '.1f')}"
+            f"{number(result['statements_per_s'], 1, 16, ',.0f')}"
+            f"{number(result['peak_bytes'], 1 / 1024, 12, ',.0f')}"
+            f"  {result['status']}")
+
+
+def current_commit():
+    try:
+        finished = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                  universal_newlines=True)
+    except OSError:
+        return None
+    return finished.stdout.strip() or None
+
+
+def compare(results, saved, tolerance):
+    """Print how each wall time moved against saved results; True if any regressed"""
+    before = {(old['workload'], old['engine']): old['wall_s'] for old in saved['results']}
+    print(f"\nCompared with {saved.get('commit') or 'saved results'}:")
+    regressed = False
+    for result in results:
+        old = before.get((result['workload'], result['engine']))
+        if not old or result['wall_s'] is None:
+            continue
+        ratio = result['wall_s'] / old
+        slower = ratio > 1 + tolerance
+        regressed = regressed or slower
+        print(f"{result['workload']:<22}{result['engine']:<15}{ratio:>8.2f}x"
+              f"{'  SLOWER' if slower else ''}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Jules programs on each engine')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--workloads', nargs='+', choices=[workload.name for workload in WORKLOADS])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each, best counts (default: 3)')
+    parser.add_argument('--timeout', type=float, default=RUN_TIMEOUT,
+                        help=f'seconds one run may take before it is given up on (default: {RUN_TIMEOUT})')
+    parser.add_argument('--json', metavar='PATH', help='save the results here')
+    parser.add_argument('--compare', metavar='PATH', help='saved results to compare wall times with')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help=f'how much slower counts as a regression (default: {REGRESSION_TOLERANCE})')
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'ENGINE', 'PATH'), help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.child:
+        print(json.dumps(child(*options.child)))
+        return 0
+
+    selected = [workload for workload in WORKLOADS
+                if not options.workloads or workload.name in options.workloads]
+    print(f"{'workload':<22}{'engine':<15}{'wall ms':>10}{'statements/s':>16}{'peak KiB':>12}  status")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for workload in selected:
+            results.extend(benchmark(workload, options.engines, options.repeat, options.timeout, directory))
+
+    report = {
+        'commit': current_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': options.repeat,
+        'results': results,
+    }
+    if options.json:
+        with open(options.json, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+    if options.compare:
+        with open(options.compare) as file:
+            saved = json.load(file)
+        if compare(results, saved, options.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Jules Startup Benchmark
+
+Starts a fresh Python for each run of a tiny program and times it from
+launch to exit, on each engine. Fails (exit status 1) when the median cold
+start of any engine is over the budget, and shows where its time went.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --budget-ms 120
+
+The budget can also be set with JULES_STARTUP_BUDGET_MS. The benchmark
+also fails if 'get drawing' imports turtle before a drawing function is
+called.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.startup import profile_startup
+
+JULES = os.path.join(ROOT, 'jules.py')
+HELLO = os.path.join(ROOT, 'examples', 'hello.jules')
+
+# Median launch-to-exit time each engine has to beat, in milliseconds
+STARTUP_BUDGET_MS = 150
+
+ENGINES = {
+    'default': [],
+    'vm': ['--vm'],
+    'python': ['--python'],
+}
+
+# Prints whether turtle got imported by 'get drawing' alone
+LAZY_DRAWING_CHECK = """
+import sys
+sys.path.insert(0, {root!r})
+from core.interpreter import run_file
+run_file({program!r})
+print('turtle' in sys.modules)
+"""
+
+
+def time_start(arguments, runs):
+    """Launch-to-exit times in milliseconds for a number of fresh runs"""
+    command = [sys.executable, JULES] + arguments
+    # The first run writes any caches, as a program run every day would have
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def drawing_is_lazy():
+    """Whether 'get drawing' leaves turtle unimported until it's needed"""
+    with tempfile.TemporaryDirectory() as directory:
+        program = os.path.join(directory, 'get_drawing.jules')
+        with open(program, 'w') as file:
+            file.write('get drawing\n')
+        check = LAZY_DRAWING_CHECK.format(root=ROOT, program=program)
+        finished = subprocess.run([sys.executable, '-c', check], stdout=subprocess.PIPE,
+                                  universal_newlines=True, check=True)
+    return finished.stdout.strip().splitlines()[-1] == 'False'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time how long Jules takes to start')
+    parser.add_argument('--runs', type=int, default=10, help='fresh runs per engine (default: 10)')
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.environ.get('JULES_STARTUP_BUDGET_MS', STARTUP_BUDGET_MS)),
+                        help=f'the most a median cold start may take (default: {STARTUP_BUDGET_MS})')
+    options = parser.parse_args(argv)
+
+    failed = False
+    for engine, flags in ENGINES.items():
+        times = time_start(flags + [HELLO], options.runs)
+        median = statistics.median(times)
+        over = median > options.budget_ms
+        print(f"{engine:<12} median {median:7.1f}ms  best {min(times):7.1f}ms  "
+              f"{'OVER BUDGET' if over else 'ok'}")
+        if over:
+            failed = True
+            profile_startup(flags + [HELLO], sys.stdout)
+
+    if not drawing_is_lazy():
+        print("'get drawing' imported turtle before any drawing function was called")
+        failed = True
+
+    print(f"Budget: {options.budget_ms:.0f}ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Jules Benchmark Workloads
+
+Small programs that each lean on one part of the language. Every workload
+runs on every engine that understands it: run_simple.py only knows 'show'
+and assignment, so it only gets the straight line program.
+"""
+
+from collections import namedtuple
+
+Workload = namedtuple('Workload', ['name', 'source', 'engines'])
+
+# Engines that run the whole language
+FULL_LANGUAGE = ('interpreter', 'vm', 'python', 'jules.py')
+
+COUNTED_LOOP = """
+total is 0
+i is 0
+repeat 100000 times
+    i is i + 1
+    total is total + i
+done
+show total
+"""
+
+WHILE_LOOP = """
+total is 0
+repeat 200 times
+    j is 0
+    while j less than 500
+        j is j + 1
+        total is total + j
+    done
+done
+show total
+"""
+
+RECURSION = """
+make fib(n)
+    when n less than 2 then
+        return n
+    done
+    return fib(n - 1) + fib(n - 2)
+done
+show fib(20)
+"""
+
+STRING_CONCATENATION = """
+line is ""
+count is 0
+repeat 20000 times
+    count is count + 1
+    word is "item " + text(count) + ", "
+    line is word + "done"
+done
+show line
+"""
+
+LIST_BUILDING = """
+numbers is []
+i is 0
+repeat 50000 times
+    i is i + 1
+    add i times 2 to numbers
+done
+total is 0
+repeat each n in numbers
+    total is total + n
+done
+show total
+"""
+
+THING_FIELDS = """
+total is 0
+i is 0
+repeat 30000 times
+    i is i + 1
+    point is {x: i, y: i + 1, label: "p"}
+    total is total + point.x + point.y
+done
+show total
+"""
+
+BRANCHING = """
+small is 0
+middle is 0
+large is 0
+i is 0
+repeat 50000 times
+    i is i + 1
+    when i % 3 is 0 then
+        small is small + 1
+    otherwise when i % 3 is 1 and i greater than 100 then
+        middle is middle + 1
+    otherwise
+        large is large + 1
+    done
+done
+show small
+show middle
+show large
+"""
+
+# Saved wherever JULES_DRAWING_FILE points, which the runner sets
+HEADLESS_DRAWING = """
+get drawing
+setup(400, 400, "svg")
+t is create_turtle()
+repeat 3000 times
+    move_forward(t, 3)
+    turn_right(t, 7)
+done
+repeat 50 times
+    draw_regular_polygon(t, 36, 5)
+    turn_right(t, 7)
+done
+done()
+show "drawn"
+"""
+
+
+def straight_line(assignments=3000):
+    """Assignments one after another, with no blocks at all"""
+    lines = ['v0 is 1']
+    for number in range(1, assignments):
+        lines.append(f"v{number} is v{number - 1} + 1")
+    lines.append(f"show v{assignments - 1}")
+    return '\n'.join(lines) + '\n'
+
+
+WORKLOADS = [
+    Workload('counted_loop', COUNTED_LOOP, FULL_LANGUAGE),
+    Workload('while_loop', WHILE_LOOP, FULL_LANGUAGE),
+    Workload('recursion', RECURSION, FULL_LANGUAGE),
+    Workload('string_concatenation', STRING_CONCATENATION, FULL_LANGUAGE),
+    Workload('list_building', LIST_BUILDING, FULL_LANGUAGE),
+    Workload('thing_fields', THING_FIELDS, FULL_LANGUAGE),
+    Workload('branching', BRANCHING, FULL_LANGUAGE),
+    Workload('headless_drawing', HEADLESS_DRAWING, FULL_LANGUAGE),
+    Workload('straight_line', straight_line(), FULL_LANGUAGE + ('run_simple.py',)),
+]
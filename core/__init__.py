@@ -1,3 +1,5 @@
 """
 Jules core package
-""" 
\ No newline at end of file
+"""
+
+__version__ = "0.1.0"
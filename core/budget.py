@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Jules Budgets
+
+Limits on how much one run of a program may do, so programs nobody has
+looked at can be run in bulk: how many statements it may run, how long it
+may take, how deeply its calls may nest and roughly how much memory it may
+add. Going over one raises BudgetExceeded, an error like any other in
+Jules: 'try' can catch it, but the next statement runs into the same limit.
+
+Each block that runs counts as a statement too: every pass of a loop, branch
+taken and call's body. So even a loop with nothing in it uses the budget up.
+
+The VM and translated Python don't see statements, so they charge each
+loop pass and call instead: a program uses less of a statement budget on
+them, but still can't loop forever.
+
+A budget costs next to nothing when there isn't one: only with one does
+the interpreter wrap its statement handlers and block runners to count,
+the VM charge its backward jumps and calls, and the transpiler write calls
+to _charge() into its translation. Time and memory are only looked at
+every CHECK_INTERVAL statements, so those limits can be overrun by that
+many statements. For memory that makes the limit approximate: one
+statement like '[0] times 1000000000' can allocate far more than it
+before the next look, so it doesn't protect the machine from a program
+set on using up its memory.
+"""
+
+import mmap
+import sys
+from time import perf_counter
+
+# Statements run between looks at the clock and the memory in use
+CHECK_INTERVAL = 1000
+
+MEGABYTE = 1024 * 1024
+
+
+class BudgetExceeded(Exception):
+    """A run used up part of its budget; kind is 'statements', 'time' or 'memory'"""
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class Budget:
+    """How much one run may do; None means no limit
+
+    statements  statements run, counting each block run too
+    seconds     wall-clock time from the start of the run
+    depth       calls inside each other
+    memory      bytes added to the process's memory in use
+    """
+    def __init__(self, statements=None, seconds=None, depth=None, memory=None):
+        self.statements = statements
+        self.seconds = seconds
+        self.depth = depth
+        self.memory = memory
+
+    def metered(self):
+        """Whether statements have to be counted to keep to this budget"""
+        return self.statements is not None or self.seconds is not None or self.memory is not None
+
+    def __repr__(self):
+        return (f"Budget(statements={self.statements!r}, seconds={self.seconds!r}, "
+                f"depth={self.depth!r}, memory={self.memory!r})")
+
+
+class Meter:
+    """Counts one run's statements against a Budget, looking at time and memory now and then"""
+    def __init__(self, budget, clock=perf_counter):
+        self.budget = budget
+        self.clock = clock
+        self.used = 0     # statements run, as of the last check
+        self.granted = 0  # statements allowed between the last check and the next
+        self.left = 0     # of those, how many haven't run yet
+        self.deadline = clock() + budget.seconds if budget.seconds is not None else None
+        self.baseline = memory_in_use() if budget.memory is not None else None
+        self.check()
+
+    def charge(self):
+        """Count one statement or block"""
+        self.left -= 1
+        if self.left < 0:
+            self.check()
+
+    def check(self):
+        """Raise BudgetExceeded if anything's used up, or allow some more statements"""
+        budget = self.budget
+        self.used += self.granted - self.left
+        # Until this check passes, every statement comes back here
+        self.granted = self.left = 0
+        if budget.statements is not None and self.used > budget.statements:
+            raise BudgetExceeded('statements', f"The program ran more than {budget.statements} statements")
+        if self.deadline is not None and self.clock() > self.deadline:
+            raise BudgetExceeded('time', f"The program ran out of time ({budget.seconds:g}s)")
+        if self.baseline is not None:
+            in_use = memory_in_use()
+            if in_use is not None and in_use - self.baseline > budget.memory:
+                raise BudgetExceeded('memory', f"The program used more than {budget.memory / MEGABYTE:g}MB")
+        granted = CHECK_INTERVAL
+        if budget.statements is not None:
+            granted = min(granted, budget.statements - self.used)
+        self.granted = self.left = granted
+
+
+def metered(handler, meter):
+    """A statement handler or block runner that charges the meter each time before it runs"""
+    def run(node):
+        meter.left -= 1
+        if meter.left < 0:
+            meter.check()
+        return handler(node)
+    return run
+
+
+def memory_in_use():
+    """Roughly how many bytes the process is using, or None where that can't be found out"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Only the peak is known here, which can only ever go up
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
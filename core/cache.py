@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Jules Program Cache
+
+Parsing is a large share of the run time of a short program, so run_file
+keeps what the front end made of a program in a .julesc file and reuses it
+on later runs. The files live in a cache directory of the user's own, one
+for each program and engine, named after the program and a hash of where
+it is:
+
+    hello-<hash>.tree.julesc      statements, for the interpreter
+    hello-<hash>.vm.julesc        compiled code, for --vm
+    hello-<hash>.python.julesc    the Python translation, for --python
+
+Loading a cache file can run any code in it, so the files aren't kept next
+to the program, where anyone who can write to its directory could leave
+one, and a file or directory someone else owns or could write to is never
+loaded. The directory is ~/.cache/jules (or under $XDG_CACHE_HOME),
+~/Library/Caches/jules on macOS and %LOCALAPPDATA%\\jules on Windows;
+JULES_CACHE_DIR chooses another.
+
+A cache file remembers a hash of the source and the Jules and Python
+versions it was made with. If any of them has changed, the file is ignored
+and made again. Without a cache directory Jules can write to, programs
+still run, just without a cache. Set JULES_CACHE=0 to turn the cache off.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+
+from . import __version__
+
+# The cache directory's own name, inside the platform's place for caches
+CACHE_DIRECTORY = 'jules'
+
+# Bump when the cached forms change shape without the Jules version changing
+CACHE_FORMAT = 3
+
+
+def cache_enabled():
+    """Whether run_file should use the cache, from the JULES_CACHE environment variable"""
+    return os.environ.get('JULES_CACHE', '1').lower() not in ('0', 'no', 'off', 'false')
+
+
+def cache_directory():
+    """The user's own directory for cache files"""
+    chosen = os.environ.get('JULES_CACHE_DIR')
+    if chosen:
+        return chosen
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(base, CACHE_DIRECTORY)
+
+
+def cache_path(filename, kind):
+    """Where the cached form of a program for one engine is kept"""
+    location = os.path.abspath(filename)
+    stem = os.path.splitext(os.path.basename(location))[0]
+    # Programs with the same name in different places get different files
+    place = hashlib.sha256(location.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+    return os.path.join(cache_directory(), f"{stem}-{place}.{kind}.julesc")
+
+
+def trusted(path):
+    """Whether only this user could have written path: they own it, and nobody else may write to it"""
+    if not hasattr(os, 'getuid'):
+        # Windows keeps a user's own application data to themselves
+        return True
+    try:
+        status = os.stat(path)
+    except OSError:
+        return False
+    return status.st_uid == os.getuid() and not status.st_mode & 0o022
+
+
+def source_key(source):
+    """What a cache file has to match: the source and everything that reads it"""
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    return (CACHE_FORMAT, __version__, sys.version_info[:2], digest)
+
+
+def cached(filename, source, kind, build):
+    """build(), or what it returned last time for the same source and versions
+
+    Syntax errors aren't cached; build() raises them again on every run.
+    """
+    if not cache_enabled():
+        return build()
+    path = cache_path(filename, kind)
+    key = source_key(source)
+    directory = os.path.dirname(path)
+    if not trusted(directory):
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        except OSError:
+            return build()
+        if not trusted(directory):
+            # Someone else could leave files in it, so nothing there can be loaded
+            return build()
+    try:
+        if trusted(path):
+            with open(path, 'rb') as file:
+                stored_key, product = pickle.load(file)
+            if stored_key == key:
+                return product
+    except Exception:
+        # Unreadable or from another version: make it again
+        pass
+    product = build()
+    store(path, key, product)
+    return product
+
+
+def store(path, key, product):
+    """Write a cache file, giving up quietly if it can't be written"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        # Readable and writable by this user only, whatever the umask
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'wb') as file:
+            pickle.dump((key, product), file, pickle.HIGHEST_PROTOCOL)
+        # Replacing in one step means a run never reads a half written file
+        os.replace(temporary, path)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
@@ -0,0 +1,132 @@
+"""
+Jules Command Line
+
+The options shared by the 'jules' command and 'python jules.py'.
+"""
+
+import argparse
+import sys
+
+from .tracing import LEVELS, make_tracer
+from .output import Output, FLUSH_POLICIES
+from .budget import CHECK_INTERVAL
+
+
+def build_parser():
+    """The argument parser for the jules command"""
+    parser = argparse.ArgumentParser(prog='jules', description='Run Jules programs',
+                                     epilog="'jules serve' runs programs sent over HTTP; see 'jules serve --help'")
+    parser.add_argument('file', nargs='?', help='the .jules program to run (interactive mode if left out)')
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument('--vm', action='store_true', help='run on the bytecode virtual machine')
+    engine.add_argument('--python', action='store_true', help='translate the program to Python and run that')
+    engine.add_argument('--emit-python', action='store_true', help='print the Python translation instead of running it')
+    parser.add_argument('--output', metavar='PATH', help="write what the program shows to a file")
+    parser.add_argument('--flush', choices=FLUSH_POLICIES,
+                        help="when shown output is written out (default: line on a terminal, else size)")
+    parser.add_argument('--recursion-limit', type=int, metavar='N',
+                        help='how deeply calls may nest before the program stops')
+    parser.add_argument('--max-statements', type=int, metavar='N',
+                        help='stop the program with an error after N statements; with --vm and --python '
+                             'only loop passes and calls are counted')
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS',
+                        help='stop the program with an error after this long')
+    parser.add_argument('--memory-limit', type=float, metavar='MB',
+                        help='stop the program with an error once it has added about this much memory; '
+                             f'only checked every {CHECK_INTERVAL} statements, so one statement can go far past it')
+    parser.add_argument('--no-cache', action='store_true',
+                        help="parse the program afresh instead of using the cache; also JULES_CACHE=0")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='run the program and report how long starting up took, import by import')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every line and call, and report the slowest to stderr at the end')
+    parser.add_argument('--profile-stacks', metavar='PATH',
+                        help='with --profile, also save time by call stack here, for flame graphs')
+    parser.add_argument('--stats', action='store_true',
+                        help='count the work the program does, and print the counts as JSON to stderr at the end')
+    parser.add_argument('--stats-file', metavar='PATH', help='write the --stats JSON to this file instead')
+    parser.add_argument('--trace', choices=list(LEVELS), metavar='LEVEL',
+                        help=f"trace the interpreter to stderr ({', '.join(LEVELS)}); also JULES_TRACE")
+    parser.add_argument('--trace-file', metavar='PATH',
+                        help='write trace events to this file instead; also JULES_TRACE_FILE')
+    return parser
+
+
+def main(argv=None):
+    """Run a program or start interactive mode, as the options ask"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        from .server import main as serve
+        sys.exit(serve(argv[1:]))
+    parser = build_parser()
+    options = parser.parse_args(argv)
+    tracing = options.trace is not None or options.trace_file is not None
+    if tracing and (options.vm or options.python or options.emit_python):
+        parser.error('--trace only works with the interpreter')
+    limits = (options.max_statements, options.time_limit, options.memory_limit)
+    budgeted = any(limit is not None for limit in limits)
+    if budgeted and (options.emit_python or not options.file):
+        parser.error('--max-statements, --time-limit and --memory-limit only work running a file')
+    profiling = options.profile or options.profile_stacks is not None
+    if profiling and (options.vm or options.python or options.emit_python or not options.file):
+        parser.error('--profile only works with the interpreter, running a file')
+    if profiling and tracing:
+        parser.error('--profile and --trace time the same code; use one at a time')
+    counting = options.stats or options.stats_file is not None
+    if counting and (options.vm or options.python or options.emit_python or not options.file):
+        parser.error('--stats only works with the interpreter, running a file')
+    if counting and (profiling or tracing):
+        parser.error('--stats counts with the same code --profile and --trace time; use one at a time')
+
+    if options.startup_profile:
+        if not options.file:
+            parser.error('--startup-profile needs a file to run')
+        from .startup import profile_startup
+        sys.exit(profile_startup([arg for arg in argv if arg != '--startup-profile']))
+
+    budget = None
+    if budgeted:
+        from .budget import Budget, MEGABYTE
+        memory = int(options.memory_limit * MEGABYTE) if options.memory_limit is not None else None
+        budget = Budget(options.max_statements, options.time_limit, memory=memory)
+
+    if options.output:
+        output = Output.to_file(options.output, options.flush or 'size')
+    else:
+        output = Output(flush=options.flush)
+
+    if not options.file:
+        for flag in ('vm', 'python', 'emit_python', 'output'):
+            if getattr(options, flag):
+                parser.error(f"--{flag.replace('_', '-')} needs a file to run")
+        from .interpreter import run_interactive
+        run_interactive(make_tracer(options.trace, options.trace_file))
+    elif options.vm:
+        from .vm import run_file
+        run_file(options.file, output, options.recursion_limit, not options.no_cache, budget)
+    elif options.python or options.emit_python:
+        from .transpiler import run_file
+        run_file(options.file, emit=options.emit_python, output=output, cache=not options.no_cache, budget=budget,
+                 recursion_limit=options.recursion_limit)
+    else:
+        from .interpreter import run_file
+        profiler = None
+        if profiling:
+            from .profiler import Profiler
+            profiler = Profiler(stacks_path=options.profile_stacks)
+        stats = None
+        if options.stats_file is not None:
+            stats = open(options.stats_file, 'w')
+        elif options.stats:
+            stats = sys.stderr
+        try:
+            run_file(options.file, make_tracer(options.trace, options.trace_file), output, options.recursion_limit,
+                     not options.no_cache, profiler, stats, budget)
+        finally:
+            if options.stats_file is not None:
+                stats.close()
+
+
+if __name__ == "__main__":
+    main()
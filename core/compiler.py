@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Jules Bytecode Compiler
+
+Translates a parsed Jules program into compact bytecode that the virtual
+machine in vm.py runs with a single dispatch loop.
+"""
+
+import operator
+
+from .parser import (
+    Show, Assign, When, RepeatTimes, RepeatEach, While, Ask,
+    FunctionDef, ProcedureDef, Import, Call, Return, Try, Stop, Skip,
+    AddItem, SetIndex, SetField, RemoveItem
+)
+from .expressions import (
+    parse_expression, Literal, Name, BinaryOp, And, Or, Not, Negate,
+    CallExpr, Index, Field, ListExpr, ThingExpr
+)
+from .runtime import BINARY_OPERATIONS, FieldSite
+from .symbols import CallSite
+
+# Opcodes, roughly ordered by how often programs run them
+LOAD_FAST = 0          # push local slot (falls back to the global of that name)
+LOAD_GLOBAL = 1        # push global variable by name
+LOAD_CONST = 2         # push constant
+STORE_FAST = 3         # pop into local slot
+STORE_GLOBAL = 4       # pop into global variable
+BINARY_ADD = 5         # '+' with text joining
+COMPARE_LT = 6
+COMPARE_GT = 7
+COMPARE_EQ = 8
+COMPARE_LE = 9
+COMPARE_GE = 10
+BINARY_SUB = 11
+BINARY_OP = 12         # any other binary operator, argument is the function
+POP_JUMP_IF_FALSE = 13
+JUMP = 14
+FOR_ITER = 15          # push next item of the iterator on top, or pop it and jump
+CALL = 16              # argument is (CallSite, argument count)
+RETURN_VALUE = 17
+POP_TOP = 18
+SHOW = 19
+JUMP_IF_FALSE_OR_POP = 20
+JUMP_IF_TRUE_OR_POP = 21
+UNARY_NOT = 22
+UNARY_NEG = 23
+INDEX = 24
+FIELD = 25             # argument is a FieldSite remembering the shape it last saw
+BUILD_LIST = 26
+BUILD_THING = 27       # argument is the tuple of field names
+GET_RANGE_ITER = 28    # pop a count, push an iterator over 1..count
+GET_ITER = 29
+SAVE_FAST = 30         # push the current value of a local (or UNSET)
+RESTORE_FAST = 31      # pop a saved value back into a local
+SAVE_GLOBAL = 32
+RESTORE_GLOBAL = 33
+ASK = 34
+SETUP_TRY = 35         # register a catch handler at the argument
+POP_TRY = 36
+MAKE_FUNCTION = 37
+MAKE_PROCEDURE = 38
+IMPORT = 39
+ADD_ITEM = 40          # pop a value and append it to the list below it
+SET_INDEX = 41         # pop a value, then a position, and store into the container below
+SET_FIELD = 42         # pop a value and store it in the thing below; argument is the field
+REMOVE_ITEM = 43       # pop a value and remove it from the list or thing below
+
+OPCODE_NAMES = {value: name for name, value in list(globals().items())
+                if name.isupper() and isinstance(value, int)}
+
+COMPARE_OPCODES = {
+    'is': COMPARE_EQ,
+    'less than': COMPARE_LT,
+    'greater than': COMPARE_GT,
+    'less than or equal to': COMPARE_LE,
+    'greater than or equal to': COMPARE_GE,
+}
+
+SIMPLE_OPERATIONS = {
+    'is not': operator.ne,
+}
+
+
+class CodeObject:
+    """Compiled bytecode for a program, function or procedure"""
+    def __init__(self, name, params=(), local_names=None, procedure=False, pure=False, callees=()):
+        self.name = name
+        self.params = list(params)
+        self.procedure = procedure
+        # Made with 'make pure', so its results can be remembered
+        self.pure = pure
+        self.callees = callees
+        self.instructions = []  # (opcode, argument) pairs
+        self.lines = []  # source line of each instruction
+        # (first pc, restore pc, stack slot) of each repeat loop, inner loops first,
+        # so an error leaving a loop can put its variable back
+        self.loop_restores = []
+        # None for the top level, where every variable is global
+        self.local_names = local_names
+
+    def __repr__(self):
+        return f"<code {self.name}, {len(self.instructions)} instructions>"
+
+
+def find_local_names(params, body):
+    """List the variables a function body assigns, parameters first"""
+    names = list(params)
+
+    def add(name):
+        if name not in names:
+            names.append(name)
+
+    def visit(statements):
+        for statement in statements:
+            if isinstance(statement, Assign):
+                add(statement.target)
+            elif isinstance(statement, Ask):
+                add(statement.var_name)
+            elif isinstance(statement, Call) and statement.into:
+                add(statement.into)
+            elif isinstance(statement, RepeatTimes):
+                add('count')
+                visit(statement.body)
+            elif isinstance(statement, RepeatEach):
+                add(statement.item_name)
+                visit(statement.body)
+            elif isinstance(statement, While):
+                visit(statement.body)
+            elif isinstance(statement, When):
+                for _, branch in statement.branches:
+                    visit(branch)
+                if statement.otherwise is not None:
+                    visit(statement.otherwise)
+            elif isinstance(statement, Try):
+                visit(statement.body)
+                if statement.catch_body is not None:
+                    add('error')
+                    visit(statement.catch_body)
+
+    visit(body)
+    return names
+
+
+class Loop:
+    """Bookkeeping for the loop being compiled, used by stop and skip"""
+    def __init__(self, try_depth):
+        self.try_depth = try_depth
+        self.stop_jumps = []
+        self.skip_jumps = []
+
+
+class Compiler:
+    """Compiles one body of statements into a CodeObject"""
+    def __init__(self, code):
+        self.code = code
+        self.slots = None
+        if code.local_names is not None:
+            self.slots = {name: slot for slot, name in enumerate(code.local_names)}
+        self.loops = []
+        self.try_depth = 0
+        # Values statements leave on the stack: a saved variable and an iterator per repeat loop
+        self.stack_depth = 0
+        self.line = 0
+        self._statement_compilers = {
+            Show: self._compile_show,
+            Assign: self._compile_assign,
+            When: self._compile_when,
+            RepeatTimes: self._compile_repeat_times,
+            RepeatEach: self._compile_repeat_each,
+            While: self._compile_while,
+            Ask: self._compile_ask,
+            FunctionDef: self._compile_definition,
+            ProcedureDef: self._compile_definition,
+            Import: self._compile_import,
+            Call: self._compile_call_statement,
+            Return: self._compile_return,
+            Try: self._compile_try,
+            Stop: self._compile_stop,
+            Skip: self._compile_skip,
+            AddItem: self._compile_add_item,
+            SetIndex: self._compile_set_index,
+            SetField: self._compile_set_field,
+            RemoveItem: self._compile_remove_item,
+        }
+        self._expression_compilers = {
+            Literal: self._compile_literal,
+            Name: self._compile_name,
+            BinaryOp: self._compile_binary,
+            And: self._compile_and,
+            Or: self._compile_or,
+            Not: self._compile_not,
+            Negate: self._compile_negate,
+            CallExpr: self._compile_call,
+            Index: self._compile_index,
+            Field: self._compile_field,
+            ListExpr: self._compile_list,
+            ThingExpr: self._compile_thing,
+        }
+
+    def compile_body(self, statements):
+        """Compile statements and finish with an implicit 'return'"""
+        self._compile_block(statements)
+        self._emit(LOAD_CONST, None)
+        self._emit(RETURN_VALUE)
+        return self.code
+
+    # -- helpers ---------------------------------------------------------
+
+    def _emit(self, opcode, argument=None):
+        self.code.instructions.append((opcode, argument))
+        self.code.lines.append(self.line)
+        return len(self.code.instructions) - 1
+
+    def _here(self):
+        return len(self.code.instructions)
+
+    def _patch(self, index, target=None):
+        """Point the jump at index to target (default: the next instruction)"""
+        opcode, _ = self.code.instructions[index]
+        self.code.instructions[index] = (opcode, self._here() if target is None else target)
+
+    def _store(self, name):
+        if self.slots is not None and name in self.slots:
+            self._emit(STORE_FAST, self.slots[name])
+        else:
+            self._emit(STORE_GLOBAL, name)
+
+    def _save(self, name):
+        if self.slots is not None and name in self.slots:
+            self._emit(SAVE_FAST, self.slots[name])
+        else:
+            self._emit(SAVE_GLOBAL, name)
+
+    def _restore(self, name):
+        if self.slots is not None and name in self.slots:
+            return self._emit(RESTORE_FAST, self.slots[name])
+        return self._emit(RESTORE_GLOBAL, name)
+
+    # -- statements ------------------------------------------------------
+
+    def _compile_block(self, statements):
+        for statement in statements:
+            self.line = statement.line
+            self._statement_compilers[type(statement)](statement)
+
+    def _compile_show(self, statement):
+        self._compile_source(statement.expr)
+        self._emit(SHOW)
+
+    def _compile_assign(self, statement):
+        self._compile_source(statement.expr)
+        self._store(statement.target)
+
+    def _compile_add_item(self, statement):
+        self._compile_source(statement.target)
+        self._compile_source(statement.expr)
+        self._emit(ADD_ITEM)
+
+    def _compile_set_index(self, statement):
+        self._compile_source(statement.target)
+        self._compile_source(statement.index)
+        self._compile_source(statement.expr)
+        self._emit(SET_INDEX)
+
+    def _compile_set_field(self, statement):
+        self._compile_source(statement.target)
+        self._compile_source(statement.expr)
+        self._emit(SET_FIELD, statement.field)
+
+    def _compile_remove_item(self, statement):
+        self._compile_source(statement.target)
+        self._compile_source(statement.expr)
+        self._emit(REMOVE_ITEM)
+
+    def _compile_when(self, statement):
+        end_jumps = []
+        for condition, body in statement.branches:
+            self._compile_source(condition)
+            next_branch = self._emit(POP_JUMP_IF_FALSE)
+            self._compile_block(body)
+            end_jumps.append(self._emit(JUMP))
+            self._patch(next_branch)
+        if statement.otherwise is not None:
+            self._compile_block(statement.otherwise)
+        for jump in end_jumps:
+            self._patch(jump)
+
+    def _compile_for_loop(self, item_name, body):
+        """Loop over the iterator on top of the stack, saved value below it"""
+        loop = Loop(self.try_depth)
+        self.loops.append(loop)
+        first = self._here()
+        top = self._emit(FOR_ITER)
+        self._store(item_name)
+        self.stack_depth += 2
+        self._compile_block(body)
+        self.stack_depth -= 2
+        self._emit(JUMP, top)
+        self.loops.pop()
+
+        # 'stop' lands here with the iterator still on the stack
+        stop_target = self._emit(POP_TOP)
+        self._patch(top)
+        self.code.loop_restores.append((first, self._restore(item_name), self.stack_depth))
+        for jump in loop.stop_jumps:
+            self._patch(jump, stop_target)
+        for jump in loop.skip_jumps:
+            self._patch(jump, top)
+
+    def _compile_repeat_times(self, statement):
+        self._save('count')
+        self._compile_source(statement.count_expr)
+        self._emit(GET_RANGE_ITER)
+        self._compile_for_loop('count', statement.body)
+
+    def _compile_repeat_each(self, statement):
+        self._save(statement.item_name)
+        self._compile_source(statement.list_expr)
+        self._emit(GET_ITER)
+        self._compile_for_loop(statement.item_name, statement.body)
+
+    def _compile_while(self, statement):
+        loop = Loop(self.try_depth)
+        self.loops.append(loop)
+        top = self._here()
+        self._compile_source(statement.condition)
+        exit_jump = self._emit(POP_JUMP_IF_FALSE)
+        self._compile_block(statement.body)
+        self._emit(JUMP, top)
+        self.loops.pop()
+
+        self._patch(exit_jump)
+        for jump in loop.stop_jumps:
+            self._patch(jump)
+        for jump in loop.skip_jumps:
+            self._patch(jump, top)
+
+    def _compile_ask(self, statement):
+        self._emit(ASK, statement.prompt)
+        self._store(statement.var_name)
+
+    def _compile_definition(self, statement):
+        local_names = find_local_names(statement.params, statement.body)
+        if isinstance(statement, FunctionDef):
+            code = CodeObject(statement.name, statement.params, local_names,
+                              pure=statement.pure, callees=statement.callees)
+        else:
+            code = CodeObject(statement.name, statement.params, local_names, procedure=True)
+        Compiler(code).compile_body(statement.body)
+        self._emit(MAKE_FUNCTION if isinstance(statement, FunctionDef) else MAKE_PROCEDURE, code)
+
+    def _compile_import(self, statement):
+        self._emit(IMPORT, statement.lib_name)
+
+    def _compile_call_statement(self, statement):
+        for arg in statement.args:
+            self._compile_source(arg)
+        self._emit(CALL, (CallSite(statement.name), len(statement.args)))
+        if statement.into:
+            self._store(statement.into)
+        else:
+            self._emit(POP_TOP)
+
+    def _compile_return(self, statement):
+        if statement.expr is None:
+            self._emit(LOAD_CONST, None)
+        else:
+            self._compile_source(statement.expr)
+            if self.code.procedure:
+                # Procedures work out the value but never hand it back
+                self._emit(POP_TOP)
+                self._emit(LOAD_CONST, None)
+        self._emit(RETURN_VALUE)
+
+    def _compile_try(self, statement):
+        if statement.catch_body is None:
+            self._compile_block(statement.body)
+            return
+        setup = self._emit(SETUP_TRY)
+        self.try_depth += 1
+        self._compile_block(statement.body)
+        self.try_depth -= 1
+        self._emit(POP_TRY)
+        end_jump = self._emit(JUMP)
+        # The virtual machine pushes the error message before jumping here
+        self._patch(setup)
+        self._store('error')
+        self._compile_block(statement.catch_body)
+        self._patch(end_jump)
+
+    def _leave_loop(self, jumps):
+        """Jump out of the innermost loop, or out of the body if there is none"""
+        if not self.loops:
+            self._emit(LOAD_CONST, None)
+            self._emit(RETURN_VALUE)
+            return
+        loop = self.loops[-1]
+        for _ in range(self.try_depth - loop.try_depth):
+            self._emit(POP_TRY)
+        getattr(loop, jumps).append(self._emit(JUMP))
+
+    def _compile_stop(self, statement):
+        self._leave_loop('stop_jumps')
+
+    def _compile_skip(self, statement):
+        self._leave_loop('skip_jumps')
+
+    # -- expressions -----------------------------------------------------
+
+    def _compile_source(self, text):
+        self._compile_expression(parse_expression(text))
+
+    def _compile_expression(self, node):
+        self._expression_compilers[type(node)](node)
+
+    def _compile_literal(self, node):
+        self._emit(LOAD_CONST, node.value)
+
+    def _compile_name(self, node):
+        if self.slots is not None and node.name in self.slots:
+            self._emit(LOAD_FAST, self.slots[node.name])
+        else:
+            self._emit(LOAD_GLOBAL, node.name)
+
+    def _compile_binary(self, node):
+        self._compile_expression(node.left)
+        self._compile_expression(node.right)
+        if node.op == '+':
+            self._emit(BINARY_ADD)
+        elif node.op == '-':
+            self._emit(BINARY_SUB)
+        elif node.op in COMPARE_OPCODES:
+            self._emit(COMPARE_OPCODES[node.op])
+        else:
+            self._emit(BINARY_OP, SIMPLE_OPERATIONS.get(node.op, BINARY_OPERATIONS[node.op]))
+
+    def _compile_and(self, node):
+        self._compile_expression(node.left)
+        jump = self._emit(JUMP_IF_FALSE_OR_POP)
+        self._compile_expression(node.right)
+        self._patch(jump)
+
+    def _compile_or(self, node):
+        self._compile_expression(node.left)
+        jump = self._emit(JUMP_IF_TRUE_OR_POP)
+        self._compile_expression(node.right)
+        self._patch(jump)
+
+    def _compile_not(self, node):
+        self._compile_expression(node.operand)
+        self._emit(UNARY_NOT)
+
+    def _compile_negate(self, node):
+        self._compile_expression(node.operand)
+        self._emit(UNARY_NEG)
+
+    def _compile_call(self, node):
+        for arg in node.args:
+            self._compile_expression(arg)
+        self._emit(CALL, (CallSite(node.name), len(node.args)))
+
+    def _compile_index(self, node):
+        self._compile_expression(node.target)
+        self._compile_expression(node.index)
+        self._emit(INDEX)
+
+    def _compile_field(self, node):
+        self._compile_expression(node.target)
+        self._emit(FIELD, FieldSite(node.field))
+
+    def _compile_list(self, node):
+        for item in node.items:
+            self._compile_expression(item)
+        self._emit(BUILD_LIST, len(node.items))
+
+    def _compile_thing(self, node):
+        for _, value in node.pairs:
+            self._compile_expression(value)
+        self._emit(BUILD_THING, tuple(key for key, _ in node.pairs))
+
+
+def compile_program(statements):
+    """Compile a parsed program into a CodeObject for the virtual machine"""
+    return Compiler(CodeObject('<program>')).compile_body(statements)
+
+
+def disassemble(code, indent=''):
+    """Return a readable listing of a CodeObject and the functions inside it"""
+    output = [f"{indent}{code.name}({', '.join(code.params)}):"]
+    nested = []
+    for index, (opcode, argument) in enumerate(code.instructions):
+        name = OPCODE_NAMES[opcode]
+        if opcode in (LOAD_FAST, STORE_FAST, SAVE_FAST, RESTORE_FAST):
+            shown = f"{argument} ({code.local_names[argument]})"
+        elif opcode in (MAKE_FUNCTION, MAKE_PROCEDURE):
+            shown = argument.name
+            nested.append(argument)
+        elif opcode == BINARY_OP:
+            shown = getattr(argument, '__name__', argument)
+        elif opcode == CALL:
+            shown = f"{argument[0].name} ({argument[1]} arguments)"
+        else:
+            shown = '' if argument is None and opcode != LOAD_CONST else repr(argument)
+        output.append(f"{indent}  {code.lines[index]:>4} {index:>5} {name:<22}{shown}")
+    for inner in nested:
+        output.append(disassemble(inner, indent + '  '))
+    return '\n'.join(output)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Jules Counters
+
+How much work a program did: statements run, expressions and conditions
+evaluated, calls made, loop passes and how deeply calls nested. Unlike
+timings these come out the same on every run with the same input, so a
+script that starts doing more work shows up even on a busy machine.
+
+Counting is switched on with 'jules --stats', which prints
+interpreter.stats() as JSON when the program ends. Like tracing, it costs
+nothing when off: the interpreter swaps in its counting code paths only
+when given Counters.
+"""
+
+from collections import Counter
+
+from .parser import RepeatTimes, RepeatEach, While, child_bodies
+
+
+class Counters:
+    """Running totals kept by an interpreter that counts"""
+    def __init__(self):
+        self.statements = 0
+        self.expressions = 0
+        self.conditions = 0
+        self.function_calls = 0
+        self.procedure_calls = 0
+        self.library_calls = Counter()  # by function name
+        self.builtin_calls = Counter()
+        self.loop_iterations = 0
+        self.depth = 0
+        self.peak_depth = 0
+        # Loop bodies by id, so running one can count as a pass of its loop
+        self.loop_bodies = {}
+
+    def find_loops(self, statements):
+        """Note every loop body in a statement tree"""
+        for statement in statements:
+            if isinstance(statement, (RepeatTimes, RepeatEach, While)):
+                self.loop_bodies[id(statement.body)] = statement.body
+            for body in child_bodies(statement):
+                self.find_loops(body)
+
+    def as_dict(self):
+        return {
+            'statements': self.statements,
+            'expressions': self.expressions,
+            'conditions': self.conditions,
+            'function_calls': self.function_calls,
+            'procedure_calls': self.procedure_calls,
+            'library_calls': dict(sorted(self.library_calls.items())),
+            'builtin_calls': dict(sorted(self.builtin_calls.items())),
+            'loop_iterations': self.loop_iterations,
+            'peak_depth': self.peak_depth,
+        }
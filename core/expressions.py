@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+Jules Expressions
+
+Turns the text of a Jules expression or condition into a small tree of
+nodes. The bytecode compiler translates these trees, and the interpreter
+compiles them into plain Python functions that it keeps in a cache, so
+both engines agree on what an expression means.
+"""
+
+import re
+from collections import OrderedDict, namedtuple
+
+from .parser import JulesSyntaxError
+from .runtime import (
+    BINARY_OPERATIONS, PACKED_LIST_MIN_LENGTH, Thing, FieldSite, add, multiply, get_index, build_thing, pack
+)
+from .symbols import CallSite, NATIVE
+
+
+class Expression:
+    """Base class for every expression node"""
+    def __repr__(self):
+        fields = ', '.join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"{type(self).__name__}({fields})"
+
+
+class Literal(Expression):
+    """A number, text or yes/no written in the code"""
+    def __init__(self, value):
+        self.value = value
+
+
+class Name(Expression):
+    """A variable name"""
+    def __init__(self, name):
+        self.name = name
+
+
+class BinaryOp(Expression):
+    """Arithmetic or comparison between two values"""
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class And(Expression):
+    """<left> and <right>"""
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+
+class Or(Expression):
+    """<left> or <right>"""
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+
+class Not(Expression):
+    """not <operand>"""
+    def __init__(self, operand):
+        self.operand = operand
+
+
+class Negate(Expression):
+    """-<operand>"""
+    def __init__(self, operand):
+        self.operand = operand
+
+
+class CallExpr(Expression):
+    """<name>(<args>)"""
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class Index(Expression):
+    """<target>[<index>]"""
+    def __init__(self, target, index):
+        self.target = target
+        self.index = index
+
+
+class Field(Expression):
+    """<target>.<field>"""
+    def __init__(self, target, field):
+        self.target = target
+        self.field = field
+
+
+class ListExpr(Expression):
+    """[<item>, <item>, ...]"""
+    def __init__(self, items):
+        self.items = items
+
+
+class ThingExpr(Expression):
+    """{<key>: <value>, ...}"""
+    def __init__(self, pairs):
+        self.pairs = pairs  # list of (key, value expression)
+
+
+# Operators spelled with symbols, mapped to their Jules word
+SYMBOL_OPERATORS = {
+    '*': 'times',
+    '/': 'divided by',
+    '>': 'greater than',
+    '<': 'less than',
+    '>=': 'greater than or equal to',
+    '<=': 'less than or equal to',
+    '==': 'is',
+    '!=': 'is not',
+}
+
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<number>\d+\.\d*|\.\d+|\d+)
+      | (?P<text>"[^"]*")
+      | (?P<word>[A-Za-z_]\w*)
+      | (?P<symbol>>=|<=|==|!=|[-+*/%()\[\]{},:.<>])
+    )
+''', re.VERBOSE)
+
+
+def tokenize(text):
+    """Split expression text into (kind, value) tokens"""
+    tokens = []
+    position = 0
+    length = len(text.rstrip())
+    while position < length:
+        match = TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise JulesSyntaxError(f"I don't understand '{text[position:].strip()}' in '{text}'")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class ExpressionParser:
+    """Recursive descent parser for one expression"""
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def parse(self):
+        """Parse the whole text as a single expression"""
+        if not self.tokens:
+            raise JulesSyntaxError("Expected a value but found nothing")
+        node = self._parse_or()
+        if self.position < len(self.tokens):
+            raise JulesSyntaxError(f"I don't understand '{self.tokens[self.position][1]}' in '{self.text}'")
+        return node
+
+    def _peek(self, offset=0):
+        index = self.position + offset
+        if index < len(self.tokens):
+            return self.tokens[index][1]
+        return None
+
+    def _peek_words(self, *words):
+        """Check whether the next tokens spell out the given words"""
+        return all(self._peek(offset) == word for offset, word in enumerate(words))
+
+    def _advance(self, count=1):
+        token = self.tokens[self.position]
+        self.position += count
+        return token
+
+    def _expect(self, value):
+        if self._peek() != value:
+            found = self._peek()
+            raise JulesSyntaxError(f"Expected '{value}' but found '{found}' in '{self.text}'"
+                                   if found is not None else f"Expected '{value}' at the end of '{self.text}'")
+        self._advance()
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() == 'or':
+            self._advance()
+            node = Or(node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() == 'and':
+            self._advance()
+            node = And(node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        if self._peek() == 'not':
+            self._advance()
+            return Not(self._parse_not())
+        return self._parse_comparison()
+
+    def _comparison_operator(self):
+        """Read a comparison operator if one comes next"""
+        if self._peek_words('is', 'not'):
+            self._advance(2)
+            return 'is not'
+        if self._peek() == 'is':
+            self._advance()
+            return 'is'
+        if self._peek() == 'contains':
+            self._advance()
+            return 'contains'
+        for word in ('greater', 'less'):
+            if self._peek_words(word, 'than', 'or', 'equal', 'to'):
+                self._advance(5)
+                return f"{word} than or equal to"
+            if self._peek_words(word, 'than'):
+                self._advance(2)
+                return f"{word} than"
+        symbol = self._peek()
+        if symbol in ('>', '<', '>=', '<=', '==', '!='):
+            self._advance()
+            return SYMBOL_OPERATORS[symbol]
+        return None
+
+    def _parse_comparison(self):
+        node = self._parse_additive()
+        op = self._comparison_operator()
+        if op is not None:
+            node = BinaryOp(op, node, self._parse_additive())
+        return node
+
+    def _parse_additive(self):
+        node = self._parse_term()
+        while self._peek() in ('+', '-'):
+            op = self._advance()[1]
+            node = BinaryOp(op, node, self._parse_term())
+        return node
+
+    def _term_operator(self):
+        """Read a multiplication/division operator if one comes next"""
+        word = self._peek()
+        if word in ('times', '*'):
+            self._advance()
+            return 'times'
+        if self._peek_words('divided', 'by'):
+            self._advance(2)
+            return 'divided by'
+        if word == '/':
+            self._advance()
+            return 'divided by'
+        if word == '%':
+            self._advance()
+            return '%'
+        return None
+
+    def _parse_term(self):
+        node = self._parse_unary()
+        op = self._term_operator()
+        while op is not None:
+            node = BinaryOp(op, node, self._parse_unary())
+            op = self._term_operator()
+        return node
+
+    def _parse_unary(self):
+        if self._peek() == '-':
+            self._advance()
+            operand = self._parse_unary()
+            if isinstance(operand, Literal) and isinstance(operand.value, (int, float)) \
+                    and not isinstance(operand.value, bool):
+                return Literal(-operand.value)
+            return Negate(operand)
+        return self._parse_postfix()
+
+    def _parse_postfix(self):
+        node = self._parse_primary()
+        while True:
+            symbol = self._peek()
+            if symbol == '(' and isinstance(node, Name):
+                self._advance()
+                node = CallExpr(node.name, self._parse_items(')'))
+            elif symbol == '[':
+                self._advance()
+                index = self._parse_or()
+                self._expect(']')
+                node = Index(node, index)
+            elif symbol == '.':
+                self._advance()
+                kind, field = self._advance()
+                if kind != 'word':
+                    raise JulesSyntaxError(f"Expected a field name after '.' in '{self.text}'")
+                node = Field(node, field)
+            else:
+                return node
+
+    def _parse_items(self, closer):
+        """Parse comma separated expressions up to the closing bracket"""
+        items = []
+        if self._peek() == closer:
+            self._advance()
+            return items
+        while True:
+            items.append(self._parse_or())
+            if self._peek() == ',':
+                self._advance()
+                continue
+            self._expect(closer)
+            return items
+
+    def _parse_primary(self):
+        if self.position >= len(self.tokens):
+            raise JulesSyntaxError(f"Expected a value at the end of '{self.text}'")
+        kind, value = self._advance()
+        if kind == 'number':
+            return Literal(float(value) if '.' in value else int(value))
+        if kind == 'text':
+            return Literal(value[1:-1])
+        if kind == 'word':
+            if value == 'yes':
+                return Literal(True)
+            if value == 'no':
+                return Literal(False)
+            return Name(value)
+        if value == '(':
+            node = self._parse_or()
+            self._expect(')')
+            return node
+        if value == '[':
+            return ListExpr(self._parse_items(']'))
+        if value == '{':
+            return self._parse_thing()
+        raise JulesSyntaxError(f"I don't understand '{value}' in '{self.text}'")
+
+    def _parse_thing(self):
+        pairs = []
+        if self._peek() == '}':
+            self._advance()
+            return ThingExpr(pairs)
+        while True:
+            kind, key = self._advance()
+            if kind == 'text':
+                key = key[1:-1]
+            elif kind != 'word':
+                raise JulesSyntaxError(f"Expected a field name in '{self.text}'")
+            self._expect(':')
+            pairs.append((key, self._parse_or()))
+            if self._peek() == ',':
+                self._advance()
+                continue
+            self._expect('}')
+            return ThingExpr(pairs)
+
+
+def parse_expression(text):
+    """Parse the text of an expression or condition into a node tree"""
+    return ExpressionParser(text).parse()
+
+
+# How many compiled expressions an interpreter keeps by default
+EXPRESSION_CACHE_SIZE = 1024
+
+# Marks a local slot that hasn't been given a value yet in the current call
+UNSET = object()
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class Scope:
+    """The local variables of one function, each given a slot number"""
+    def __init__(self, local_names):
+        self.local_names = list(local_names)
+        self.slots = {name: slot for slot, name in enumerate(self.local_names)}
+
+    def __repr__(self):
+        return f"Scope({self.local_names!r})"
+
+
+def _compile_binary(node, scope):
+    """Build an evaluator for arithmetic and comparisons"""
+    op = node.op
+    left = compile_node(node.left, scope)
+    if isinstance(node.right, Literal):
+        # Very common case like 'i + 1' or 'n less than 2'
+        constant = node.right.value
+        if op == '+':
+            if isinstance(constant, str):
+                return lambda interpreter: str(left(interpreter)) + constant
+            return lambda interpreter: add(left(interpreter), constant)
+        if op == '-':
+            return lambda interpreter: left(interpreter) - constant
+        if op == 'is':
+            return lambda interpreter: left(interpreter) == constant
+        if op == 'less than':
+            return lambda interpreter: left(interpreter) < constant
+        if op == 'greater than':
+            return lambda interpreter: left(interpreter) > constant
+        operation = BINARY_OPERATIONS[op]
+        return lambda interpreter: operation(left(interpreter), constant)
+
+    right = compile_node(node.right, scope)
+    if op == '+':
+        return lambda interpreter: add(left(interpreter), right(interpreter))
+    if op == '-':
+        return lambda interpreter: left(interpreter) - right(interpreter)
+    if op == 'times':
+        return lambda interpreter: multiply(left(interpreter), right(interpreter))
+    operation = BINARY_OPERATIONS[op]
+    return lambda interpreter: operation(left(interpreter), right(interpreter))
+
+
+def compile_node(node, scope=None):
+    """Turn an expression node into a function of the interpreter
+
+    Inside a function, scope gives each local variable a slot in the
+    interpreter's current frame, so names are looked up once, here.
+    """
+    kind = type(node)
+
+    if kind is Literal:
+        value = node.value
+        return lambda interpreter: value
+
+    if kind is Name:
+        name = node.name
+        if scope is not None and name in scope.slots:
+            slot = scope.slots[name]
+            def load_local(interpreter):
+                value = interpreter.frame.values[slot]
+                if value is UNSET:
+                    # Not assigned yet in this call, so fall back to the top level
+                    return interpreter.variables.get(name, name)
+                return value
+            return load_local
+        # A name that isn't a variable stands for itself, as text
+        return lambda interpreter: interpreter.variables.get(name, name)
+
+    if kind is BinaryOp:
+        return _compile_binary(node, scope)
+
+    if kind is And:
+        left, right = compile_node(node.left, scope), compile_node(node.right, scope)
+        return lambda interpreter: left(interpreter) and right(interpreter)
+
+    if kind is Or:
+        left, right = compile_node(node.left, scope), compile_node(node.right, scope)
+        return lambda interpreter: left(interpreter) or right(interpreter)
+
+    if kind is Not:
+        operand = compile_node(node.operand, scope)
+        return lambda interpreter: not operand(interpreter)
+
+    if kind is Negate:
+        operand = compile_node(node.operand, scope)
+        return lambda interpreter: -operand(interpreter)
+
+    if kind is CallExpr:
+        site = CallSite(node.name)
+        args = [compile_node(arg, scope) for arg in node.args]
+        return lambda interpreter: interpreter._call_site(site, [arg(interpreter) for arg in args])
+
+    if kind is Index:
+        target, index = compile_node(node.target, scope), compile_node(node.index, scope)
+        return lambda interpreter: get_index(target(interpreter), index(interpreter))
+
+    if kind is Field:
+        target, site = compile_node(node.target, scope), FieldSite(node.field)
+        def field_of(interpreter):
+            container = target(interpreter)
+            if type(container) is Thing and container.shape is site.shape:
+                return container.slots[site.offset]
+            return site.read(container)
+        return field_of
+
+    if kind is ListExpr:
+        items = [compile_node(item, scope) for item in node.items]
+        if len(items) >= PACKED_LIST_MIN_LENGTH:
+            return lambda interpreter: pack([item(interpreter) for item in items])
+        return lambda interpreter: [item(interpreter) for item in items]
+
+    if kind is ThingExpr:
+        keys = tuple(key for key, _ in node.pairs)
+        values = [compile_node(value, scope) for _, value in node.pairs]
+        return lambda interpreter: build_thing(keys, [value(interpreter) for value in values])
+
+    raise TypeError(f"Can't compile {node!r}")
+
+
+def calls_function(node):
+    """Whether evaluating an expression tree calls anything"""
+    kind = type(node)
+    if kind is CallExpr:
+        return True
+    if kind in (Literal, Name):
+        return False
+    if kind in (BinaryOp, And, Or):
+        return calls_function(node.left) or calls_function(node.right)
+    if kind in (Not, Negate):
+        return calls_function(node.operand)
+    if kind is Index:
+        return calls_function(node.target) or calls_function(node.index)
+    if kind is Field:
+        return calls_function(node.target)
+    if kind is ListExpr:
+        return any(calls_function(item) for item in node.items)
+    if kind is ThingExpr:
+        return any(calls_function(value) for _, value in node.pairs)
+    return True
+
+
+def text_calls_function(text):
+    """Whether expression text contains a call, judged from its tokens alone"""
+    try:
+        tokens = tokenize(text)
+    except JulesSyntaxError:
+        # It can't run at all, so the error will come from evaluating it
+        return False
+    return any(kind == 'word' and following == ('symbol', '(')
+               for (kind, _), following in zip(tokens, tokens[1:]))
+
+
+def _compile_part(node, scope):
+    """(suspends, evaluator) for one operand of a suspending expression"""
+    if calls_function(node):
+        return True, compile_suspending(node, scope)
+    return False, compile_node(node, scope)
+
+
+def compile_suspending(node, scope=None):
+    """Generator version of compile_node, for expressions that call something
+
+    Calls to Jules functions and procedures are not run here. The generator
+    yields (entry, name, args) to the interpreter's executor and is sent back
+    the result, so a recursive Jules function never deepens Python's stack.
+    """
+    kind = type(node)
+
+    if kind is CallExpr:
+        site = CallSite(node.name)
+        parts = [_compile_part(arg, scope) for arg in node.args]
+        def call(interpreter):
+            args = []
+            for suspends, evaluate in parts:
+                args.append((yield from evaluate(interpreter)) if suspends else evaluate(interpreter))
+            entry = site.resolve(interpreter.symbols)
+            if entry is not None and entry[0] is not NATIVE:
+                return (yield entry, site.name, args)
+            return interpreter._invoke(entry, site.name, args)
+        return call
+
+    if kind is BinaryOp:
+        operation = BINARY_OPERATIONS[node.op]
+        left_suspends, left = _compile_part(node.left, scope)
+        right_suspends, right = _compile_part(node.right, scope)
+        def binary(interpreter):
+            left_value = (yield from left(interpreter)) if left_suspends else left(interpreter)
+            right_value = (yield from right(interpreter)) if right_suspends else right(interpreter)
+            return operation(left_value, right_value)
+        return binary
+
+    if kind in (And, Or):
+        left_suspends, left = _compile_part(node.left, scope)
+        right_suspends, right = _compile_part(node.right, scope)
+        stop_when = kind is Or
+        def logical(interpreter):
+            value = (yield from left(interpreter)) if left_suspends else left(interpreter)
+            if bool(value) is stop_when:
+                return value
+            return (yield from right(interpreter)) if right_suspends else right(interpreter)
+        return logical
+
+    if kind in (Not, Negate):
+        operand = compile_suspending(node.operand, scope)
+        if kind is Not:
+            def negation(interpreter):
+                return not (yield from operand(interpreter))
+            return negation
+        def minus(interpreter):
+            return -(yield from operand(interpreter))
+        return minus
+
+    if kind is Index:
+        target_suspends, target = _compile_part(node.target, scope)
+        index_suspends, index = _compile_part(node.index, scope)
+        def index_of(interpreter):
+            target_value = (yield from target(interpreter)) if target_suspends else target(interpreter)
+            index_value = (yield from index(interpreter)) if index_suspends else index(interpreter)
+            return get_index(target_value, index_value)
+        return index_of
+
+    if kind is Field:
+        target, site = compile_suspending(node.target, scope), FieldSite(node.field)
+        def field_of(interpreter):
+            return site.read((yield from target(interpreter)))
+        return field_of
+
+    if kind is ListExpr:
+        parts = [_compile_part(item, scope) for item in node.items]
+        def build_list(interpreter):
+            items = []
+            for suspends, evaluate in parts:
+                items.append((yield from evaluate(interpreter)) if suspends else evaluate(interpreter))
+            return pack(items)
+        return build_list
+
+    if kind is ThingExpr:
+        keys = tuple(key for key, _ in node.pairs)
+        parts = [_compile_part(value, scope) for _, value in node.pairs]
+        def make_thing(interpreter):
+            values = []
+            for suspends, evaluate in parts:
+                values.append((yield from evaluate(interpreter)) if suspends else evaluate(interpreter))
+            return build_thing(keys, values)
+        return make_thing
+
+    raise TypeError(f"Can't compile {node!r} as a suspending expression")
+
+
+def compile_expression(text, scope=None, node=None):
+    """Parse expression text and compile it into an evaluator function
+
+    If the expression calls anything, the evaluator's 'suspending' attribute
+    holds the generator version from compile_suspending, otherwise None.
+    A node already parsed from the text can be passed to skip parsing.
+    """
+    if node is None:
+        node = parse_expression(text)
+    evaluator = compile_node(node, scope)
+    evaluator.suspending = compile_suspending(node, scope) if calls_function(node) else None
+    return evaluator
+
+
+class ExpressionCache:
+    """Bounded LRU cache of compiled expressions, keyed by their source text
+
+    Text inside a function is cached separately for each Scope, because its
+    names compile to that function's slots.
+    """
+    def __init__(self, maxsize=EXPRESSION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self.parsed = {}  # expression trees parsed ahead of time, by text
+
+    def get(self, text, scope=None):
+        """Return the evaluator for text, compiling it on first use"""
+        key = text if scope is None else (text, scope)
+        evaluator = self._entries.get(key)
+        if evaluator is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return evaluator
+        self.misses += 1
+        evaluator = compile_expression(text, scope, self.parsed.get(text))
+        self._entries[key] = evaluator
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return evaluator
+
+    def info(self):
+        """Hit/miss counts and size, in the style of functools.lru_cache"""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        """Forget every compiled expression and reset the counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -7,23 +7,157 @@ A simple and friendly programming language designed for beginners.
 
 import re
 import sys
-import os
-import importlib.util
+import json
+from time import perf_counter
 
-# Enable this for debugging
-DEBUG = True
+from .parser import (
+    parse_program, clean_line, BlockTable, JulesParser, JulesSyntaxError,
+    Show, Assign, When, RepeatTimes, RepeatEach, While, Ask,
+    FunctionDef, ProcedureDef, Import, Call, Return, Try, Stop, Skip,
+    AddItem, SetIndex, SetField, RemoveItem, child_bodies
+)
+from .expressions import (
+    ExpressionCache, Scope, UNSET, EXPRESSION_CACHE_SIZE, parse_expression, text_calls_function
+)
+from .symbols import SymbolTable, FUNCTION, NATIVE
+from .purity import MemoCache, MEMO_CACHE_SIZE, FORGOTTEN, private, expressions
+from .runtime import RECURSION_LIMIT, add_item, set_index, set_field, remove_item
+from .compiler import find_local_names
+from .tracing import Tracer, make_tracer, CALLS, STATEMENTS, EXPRESSIONS
+from .output import Output
+from .cache import cached
+from .counters import Counters
+from .budget import Meter, metered
+from .libraries import load_library
+
+# Signals a statement hands back to the block that runs it
+STOP = object()
+SKIP = object()
+# Marks a variable that did not exist before a loop borrowed its name
+MISSING = object()
+
+
+class ReturnValue:
+    """Signal that a 'return' statement ran, carrying the returned value"""
+    def __init__(self, value):
+        self.value = value
+
+
+class Frame:
+    """The local variables of one running function or procedure call"""
+    __slots__ = ('scope', 'values')
+
+    def __init__(self, scope, values):
+        self.scope = scope
+        self.values = values  # one per scope slot, UNSET until assigned
 
-def debug_print(message):
-    """Print debug messages if DEBUG is True"""
-    if DEBUG:
-        print(f"DEBUG: {message}")
 
 class JulesInterpreter:
-    def __init__(self):
+    def __init__(self, expression_cache_size=EXPRESSION_CACHE_SIZE, tracer=None, output=None,
+                 recursion_limit=RECURSION_LIMIT, memo_cache_size=MEMO_CACHE_SIZE, profiler=None,
+                 counters=None, inputs=None, budget=None):
+        # Top level variables; a running call keeps its own in self.frame
         self.variables = {}
-        self.functions = {}
-        self.procedures = {}
-        self.libraries = {}
+        self.frame = None
+        # Functions, procedures, library exports and built-ins, all callable by name
+        self.symbols = SymbolTable()
+        self.functions = self.symbols.functions
+        self.procedures = self.symbols.procedures
+        self.libraries = self.symbols.libraries
+        self.result = None
+        # Where 'show' writes
+        self.output = output if output is not None else Output()
+        # Where 'ask' gets its answers: typed in, unless they were given up front
+        self.read_answer = input if inputs is None else answers(inputs)
+        # Compiled expressions and conditions, keyed by their source text
+        self.expression_cache = ExpressionCache(expression_cache_size)
+        # Results of calls to pure functions
+        self.memo = MemoCache(memo_cache_size)
+        # Calls run on the executor's own stack, so this is the only depth limit
+        self.recursion_limit = recursion_limit
+        self._handlers = {
+            Show: self._execute_show,
+            Assign: self._execute_assign,
+            When: self._execute_when,
+            RepeatTimes: self._execute_repeat_times,
+            RepeatEach: self._execute_repeat_each,
+            While: self._execute_while,
+            Ask: self._execute_ask,
+            FunctionDef: self._execute_function_def,
+            ProcedureDef: self._execute_procedure_def,
+            Import: self._execute_import,
+            Call: self._execute_call,
+            Return: self._execute_return,
+            Try: self._execute_try,
+            Stop: self._execute_stop,
+            Skip: self._execute_skip,
+            AddItem: self._execute_add_item,
+            SetIndex: self._execute_set_index,
+            SetField: self._execute_set_field,
+            RemoveItem: self._execute_remove_item,
+        }
+        # Generator versions of the statements that can call a Jules function
+        self._runners = {
+            Show: self._run_show,
+            Assign: self._run_assign,
+            When: self._run_when,
+            RepeatTimes: self._run_repeat_times,
+            RepeatEach: self._run_repeat_each,
+            While: self._run_while,
+            Call: self._run_call,
+            Return: self._run_return,
+            Try: self._run_try,
+            AddItem: self._run_add_item,
+            SetIndex: self._run_set_index,
+            SetField: self._run_set_field,
+            RemoveItem: self._run_remove_item,
+        }
+        
+        # Tracing swaps in the traced code paths, so it costs nothing when off
+        self.tracer = tracer if tracer is not None else Tracer()
+        self._trace_line = None
+        level = self.tracer.level
+        if level >= CALLS:
+            self._invoke = self._traced_invoke
+        if level >= STATEMENTS:
+            self._execute_block = self._traced_execute_block
+            self._run_block = self._traced_run_block
+        if level >= EXPRESSIONS:
+            self._parse_expression = self._traced_parse_expression
+            self._evaluate_condition = self._traced_evaluate_condition
+            self._evaluate = self._traced_evaluate
+            self._test = self._traced_test
+
+        # So does profiling, which times every line and call
+        self.profiler = profiler
+        if profiler is not None:
+            self._invoke = self._profiled_invoke
+            self._execute_block = self._profiled_execute_block
+            self._run_block = self._profiled_run_block
+
+        # And counting, which tallies the work done for stats()
+        self.counters = counters
+        if counters is not None:
+            self._execute_block = self._counted_execute_block
+            self._run_block = self._counted_run_block
+            self._parse_expression = self._counted_parse_expression
+            self._evaluate_condition = self._counted_evaluate_condition
+            self._evaluate = self._counted_evaluate
+            self._test = self._counted_test
+            self._invoke = self._counted_invoke
+            self._enter = self._counted_enter
+
+        # A budget wraps whichever handlers and block runners are in use
+        self.meter = None
+        if budget is not None:
+            if budget.depth is not None:
+                self.recursion_limit = budget.depth
+            if budget.metered():
+                meter = self.meter = Meter(budget)
+                self._handlers = {kind: metered(handler, meter) for kind, handler in self._handlers.items()}
+                self._runners = {kind: metered(runner, meter) for kind, runner in self._runners.items()}
+                self._execute_block = metered(self._execute_block, meter)
+                self._run_block = metered(self._run_block, meter)
         
     def tokenize(self, code):
         """Convert code string into tokens"""
@@ -39,679 +173,813 @@ class JulesInterpreter:
     
     def parse_and_execute(self, code):
         """Parse and execute Jules code"""
-        lines = code.split('\n')
-        i = 0
-        result = None
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Skip empty lines and comments
-            if not line or line.startswith('#'):
-                i += 1
-                continue
-                
-            debug_print(f"Executing line: {line}")
-                
-            # Parse show command
-            if line.startswith('show'):
-                value = self._parse_expression(line[4:].strip())
-                debug_print(f"Showing value: {value} (type: {type(value)})")
-                print(str(value))
-                i += 1
-                
-            # Parse variable assignment
-            elif ' is ' in line and not line.startswith('when'):
-                parts = line.split(' is ', 1)
-                var_name = parts[0].strip()
-                value = self._parse_expression(parts[1].strip())
-                debug_print(f"Setting variable {var_name} = {value} (type: {type(value)})")
-                self.variables[var_name] = value
-                i += 1
-                
-            # Parse when/then/otherwise/done blocks
-            elif line.startswith('when'):
-                condition_text = line[4:].split('then')[0].strip()
-                condition_result = self._evaluate_condition(condition_text)
-                debug_print(f"Condition '{condition_text}' evaluated to {condition_result}")
-                
-                # Find the matching done
-                done_idx = self._find_matching_done(lines, i)
-                
-                # Find otherwise if it exists
-                otherwise_idx = self._find_otherwise(lines, i, done_idx)
-                
-                if condition_result:
-                    # Execute the then block
-                    debug_print("Executing 'then' block")
-                    self.parse_and_execute('\n'.join(lines[i+1:otherwise_idx if otherwise_idx else done_idx]))
-                elif otherwise_idx:
-                    # Execute the otherwise block
-                    debug_print("Executing 'otherwise' block")
-                    self.parse_and_execute('\n'.join(lines[otherwise_idx+1:done_idx]))
-                
-                i = done_idx + 1  # Move past the 'done'
-                
-            # Parse repeat loops
-            elif line.startswith('repeat'):
-                if 'times' in line:
-                    # repeat n times
-                    count_expr = line.split('repeat')[1].split('times')[0].strip()
-                    count = int(self._parse_expression(count_expr))
-                    debug_print(f"Repeating {count} times")
-                    done_idx = self._find_matching_done(lines, i)
-                    loop_body = '\n'.join(lines[i+1:done_idx])
-                    
-                    for count_value in range(1, count + 1):  # Start from 1 for more natural counting
-                        # Add count variable to access the current iteration
-                        debug_print(f"Loop iteration {count_value}")
-                        old_count = self.variables.get('count', None)
-                        self.variables['count'] = count_value
-                        self.parse_and_execute(loop_body)
-                        if old_count is not None:
-                            self.variables['count'] = old_count
-                        else:
-                            if 'count' in self.variables:
-                                del self.variables['count']
-                    
-                    i = done_idx + 1  # Move past the 'done'
-                elif 'each' in line:
-                    # repeat each item in list
-                    match = re.match(r'repeat each (\w+) in (.+)', line)
-                    if match:
-                        item_name = match.group(1)
-                        list_expr = match.group(2)
-                        items = self._parse_expression(list_expr)
-                        debug_print(f"Iterating over list: {items}")
-                        
-                        done_idx = self._find_matching_done(lines, i)
-                        loop_body = '\n'.join(lines[i+1:done_idx])
-                        
-                        # Save the original value of the loop variable if it exists
-                        old_value = self.variables.get(item_name, None)
-                        
-                        for item in items:
-                            debug_print(f"Processing item: {item}")
-                            self.variables[item_name] = item
-                            self.parse_and_execute(loop_body)
-                        
-                        # Restore the original value or remove the variable
-                        if old_value is not None:
-                            self.variables[item_name] = old_value
-                        else:
-                            if item_name in self.variables:
-                                del self.variables[item_name]
-                        
-                        i = done_idx + 1  # Move past the 'done'
-            
-            # Parse while loops
-            elif line.startswith('while'):
-                condition_text = line[5:].strip()
-                done_idx = self._find_matching_done(lines, i)
-                loop_body = '\n'.join(lines[i+1:done_idx])
-                
-                iteration = 1
-                while self._evaluate_condition(condition_text):
-                    debug_print(f"While loop iteration {iteration} (condition: {condition_text})")
-                    self.parse_and_execute(loop_body)
-                    iteration += 1
-                    
-                    # Safety valve to prevent infinite loops during development
-                    if iteration > 1000:
-                        debug_print("Possible infinite loop detected, breaking")
-                        break
-                
-                i = done_idx + 1  # Move past the 'done'
-            
-            # Parse ask command
-            elif line.startswith('ask'):
-                match = re.match(r'ask\s+"([^"]+)"\s+into\s+(\w+)', line)
-                if match:
-                    prompt = match.group(1)
-                    var_name = match.group(2)
-                    debug_print(f"Asking input with prompt: {prompt}")
-                    user_input = input(prompt + " ")
-                    self.variables[var_name] = user_input
-                    debug_print(f"Got input: {user_input}")
-                i += 1
-            
-            # Parse function definitions
-            elif line.startswith('make'):
-                match = re.match(r'make\s+(\w+)\((.*?)\)', line)
-                if match:
-                    func_name = match.group(1)
-                    params = [p.strip() for p in match.group(2).split(',') if p.strip()]
-                    
-                    done_idx = self._find_matching_done(lines, i)
-                    func_body = lines[i+1:done_idx]
-                    
-                    debug_print(f"Defining function {func_name} with parameters {params}")
-                    self.functions[func_name] = {
-                        'params': params,
-                        'body': func_body
-                    }
-                    
-                    i = done_idx + 1  # Move past the 'done'
-            
-            # Parse procedure definitions
-            elif line.startswith('do '):
-                match = re.match(r'do\s+(\w+)\((.*?)\)', line)
-                if match:
-                    proc_name = match.group(1)
-                    params = [p.strip() for p in match.group(2).split(',') if p.strip()]
-                    
-                    done_idx = self._find_matching_done(lines, i)
-                    proc_body = lines[i+1:done_idx]
-                    
-                    debug_print(f"Defining procedure {proc_name} with parameters {params}")
-                    self.procedures[proc_name] = {
-                        'params': params,
-                        'body': proc_body
-                    }
-                    
-                    i = done_idx + 1  # Move past the 'done'
-            
-            # Parse library imports
-            elif line.startswith('get'):
-                lib_name = line[3:].strip()
-                debug_print(f"Importing library: {lib_name}")
-                self._import_library(lib_name)
-                i += 1
-            
-            # Parse function/procedure calls
-            elif '(' in line and ')' in line:
-                call_match = re.match(r'(\w+)\((.*?)\)', line)
-                if call_match:
-                    func_name = call_match.group(1)
-                    arg_str = call_match.group(2)
-                    args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
-                    
-                    debug_print(f"Function/procedure call: {func_name}{args}")
-                    
-                    # Check if it's a function call
-                    if func_name in self.functions:
-                        result = self._call_function(func_name, args)
-                    # Check if it's a procedure call
-                    elif func_name in self.procedures:
-                        self._call_procedure(func_name, args)
-                    # Check if it's a library function
-                    elif any(func_name in lib for lib in self.libraries.values()):
-                        for lib in self.libraries.values():
-                            if func_name in lib:
-                                result = lib[func_name](*args)
-                                break
-                    # Built-in function
-                    elif func_name == 'number':
-                        try:
-                            result = float(args[0]) if '.' in str(args[0]) else int(args[0])
-                        except ValueError:
-                            print(f"Cannot convert {args[0]} to a number")
-                            result = 0
-                    elif func_name == 'text':
-                        result = str(args[0])
-                    else:
-                        print(f"Unknown function or procedure: {func_name}")
-            
-            # Parse special syntax for library function call with 'into'
-            elif ' into ' in line and not line.startswith('ask'):
-                match = re.match(r'(\w+)\((.*?)\)\s+into\s+(\w+)', line)
-                if match:
-                    func_name = match.group(1)
-                    arg_str = match.group(2)
-                    var_name = match.group(3)
-                    
-                    args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
-                    debug_print(f"Library function call with 'into': {func_name}{args} -> {var_name}")
-                    
-                    # Look for the function in libraries
-                    if any(func_name in lib for lib in self.libraries.values()):
-                        for lib in self.libraries.values():
-                            if func_name in lib:
-                                result = lib[func_name](*args)
-                                self.variables[var_name] = result
-                                break
-                    else:
-                        print(f"Unknown function: {func_name}")
-                
-            # Parse return statement
-            elif line.startswith('return'):
-                result = self._parse_expression(line[6:].strip())
-                debug_print(f"Returning value: {result}")
-                return result
-            
-            # Parse try/catch blocks
-            elif line.startswith('try'):
-                try_idx = i
-                done_idx = self._find_matching_done(lines, i)
-                catch_idx = None
-                
-                # Find catch if it exists
-                for j in range(try_idx + 1, done_idx):
-                    if lines[j].strip() == 'catch':
-                        catch_idx = j
-                        break
-                
-                if catch_idx:
-                    try:
-                        # Execute the try block
-                        debug_print("Executing 'try' block")
-                        self.parse_and_execute('\n'.join(lines[try_idx+1:catch_idx]))
-                    except Exception as e:
-                        # Execute the catch block
-                        debug_print(f"Exception caught: {e}")
-                        self.variables['error'] = str(e)
-                        self.parse_and_execute('\n'.join(lines[catch_idx+1:done_idx]))
-                
-                i = done_idx
-            
-            i += 1
-        
-        return result
+        return self.execute(parse_program(code))
 
-    def _parse_expression(self, expr):
-        """Parse and evaluate a Jules expression"""
-        expr = expr.strip()
-        debug_print(f"Parsing expression: {expr}")
-        
-        # String literal
-        if expr.startswith('"') and expr.endswith('"'):
-            return expr[1:-1]
-        
-        # Function call
-        if '(' in expr and ')' in expr:
-            call_match = re.match(r'(\w+)\((.*?)\)', expr)
-            if call_match:
-                func_name = call_match.group(1)
-                arg_str = call_match.group(2)
-                args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
-                
-                # Check if it's a function call
-                if func_name in self.functions:
-                    return self._call_function(func_name, args)
-                # Check if it's a library function
-                elif any(func_name in lib for lib in self.libraries.values()):
-                    for lib in self.libraries.values():
-                        if func_name in lib:
-                            return lib[func_name](*args)
-                # Built-in function
-                elif func_name == 'number':
-                    try:
-                        return float(args[0]) if '.' in str(args[0]) else int(args[0])
-                    except ValueError:
-                        print(f"Cannot convert {args[0]} to a number")
-                        return 0
-                elif func_name == 'text':
-                    return str(args[0])
-        
-        # Number
-        try:
-            return int(expr)
-        except ValueError:
+    def execute(self, statements, marked=False):
+        """Execute an already parsed list of statements
+
+        marked says mark_calls has been run on them already, as parse_ahead does.
+        """
+        self.result = None
+        if not marked:
+            mark_calls(statements)
+        if self.counters is not None:
+            self.counters.find_loops(statements)
+        with self.output.active():
+            signal = self._drive(self._run_block(statements), self.frame)
+        if isinstance(signal, ReturnValue):
+            return signal.value
+        return self.result
+
+    def stats(self):
+        """Counters from the caches, and of the work done if counting, as plain data"""
+        stats = self.counters.as_dict() if self.counters is not None else {}
+        stats['expression_cache'] = self.expression_cache.info()._asdict()
+        stats['memo'] = self.memo.stats()
+        return stats
+
+    def _execute_block(self, statements):
+        """Run a list of statements, handing back any return/stop/skip signal"""
+        handlers = self._handlers
+        for statement in statements:
+            signal = handlers[type(statement)](statement)
+            if signal is not None:
+                return signal
+        return None
+
+    def _traced_execute_block(self, statements):
+        handlers = self._handlers
+        emit = self.tracer.emit
+        for statement in statements:
+            self._trace_line = statement.line
+            start = perf_counter()
+            signal = handlers[type(statement)](statement)
+            emit(statement.line, type(statement).__name__, perf_counter() - start)
+            if signal is not None:
+                return signal
+        return None
+
+    def _profiled_execute_block(self, statements):
+        handlers = self._handlers
+        profiler = self.profiler
+        for statement in statements:
+            profiler.start_line(statement.line)
             try:
-                return float(expr)
-            except ValueError:
-                pass
-        
-        # Boolean literals
-        if expr == 'yes':
-            return True
-        elif expr == 'no':
-            return False
-        
-        # Variable
-        if expr in self.variables:
-            return self.variables[expr]
-            
-        # Access dictionary/thing fields with dot notation
-        if '.' in expr and not expr.startswith('.') and not expr.endswith('.'):
-            parts = expr.split('.', 1)
-            container_name = parts[0].strip()
-            field_name = parts[1].strip()
-            
-            if container_name in self.variables:
-                container = self.variables[container_name]
-                if isinstance(container, dict) and field_name in container:
-                    return container[field_name]
-                    
-        # Access list items with brackets
-        if '[' in expr and ']' in expr:
-            match = re.match(r'(\w+)\[(.+?)\]', expr)
-            if match:
-                list_name = match.group(1)
-                index_expr = match.group(2)
-                
-                if list_name in self.variables:
-                    container = self.variables[list_name]
-                    index = self._parse_expression(index_expr)
-                    if isinstance(container, list) and 0 <= index < len(container):
-                        return container[index]
-        
-        # List literal
-        if expr.startswith('[') and expr.endswith(']'):
-            if expr == '[]':  # Empty list
-                return []
-            items = expr[1:-1].split(',')
-            return [self._parse_expression(item.strip()) for item in items]
-        
-        # Dictionary/thing literal
-        if expr.startswith('{') and expr.endswith('}'):
-            if expr == '{}':  # Empty dictionary
-                return {}
-            
-            # Parse key-value pairs
-            items = expr[1:-1].split(',')
-            thing = {}
-            for item in items:
-                if ':' in item:
-                    key, value = item.split(':', 1)
-                    thing[key.strip()] = self._parse_expression(value.strip())
-            return thing
-        
-        # Addition 
-        if '+' in expr:
-            parts = expr.split('+', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            
-            # Convert to string if either operand is a string
-            if isinstance(left, str) or isinstance(right, str):
-                return str(left) + str(right)
+                signal = handlers[type(statement)](statement)
+            finally:
+                profiler.finish()
+            if signal is not None:
+                return signal
+        return None
+
+    def _run_block(self, statements):
+        """Generator version of _execute_block, for blocks that may call Jules functions
+
+        Statements that can't call anything still run through their ordinary
+        handlers; only the rest go through the generator runners.
+        """
+        handlers = self._handlers
+        runners = self._runners
+        for statement in statements:
+            if statement.calls:
+                signal = yield from runners[type(statement)](statement)
             else:
-                return left + right
-        
-        # Handle parentheses grouping
-        if expr.startswith('(') and expr.endswith(')'):
-            return self._parse_expression(expr[1:-1].strip())
-        
-        # Subtraction
-        if '-' in expr and not expr.startswith('-'):  # Avoid negatives
-            parts = expr.split('-', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left - right
-        
-        # Unary minus (negative numbers)
-        if expr.startswith('-'):
-            return -self._parse_expression(expr[1:].strip())
-        
-        # Multiplication
-        if 'times' in expr:
-            parts = expr.split('times', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left * right
-        
-        # Division
-        if 'divided by' in expr:
-            parts = expr.split('divided by', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            if right == 0:
-                print("Warning: Division by zero!")
-                return 0
-            return left / right
-        
-        return expr  # Return as is for now
+                signal = handlers[type(statement)](statement)
+            if signal is not None:
+                return signal
+        return None
+
+    def _traced_run_block(self, statements):
+        handlers = self._handlers
+        runners = self._runners
+        emit = self.tracer.emit
+        for statement in statements:
+            self._trace_line = statement.line
+            start = perf_counter()
+            if statement.calls:
+                signal = yield from runners[type(statement)](statement)
+            else:
+                signal = handlers[type(statement)](statement)
+            emit(statement.line, type(statement).__name__, perf_counter() - start)
+            if signal is not None:
+                return signal
+        return None
+
+    def _profiled_run_block(self, statements):
+        handlers = self._handlers
+        runners = self._runners
+        profiler = self.profiler
+        for statement in statements:
+            profiler.start_line(statement.line)
+            try:
+                if statement.calls:
+                    signal = yield from runners[type(statement)](statement)
+                else:
+                    signal = handlers[type(statement)](statement)
+            finally:
+                profiler.finish()
+            if signal is not None:
+                return signal
+        return None
+
+    def _counted_execute_block(self, statements):
+        counters = self.counters
+        if id(statements) in counters.loop_bodies:
+            counters.loop_iterations += 1
+        handlers = self._handlers
+        for statement in statements:
+            counters.statements += 1
+            signal = handlers[type(statement)](statement)
+            if signal is not None:
+                return signal
+        return None
+
+    def _counted_run_block(self, statements):
+        counters = self.counters
+        if id(statements) in counters.loop_bodies:
+            counters.loop_iterations += 1
+        handlers = self._handlers
+        runners = self._runners
+        for statement in statements:
+            counters.statements += 1
+            if statement.calls:
+                signal = yield from runners[type(statement)](statement)
+            else:
+                signal = handlers[type(statement)](statement)
+            if signal is not None:
+                return signal
+        return None
+
+    def _run_loop_body(self, body):
+        """Run one loop iteration; returns (keep_going, signal to pass up)"""
+        return loop_signal(self._execute_block(body))
+
+    def _locate(self, name):
+        """Where a variable lives: (frame values, slot) in a call, else (globals, name)"""
+        frame = self.frame
+        if frame is not None:
+            slot = frame.scope.slots.get(name)
+            if slot is not None:
+                return frame.values, slot
+        return self.variables, name
+
+    def _assign(self, name, value):
+        """Set a variable in the running call, or at the top level"""
+        if self.frame is None:
+            self.variables[name] = value
+        else:
+            container, key = self._locate(name)
+            container[key] = value
+
+    def _save_variable(self, container, key):
+        """The current value of a variable a loop is about to borrow"""
+        if container is self.variables:
+            return container.get(key, MISSING)
+        return container[key]
+
+    def _restore_variable(self, container, key, old_value):
+        """Put back a variable that a loop borrowed, or remove it"""
+        if old_value is not MISSING:
+            container[key] = old_value
+        elif key in container:
+            del container[key]
+
+    def _execute_show(self, statement):
+        value = self._parse_expression(statement.expr)
+        self.output.show(value)
+
+    def _execute_assign(self, statement):
+        value = self._parse_expression(statement.expr)
+        self._assign(statement.target, value)
+
+    def _execute_when(self, statement):
+        for condition, body in statement.branches:
+            condition_result = self._evaluate_condition(condition)
+            if condition_result:
+                return self._execute_block(body)
+        if statement.otherwise is not None:
+            return self._execute_block(statement.otherwise)
+        return None
+
+    def _execute_repeat_times(self, statement):
+        count = int(self._parse_expression(statement.count_expr))
+        container, key = self._locate('count')
+        old_count = self._save_variable(container, key)
+        signal = None
+        try:
+            for count_value in range(1, count + 1):  # Start from 1 for more natural counting
+                # Add count variable to access the current iteration
+                container[key] = count_value
+                keep_going, signal = self._run_loop_body(statement.body)
+                if not keep_going:
+                    break
+        finally:
+            self._restore_variable(container, key, old_count)
+        return signal
+
+    def _execute_repeat_each(self, statement):
+        items = self._parse_expression(statement.list_expr)
+        container, key = self._locate(statement.item_name)
+        # Save the original value of the loop variable if it exists
+        old_value = self._save_variable(container, key)
+        signal = None
+        try:
+            for item in items:
+                container[key] = item
+                keep_going, signal = self._run_loop_body(statement.body)
+                if not keep_going:
+                    break
+        finally:
+            self._restore_variable(container, key, old_value)
+        return signal
+
+    def _execute_while(self, statement):
+        condition_text = statement.condition
+        while self._evaluate_condition(condition_text):
+            keep_going, signal = self._run_loop_body(statement.body)
+            if not keep_going:
+                return signal
+        return None
+
+    def _execute_ask(self, statement):
+        # The prompt has to come after everything shown so far
+        self.output.flush()
+        user_input = self.read_answer(statement.prompt + " ")
+        self._assign(statement.var_name, user_input)
+
+    def _execute_function_def(self, statement):
+        self.symbols.define_function(statement.name, {
+            'params': statement.params,
+            'body': statement.body,
+            'scope': Scope(find_local_names(statement.params, statement.body)),
+            'pure': statement.pure,
+            'callees': statement.callees,
+        }, pure=statement.pure)
+
+    def _execute_procedure_def(self, statement):
+        self.symbols.define_procedure(statement.name, {
+            'params': statement.params,
+            'body': statement.body,
+            'scope': Scope(find_local_names(statement.params, statement.body))
+        })
+
+    def _execute_import(self, statement):
+        self._import_library(statement.lib_name)
+
+    def _execute_call(self, statement):
+        args = [self._parse_expression(arg) for arg in statement.args]
+        result = self._call_site(statement.site, args)
+        if statement.into:
+            self._assign(statement.into, result)
+        self.result = result
+
+    def _execute_return(self, statement):
+        result = self._parse_expression(statement.expr) if statement.expr is not None else None
+        return ReturnValue(result)
+
+    def _execute_try(self, statement):
+        if statement.catch_body is None:
+            return self._execute_block(statement.body)
+        try:
+            # Execute the try block
+            return self._execute_block(statement.body)
+        except Exception as e:
+            # Execute the catch block
+            self._assign('error', str(e))
+            return self._execute_block(statement.catch_body)
+
+    def _execute_stop(self, statement):
+        return STOP
+
+    def _execute_skip(self, statement):
+        return SKIP
+
+    def _execute_add_item(self, statement):
+        container = self._parse_expression(statement.target)
+        add_item(container, self._parse_expression(statement.expr))
+
+    def _execute_set_index(self, statement):
+        container = self._parse_expression(statement.target)
+        index = self._parse_expression(statement.index)
+        set_index(container, index, self._parse_expression(statement.expr))
+
+    def _execute_set_field(self, statement):
+        container = self._parse_expression(statement.target)
+        set_field(container, statement.field, self._parse_expression(statement.expr))
+
+    def _execute_remove_item(self, statement):
+        container = self._parse_expression(statement.target)
+        remove_item(container, self._parse_expression(statement.expr))
+
+    def _run_show(self, statement):
+        value = yield from self._evaluate(statement.expr)
+        self.output.show(value)
+
+    def _run_assign(self, statement):
+        value = yield from self._evaluate(statement.expr)
+        self._assign(statement.target, value)
+
+    def _run_when(self, statement):
+        for condition, body in statement.branches:
+            if (yield from self._test(condition)):
+                return (yield from self._run_block(body))
+        if statement.otherwise is not None:
+            return (yield from self._run_block(statement.otherwise))
+        return None
+
+    def _run_repeat_times(self, statement):
+        count = int((yield from self._evaluate(statement.count_expr)))
+        container, key = self._locate('count')
+        old_count = self._save_variable(container, key)
+        signal = None
+        try:
+            for count_value in range(1, count + 1):
+                container[key] = count_value
+                keep_going, signal = loop_signal((yield from self._run_block(statement.body)))
+                if not keep_going:
+                    break
+        finally:
+            self._restore_variable(container, key, old_count)
+        return signal
+
+    def _run_repeat_each(self, statement):
+        items = yield from self._evaluate(statement.list_expr)
+        container, key = self._locate(statement.item_name)
+        old_value = self._save_variable(container, key)
+        signal = None
+        try:
+            for item in items:
+                container[key] = item
+                keep_going, signal = loop_signal((yield from self._run_block(statement.body)))
+                if not keep_going:
+                    break
+        finally:
+            self._restore_variable(container, key, old_value)
+        return signal
+
+    def _run_while(self, statement):
+        while (yield from self._test(statement.condition)):
+            keep_going, signal = loop_signal((yield from self._run_block(statement.body)))
+            if not keep_going:
+                return signal
+        return None
+
+    def _run_call(self, statement):
+        args = []
+        for arg in statement.args:
+            args.append((yield from self._evaluate(arg)))
+        site = statement.site
+        entry = site.resolve(self.symbols)
+        if entry is not None and entry[0] is not NATIVE:
+            result = yield entry, site.name, args
+        else:
+            result = self._invoke(entry, site.name, args)
+        if statement.into:
+            self._assign(statement.into, result)
+        self.result = result
+
+    def _run_return(self, statement):
+        result = None
+        if statement.expr is not None:
+            result = yield from self._evaluate(statement.expr)
+        return ReturnValue(result)
+
+    def _run_add_item(self, statement):
+        container = yield from self._evaluate(statement.target)
+        add_item(container, (yield from self._evaluate(statement.expr)))
+
+    def _run_set_index(self, statement):
+        container = yield from self._evaluate(statement.target)
+        index = yield from self._evaluate(statement.index)
+        set_index(container, index, (yield from self._evaluate(statement.expr)))
+
+    def _run_set_field(self, statement):
+        container = yield from self._evaluate(statement.target)
+        set_field(container, statement.field, (yield from self._evaluate(statement.expr)))
+
+    def _run_remove_item(self, statement):
+        container = yield from self._evaluate(statement.target)
+        remove_item(container, (yield from self._evaluate(statement.expr)))
+
+    def _run_try(self, statement):
+        if statement.catch_body is None:
+            return (yield from self._run_block(statement.body))
+        try:
+            return (yield from self._run_block(statement.body))
+        except Exception as e:
+            self._assign('error', str(e))
+            return (yield from self._run_block(statement.catch_body))
+
+    def _parse_expression(self, expr):
+        """Evaluate a Jules expression, compiling it the first time it's seen"""
+        frame = self.frame
+        scope = frame.scope if frame is not None else None
+        return self.expression_cache.get(expr, scope)(self)
     
     def _evaluate_condition(self, condition):
         """Evaluate a condition expression"""
-        condition = condition.strip()
-        debug_print(f"Evaluating condition: {condition}")
-        
-        # Logical AND
-        if ' and ' in condition:
-            parts = condition.split(' and ', 1)
-            left = self._evaluate_condition(parts[0].strip())
-            right = self._evaluate_condition(parts[1].strip())
-            return left and right
-        
-        # Logical OR
-        if ' or ' in condition:
-            parts = condition.split(' or ', 1)
-            left = self._evaluate_condition(parts[0].strip())
-            right = self._evaluate_condition(parts[1].strip())
-            return left or right
-        
-        # Logical NOT
-        if condition.startswith('not '):
-            return not self._evaluate_condition(condition[4:].strip())
-        
-        # String contains
-        if ' contains ' in condition:
-            parts = condition.split(' contains ', 1)
-            left = str(self._parse_expression(parts[0].strip()))
-            right = str(self._parse_expression(parts[1].strip()))
-            return right in left
-        
-        # Equal comparison
-        if ' is ' in condition and not ' is not ' in condition:
-            parts = condition.split(' is ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left == right
-        
-        # Not equal comparison
-        if ' is not ' in condition:
-            parts = condition.split(' is not ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left != right
-        
-        # Greater than
-        if ' greater than ' in condition:
-            parts = condition.split(' greater than ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left > right
-        
-        # Less than
-        if ' less than ' in condition:
-            parts = condition.split(' less than ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left < right
-        
-        # Greater than or equal to
-        if ' greater than or equal to ' in condition:
-            parts = condition.split(' greater than or equal to ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left >= right
-        
-        # Less than or equal to
-        if ' less than or equal to ' in condition:
-            parts = condition.split(' less than or equal to ', 1)
-            left = self._parse_expression(parts[0].strip())
-            right = self._parse_expression(parts[1].strip())
-            return left <= right
-        
-        # Boolean value
-        return bool(self._parse_expression(condition))
+        frame = self.frame
+        scope = frame.scope if frame is not None else None
+        return bool(self.expression_cache.get(condition, scope)(self))
+
+    def _evaluate(self, expr):
+        """Generator version of _parse_expression that hands Jules calls to the executor"""
+        frame = self.frame
+        evaluator = self.expression_cache.get(expr, frame.scope if frame is not None else None)
+        if evaluator.suspending is None:
+            return evaluator(self)
+        return (yield from evaluator.suspending(self))
+
+    def _test(self, condition):
+        """Generator version of _evaluate_condition"""
+        frame = self.frame
+        evaluator = self.expression_cache.get(condition, frame.scope if frame is not None else None)
+        if evaluator.suspending is None:
+            return bool(evaluator(self))
+        return bool((yield from evaluator.suspending(self)))
+
+    def _traced_evaluate(self, expr):
+        start = perf_counter()
+        value = yield from JulesInterpreter._evaluate(self, expr)
+        self.tracer.emit(self._trace_line, 'expression', perf_counter() - start, expr)
+        return value
+
+    def _traced_parse_expression(self, expr):
+        start = perf_counter()
+        value = JulesInterpreter._parse_expression(self, expr)
+        self.tracer.emit(self._trace_line, 'expression', perf_counter() - start, expr)
+        return value
+
+    def _traced_evaluate_condition(self, condition):
+        start = perf_counter()
+        value = JulesInterpreter._evaluate_condition(self, condition)
+        self.tracer.emit(self._trace_line, 'condition', perf_counter() - start, condition)
+        return value
+
+    def _traced_test(self, condition):
+        start = perf_counter()
+        value = yield from JulesInterpreter._test(self, condition)
+        self.tracer.emit(self._trace_line, 'condition', perf_counter() - start, condition)
+        return value
+
+    def _counted_evaluate(self, expr):
+        self.counters.expressions += 1
+        return (yield from JulesInterpreter._evaluate(self, expr))
+
+    def _counted_parse_expression(self, expr):
+        self.counters.expressions += 1
+        return JulesInterpreter._parse_expression(self, expr)
+
+    def _counted_evaluate_condition(self, condition):
+        self.counters.conditions += 1
+        return JulesInterpreter._evaluate_condition(self, condition)
+
+    def _counted_test(self, condition):
+        self.counters.conditions += 1
+        return (yield from JulesInterpreter._test(self, condition))
+
+    def _call(self, func_name, args):
+        """Call a function, procedure, library function or built-in by name"""
+        return self._invoke(self.symbols.lookup(func_name), func_name, args)
+
+    def _call_site(self, site, args):
+        """Call whatever a call site's name resolves to, reusing its last lookup"""
+        return self._invoke(site.resolve(self.symbols), site.name, args)
+
+    def _invoke(self, entry, func_name, args):
+        if entry is None:
+            print(f"Unknown function or procedure: {func_name}")
+            return None
+        kind, target = entry
+        if kind is NATIVE:
+            return target(*args)
+        caller = self.frame
+        return self._drive(self._enter(entry, func_name, args), caller)
     
-    def _find_matching_done(self, lines, start_idx):
-        """Find the matching 'done' for a block statement"""
-        depth = 1
-        for i in range(start_idx + 1, len(lines)):
-            line = lines[i].strip()
-            if not line or line.startswith('#'):
+    def _traced_invoke(self, entry, func_name, args):
+        if entry is not None and entry[0] is not NATIVE:
+            # Calls to Jules functions are traced as they're entered
+            return JulesInterpreter._invoke(self, entry, func_name, args)
+        line = self._trace_line
+        start = perf_counter()
+        try:
+            return JulesInterpreter._invoke(self, entry, func_name, args)
+        finally:
+            self.tracer.emit(line, 'call', perf_counter() - start, func_name)
+
+    def _profiled_invoke(self, entry, func_name, args):
+        if entry is None or entry[0] is not NATIVE:
+            # Calls to Jules functions are timed as they're entered
+            return JulesInterpreter._invoke(self, entry, func_name, args)
+        kind = 'built-in' if entry[1] is self.symbols.builtins.get(func_name) else 'library'
+        self.profiler.start_call(kind, func_name)
+        try:
+            return entry[1](*args)
+        finally:
+            self.profiler.finish()
+
+    def _counted_invoke(self, entry, func_name, args):
+        if entry is not None and entry[0] is NATIVE:
+            if entry[1] is self.symbols.builtins.get(func_name):
+                self.counters.builtin_calls[func_name] += 1
+            else:
+                self.counters.library_calls[func_name] += 1
+        return JulesInterpreter._invoke(self, entry, func_name, args)
+
+    def _drive(self, routine, frame):
+        """Run a generator from _run_block to the end, on an explicit stack of calls
+
+        A call to a Jules function arrives as a yielded (entry, name, args)
+        request. The callee's body is pushed and run, and its result is sent
+        back to the caller, so Jules recursion never deepens Python's stack.
+        Errors are thrown into the caller, where a Jules 'try' can catch them.
+        """
+        calls = [(routine, frame)]  # each running body, and the frame to go back to
+        limit = self.recursion_limit
+        value = None
+        error = None
+        while True:
+            running = calls[-1][0]
+            try:
+                if error is None:
+                    request = running.send(value)
+                else:
+                    pending, error = error, None
+                    request = running.throw(pending)
+            except StopIteration as finished:
+                self.frame = calls.pop()[1]
+                if not calls:
+                    return finished.value
+                value = finished.value
                 continue
-            if line.startswith(('when', 'repeat', 'make', 'do', 'try', 'while')):
-                depth += 1
-            elif line == 'done':
-                depth -= 1
-                if depth == 0:
-                    return i
-        return len(lines) - 1  # Fallback to end of file
-    
-    def _find_otherwise(self, lines, start_idx, end_idx):
-        """Find the 'otherwise' statement in a when/then block"""
-        depth = 1
-        for i in range(start_idx + 1, end_idx):
-            line = lines[i].strip()
-            if not line or line.startswith('#'):
+            except Exception as raised:
+                self.frame = calls.pop()[1]
+                if not calls:
+                    raise
+                error = raised
                 continue
-            if line.startswith('when'):
-                depth += 1
-            elif line == 'done':
-                depth -= 1
-            elif (line == 'otherwise' or line.startswith('otherwise when')) and depth == 1:
-                return i
-        return None
-    
-    def _call_function(self, func_name, args):
-        """Call a Jules function"""
-        if func_name not in self.functions:
-            raise Exception(f"Function '{func_name}' is not defined")
-        
-        func = self.functions[func_name]
-        if len(args) != len(func['params']):
-            raise Exception(f"Function '{func_name}' expects {len(func['params'])} arguments, but got {len(args)}")
-        
-        debug_print(f"Calling function: {func_name}{args}")
-        
-        # Save current variables
-        old_vars = self.variables.copy()
-        
-        # Set up function parameters
-        for i, param_name in enumerate(func['params']):
-            self.variables[param_name] = args[i]
-        
-        # Execute function body
-        result = self.parse_and_execute('\n'.join(func['body']))
-        
-        # Restore variables
-        self.variables = old_vars
-        
-        return result
-    
-    def _call_procedure(self, proc_name, args):
-        """Call a Jules procedure"""
-        if proc_name not in self.procedures:
-            raise Exception(f"Procedure '{proc_name}' is not defined")
-        
-        proc = self.procedures[proc_name]
-        if len(args) != len(proc['params']):
-            raise Exception(f"Procedure '{proc_name}' expects {len(proc['params'])} arguments, but got {len(args)}")
-        
-        debug_print(f"Calling procedure: {proc_name}{args}")
-        
-        # Save current variables
-        old_vars = self.variables.copy()
-        
-        # Set up procedure parameters
-        for i, param_name in enumerate(proc['params']):
-            self.variables[param_name] = args[i]
-        
-        # Execute procedure body
-        self.parse_and_execute('\n'.join(proc['body']))
+
+            value = None
+            caller = self.frame
+            try:
+                if len(calls) > limit:
+                    raise Exception(f"Too many calls inside each other (the limit is {limit})")
+                calls.append((self._enter(*request), caller))
+            except Exception as raised:
+                self.frame = caller
+                error = raised
+
+    def _enter(self, entry, func_name, args):
+        """Start a call to a Jules function or procedure, returning its body's generator"""
+        kind, routine = entry
+        if len(args) != len(routine['params']):
+            label = 'Function' if kind is FUNCTION else 'Procedure'
+            raise Exception(f"{label} '{func_name}' expects {len(routine['params'])} arguments, but got {len(args)}")
         
-        # Restore variables
-        self.variables = old_vars
+        key = None
+        if kind is FUNCTION and routine['pure']:
+            key, value = self.memo.recall(self.symbols, func_name, routine['callees'], args)
+            if value is not FORGOTTEN:
+                if self.profiler is not None:
+                    self.profiler.remembered_call(kind, func_name)
+                return self._recalled(value)
+            # Whatever the body does to a list or thing it was given stays inside the call
+            args = [private(arg) for arg in args]
+
+        # Parameters fill the first slots of a fresh frame
+        self.frame = self._new_frame(routine['scope'], args)
+        if key is not None:
+            body = self._run_pure_function(routine['body'], key)
+        elif kind is FUNCTION:
+            body = self._run_function(routine['body'])
+        else:
+            body = self._run_procedure(routine['body'])
+        if self.tracer.level >= CALLS:
+            body = self._traced_call(body, func_name)
+        if self.profiler is not None:
+            body = self._profiled_call(body, kind, func_name)
+        return body
+
+    def _counted_enter(self, entry, func_name, args):
+        body = JulesInterpreter._enter(self, entry, func_name, args)
+        if entry[0] is FUNCTION:
+            self.counters.function_calls += 1
+        else:
+            self.counters.procedure_calls += 1
+        return self._counted_call(body)
+
+    def _counted_call(self, body):
+        counters = self.counters
+        counters.depth += 1
+        if counters.depth > counters.peak_depth:
+            counters.peak_depth = counters.depth
+        try:
+            return (yield from body)
+        finally:
+            counters.depth -= 1
+
+    def _run_function(self, body):
+        signal = yield from self._run_block(body)
+        if isinstance(signal, ReturnValue):
+            return signal.value
+        return None
+
+    def _run_pure_function(self, body, key):
+        value = yield from self._run_function(body)
+        self.memo.remember(key, value)
+        return value
+
+    def _recalled(self, value):
+        """Stands in for the body of a call whose result is remembered"""
+        return value
+        yield
+
+    def _run_procedure(self, body):
+        yield from self._run_block(body)
+        return None
+
+    def _traced_call(self, body, func_name):
+        line = self._trace_line
+        start = perf_counter()
+        try:
+            return (yield from body)
+        finally:
+            self.tracer.emit(line, 'call', perf_counter() - start, func_name)
     
+    def _profiled_call(self, body, kind, func_name):
+        self.profiler.start_call(kind, func_name)
+        try:
+            return (yield from body)
+        finally:
+            self.profiler.finish()
+
+    def _new_frame(self, scope, args):
+        """A frame for one call; costs the same however many globals exist"""
+        return Frame(scope, list(args) + [UNSET] * (len(scope.local_names) - len(args)))
+
     def _import_library(self, lib_name):
         """Import a Jules library"""
         if lib_name in self.libraries:
             return  # Already imported
         
-        # Check built-in libraries first
-        if lib_name == 'drawing':
-            try:
-                # Try to import the drawing module
-                from jules.libs import drawing
-                self.libraries['drawing'] = drawing.drawing_functions
-                return
-            except ImportError:
+        functions = load_library(lib_name)
+        if functions is not None:
+            self.symbols.add_library(lib_name, functions)
+        if self.tracer.level >= CALLS:
+            self.tracer.emit(self._trace_line, 'import', None, lib_name)
+
+
+def answers(inputs):
+    """Stands in for input(), giving out the answers in inputs one at a time"""
+    remaining = iter(inputs)
+
+    def read_answer(prompt):
+        for answer in remaining:
+            return str(answer)
+        raise Exception("The program asked for more answers than it was given")
+    return read_answer
+
+
+def loop_signal(signal):
+    """What a loop does after one pass of its body: (keep_going, signal to pass up)"""
+    if signal is None or signal is SKIP:
+        return True, None
+    if signal is STOP:
+        return False, None
+    return False, signal
+
+
+def mark_calls(statements):
+    """Note on every statement whether running it might call a Jules function"""
+    found = False
+    for statement in statements:
+        if statement.calls is None:
+            statement.calls = statement_calls(statement)
+        found = found or statement.calls
+    return found
+
+
+def statement_calls(statement):
+    if isinstance(statement, Call):
+        return True
+    if isinstance(statement, (Show, Assign)):
+        return text_calls_function(statement.expr)
+    if isinstance(statement, (AddItem, RemoveItem, SetField)):
+        return text_calls_function(statement.target) or text_calls_function(statement.expr)
+    if isinstance(statement, SetIndex):
+        return any(text_calls_function(text) for text in (statement.target, statement.index, statement.expr))
+    if isinstance(statement, Return):
+        return statement.expr is not None and text_calls_function(statement.expr)
+    if isinstance(statement, When):
+        conditions = any(text_calls_function(condition) for condition, _ in statement.branches)
+        bodies = [mark_calls(body) for _, body in statement.branches]
+        if statement.otherwise is not None:
+            bodies.append(mark_calls(statement.otherwise))
+        return conditions or any(bodies)
+    if isinstance(statement, RepeatTimes):
+        return mark_calls(statement.body) or text_calls_function(statement.count_expr)
+    if isinstance(statement, RepeatEach):
+        return mark_calls(statement.body) or text_calls_function(statement.list_expr)
+    if isinstance(statement, While):
+        return mark_calls(statement.body) or text_calls_function(statement.condition)
+    if isinstance(statement, Try):
+        found = mark_calls(statement.body)
+        if statement.catch_body is not None:
+            found = mark_calls(statement.catch_body) or found
+        return found
+    if isinstance(statement, (FunctionDef, ProcedureDef)):
+        # Defining doesn't call anything, but the body is marked for when it runs
+        mark_calls(statement.body)
+    return False
+
+
+def parse_ahead(code):
+    """Everything the front end makes of a program, ready to be cached
+
+    That's the statements, with whether each one calls anything already
+    noted, and the tree of every expression in them by its text.
+    """
+    statements = parse_program(code)
+    mark_calls(statements)
+    return statements, parse_expressions(statements)
+
+
+def parse_expressions(statements, parsed=None):
+    """The tree of every expression in a list of statements, by its text"""
+    if parsed is None:
+        parsed = {}
+    for statement in statements:
+        for text in expressions(statement):
+            if text not in parsed:
                 try:
-                    # For development, try relative path
-                    spec = importlib.util.spec_from_file_location("drawing", os.path.join("jules", "libs", "drawing.py"))
-                    drawing_module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(drawing_module)
-                    self.libraries['drawing'] = drawing_module.drawing_functions
-                    return
-                except Exception as e:
-                    print(f"Could not import drawing library: {e}")
-                    return
-        
-        # Custom libraries would be handled here
-        print(f"Library '{lib_name}' not found")
+                    parsed[text] = parse_expression(text)
+                except Exception:
+                    # It fails the same way when the program gets to it
+                    pass
+        for body in child_bodies(statement):
+            parse_expressions(body, parsed)
+    return parsed
 
 
-def run_file(filename):
-    """Run a Jules program from file"""
+def run_file(filename, tracer=None, output=None, recursion_limit=None, cache=True, profiler=None,
+             stats=None, budget=None):
+    """Run a Jules program from file, parsing it only if the cache can't help
+
+    Given a stream as stats, the interpreter counts the work it does and
+    writes stats() there as JSON at the end. Given a Budget, the program
+    stops with an error when it goes over.
+    """
+    if tracer is None:
+        tracer = make_tracer()
+    if output is None:
+        output = Output()
+    if recursion_limit is None:
+        recursion_limit = RECURSION_LIMIT
+    code = None
+    interpreter = None
     try:
         with open(filename, 'r') as file:
             code = file.read()
         
-        # Process the file line by line instead of using the interpreter directly
-        lines = code.split('\n')
-        interpreter = JulesInterpreter()
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Skip empty lines and comments
-            if not line or line.startswith('#'):
-                i += 1
-                continue
-            
-            # Function definition
-            if line.startswith('make'):
-                match = re.match(r'make\s+(\w+)\((.*?)\)', line)
-                if match:
-                    func_name = match.group(1)
-                    params = [p.strip() for p in match.group(2).split(',') if p.strip()]
-                    
-                    # Find the matching done
-                    depth = 1
-                    done_idx = i
-                    for j in range(i + 1, len(lines)):
-                        curr_line = lines[j].strip()
-                        if not curr_line or curr_line.startswith('#'):
-                            continue
-                        if curr_line.startswith(('when', 'repeat', 'make', 'do', 'try', 'while')):
-                            depth += 1
-                        elif curr_line == 'done':
-                            depth -= 1
-                            if depth == 0:
-                                done_idx = j
-                                break
-                    
-                    func_body = lines[i+1:done_idx]
-                    
-                    if DEBUG:
-                        print(f"DEBUG: Defining function {func_name} with parameters {params}")
-                    
-                    interpreter.functions[func_name] = {
-                        'params': params,
-                        'body': func_body
-                    }
-                    
-                    i = done_idx + 1  # Skip to after the 'done'
-                else:
-                    i += 1
-                continue
-            
-            # Execute a single line at a time
-            interpreter.parse_and_execute(line)
-            i += 1
-                
+        # Parse the whole file once, then walk the statement tree
+        interpreter = JulesInterpreter(tracer=tracer, output=output, recursion_limit=recursion_limit,
+                                       profiler=profiler, counters=Counters() if stats is not None else None,
+                                       budget=budget)
+        if cache:
+            statements, interpreter.expression_cache.parsed = cached(
+                filename, code, 'tree', lambda: parse_ahead(code))
+        else:
+            statements = parse_program(code)
+        interpreter.execute(statements)
     except FileNotFoundError:
         print(f"Could not find file: {filename}")
+    except JulesSyntaxError as e:
+        # Reported before any of the program has run
+        print(f"Oops! {e}")
     except Exception as e:
         print(f"An error occurred: {e}")
-        if DEBUG:
+        if tracer.enabled:
             import traceback
             traceback.print_exc()
+    finally:
+        output.close()
+        tracer.close()
+        if profiler is not None:
+            profiler.close(code)
+        if stats is not None and interpreter is not None:
+            json.dump(interpreter.stats(), stats, indent=2)
+            stats.write('\n')
 
 
-def run_interactive():
+def run_interactive(tracer=None):
     """Run Jules in interactive mode"""
     print("Jules Language Interactive Mode")
     print("Type 'exit' to quit")
     
-    interpreter = JulesInterpreter()
+    interpreter = JulesInterpreter(tracer=tracer if tracer is not None else make_tracer(),
+                                   output=Output(flush='line'))
     buffer = []
+    blocks = BlockTable()
     
     while True:
         try:
@@ -722,19 +990,28 @@ def run_interactive():
                 
             if line.lower() == 'exit':
                 break
-                
+            
+            # Track open blocks as lines arrive so we know when one is complete
+            try:
+                blocks.feed(len(buffer), clean_line(line))
+            except JulesSyntaxError as e:
+                print(f"Oops! {e}")
+                buffer = []
+                blocks = BlockTable()
+                continue
             buffer.append(line)
             
             # Execute when we have a complete block or a simple statement
-            if line == 'done' or (not any(line.startswith(kw) for kw in ['when', 'repeat', 'make', 'do', 'try', 'while']) and not buffer[-2:-1] == ['then']):
+            if blocks.is_complete:
                 code = '\n'.join(buffer)
                 try:
-                    result = interpreter.parse_and_execute(code)
+                    result = interpreter.execute(JulesParser(code, blocks).parse())
                     if result is not None and not buffer[-1].startswith('show'):
                         print(result)
                 except Exception as e:
                     print(f"Oops! Something went wrong: {e}")
                 buffer = []
+                blocks = BlockTable()
                 
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Jules Libraries
+
+Every library 'get' can load is listed in LIBRARY_MANIFEST with the names
+of its functions. 'get' only registers those names; the library's Python
+module (and whatever it imports, like turtle and Tk for drawing) is loaded
+the first time the program calls one of them.
+
+Library modules live in the libs package next to core, and are found from
+there rather than from the current directory.
+"""
+
+import importlib
+import sys
+from collections import namedtuple
+
+LibraryInfo = namedtuple('LibraryInfo', ['module', 'exports', 'functions'])
+
+LIBRARY_MANIFEST = {
+    'drawing': LibraryInfo('drawing', 'drawing_functions', (
+        'create_turtle', 'move_forward', 'move_backward', 'turn_right', 'turn_left',
+        'pen_up', 'pen_down', 'set_pen_color', 'set_fill_color', 'set_speed',
+        'begin_fill', 'end_fill', 'clear_screen', 'hide_turtle', 'show_turtle',
+        'goto', 'set_pen_size', 'draw_circle', 'write_text', 'setup', 'title', 'done',
+        'begin_frame', 'end_frame', 'set_frame_rate',
+        'draw_polyline', 'draw_polygon', 'draw_regular_polygon', 'stamp_many',
+    )),
+}
+
+
+def libs_package():
+    """The name the libs package is imported under, next to this core package"""
+    parent = __package__.rpartition('.')[0]
+    return f"{parent}.libs" if parent else 'libs'
+
+
+class LazyLibrary:
+    """A library whose module is imported when one of its functions is first called"""
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self._exports = None
+
+    def exports(self):
+        """The library's real functions by name, importing its module if needed"""
+        if self._exports is None:
+            try:
+                module = importlib.import_module(f"{libs_package()}.{self.info.module}")
+            except Exception as e:
+                raise Exception(f"Could not import {self.name} library: {e}")
+            self._exports = getattr(module, self.info.exports)
+        return self._exports
+
+    def functions(self):
+        """A stand-in for each function, to register with a symbol table"""
+        return {name: self._stand_in(name) for name in self.info.functions}
+
+    def _stand_in(self, name):
+        def call(*args):
+            return self.exports()[name](*args)
+        call.__name__ = name
+        call.__qualname__ = f"{self.name}.{name}"
+        return call
+
+
+# Each library's functions, made once and shared by every interpreter
+_loaded = {}
+
+
+def load_library(lib_name):
+    """The functions a Jules library exports, by name, or None if there's no such library
+
+    The same dict comes back every time, so it mustn't be changed.
+    """
+    functions = _loaded.get(lib_name)
+    if functions is not None:
+        return functions
+    info = LIBRARY_MANIFEST.get(lib_name)
+    if info is None:
+        print(f"Library '{lib_name}' not found")
+        return None
+    return _loaded.setdefault(lib_name, LazyLibrary(lib_name, info).functions())
+
+
+def preload_libraries():
+    """Import every library's module now, for a long-running process that will use them"""
+    for lib_name, info in LIBRARY_MANIFEST.items():
+        LazyLibrary(lib_name, info).exports()
+
+
+def library_module(lib_name):
+    """A library's Python module if it has been imported, else None"""
+    info = LIBRARY_MANIFEST.get(lib_name)
+    if info is None:
+        return None
+    return sys.modules.get(f"{libs_package()}.{info.module}")
+
+
+def reset_libraries(save_files=True):
+    """Put every library back as it was before any program used it
+
+    Every library's module is imported, if it isn't already, so what's set
+    here holds for the next program however it uses them. save_files says
+    whether libraries may write files, like the SVG drawing's done() does.
+    """
+    for lib_name, info in LIBRARY_MANIFEST.items():
+        LazyLibrary(lib_name, info).exports()
+        reset = getattr(library_module(lib_name), 'reset', None)
+        if reset is not None:
+            reset(save_files)
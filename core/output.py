@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Jules Output
+
+Where 'show' writes. Shown values are collected in a buffer and written to
+the destination in blocks, flushed according to a policy:
+
+    'line'  after every show
+    'size'  once the buffer holds buffer_size characters
+    'exit'  only when the program finishes
+
+Whatever the policy, the buffer is flushed before 'ask', so a prompt always
+appears after everything shown before it.
+
+While a program runs, anything else printed joins its output too. Programs
+running in different threads each keep what they print to themselves.
+"""
+
+import io
+import sys
+import threading
+from contextlib import contextmanager
+
+FLUSH_POLICIES = ('line', 'size', 'exit')
+
+# How much a 'size' buffer holds before it is written out
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+# The Output each thread's running program shows on, if any
+_running = threading.local()
+
+
+class StandardOutput:
+    """Stands in for sys.stdout while programs run, passing each thread's prints to its program's Output"""
+    _lock = threading.Lock()
+    _installed = None
+
+    def __init__(self, stdout):
+        self.stdout = stdout  # the real one, put back when no program is running
+        self.users = 0
+
+    @classmethod
+    def install(cls):
+        with cls._lock:
+            if cls._installed is None:
+                cls._installed = cls(sys.stdout)
+                sys.stdout = cls._installed
+            cls._installed.users += 1
+
+    @classmethod
+    def uninstall(cls):
+        with cls._lock:
+            installed = cls._installed
+            installed.users -= 1
+            if not installed.users:
+                if sys.stdout is installed:
+                    sys.stdout = installed.stdout
+                cls._installed = None
+
+    def write(self, text):
+        output = getattr(_running, 'output', None)
+        return (self.stdout if output is None else output).write(text)
+
+    def flush(self):
+        output = getattr(_running, 'output', None)
+        (self.stdout if output is None else output).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+
+def real_stdout():
+    """sys.stdout, or what it was before StandardOutput stood in for it"""
+    stdout = sys.stdout
+    return stdout.stdout if isinstance(stdout, StandardOutput) else stdout
+
+
+class Output:
+    """A buffered destination for everything a Jules program shows"""
+    def __init__(self, destination=None, flush=None, buffer_size=OUTPUT_BUFFER_SIZE, owned=False):
+        if flush is None:
+            # Someone watching a terminal should see each line as it's shown
+            flush = 'line' if sys.stdout.isatty() else 'size'
+        if flush not in FLUSH_POLICIES:
+            raise ValueError(f"Unknown flush policy '{flush}' (choose from {', '.join(FLUSH_POLICIES)})")
+        self.destination = destination  # None means standard output
+        self.policy = flush
+        self.owned = owned
+        self._limit = {'line': 0, 'size': buffer_size, 'exit': float('inf')}[flush]
+        self._parts = []
+        self._size = 0
+
+    @classmethod
+    def to_file(cls, path, flush='size', buffer_size=OUTPUT_BUFFER_SIZE):
+        """Write everything shown to a file"""
+        return cls(open(path, 'w'), flush, buffer_size, owned=True)
+
+    @classmethod
+    def capture(cls):
+        """Keep everything shown in memory; read it back with getvalue()"""
+        return cls(io.StringIO(), 'exit')
+
+    def show(self, value):
+        text = str(value)
+        self._parts.append(text)
+        self._parts.append('\n')
+        self._size += len(text) + 1
+        if self._size > self._limit:
+            self.flush()
+
+    def write(self, text):
+        """Take text printed by anything else while a program runs"""
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size > self._limit:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        destination = self.destination
+        if destination is None:
+            destination = real_stdout()
+        if self._parts:
+            destination.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+        destination.flush()
+
+    @contextmanager
+    def active(self):
+        """While a program runs, let other prints join the buffer so order is kept"""
+        previous = getattr(_running, 'output', None)
+        if (self.policy == 'line' and self.destination is None) or previous is self:
+            # Nothing is held back, or this program is already running
+            yield self
+            return
+        _running.output = self
+        StandardOutput.install()
+        try:
+            yield self
+        finally:
+            _running.output = previous
+            StandardOutput.uninstall()
+            self.flush()
+
+    def getvalue(self):
+        """Everything shown so far, for an in-memory capture"""
+        self.flush()
+        return self.destination.getvalue()
+
+    def close(self):
+        self.flush()
+        if self.owned:
+            self.destination.close()
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Jules Parser
+
+Turns Jules source code into a tree of statements. The interpreter walks this
+tree instead of re-reading the source text every time a block runs.
+"""
+
+import re
+
+from .symbols import CallSite
+
+# Keywords that open a block which is closed by 'done'
+BLOCK_KEYWORDS = ('when', 'repeat', 'make', 'do', 'try', 'while')
+
+WORD_PATTERN = re.compile(r'\w+')
+REPEAT_EACH_PATTERN = re.compile(r'repeat\s+each\s+(\w+)\s+in\s+(.+)$')
+REPEAT_TIMES_PATTERN = re.compile(r'repeat\s+(.+?)\s+times$')
+WHEN_PATTERN = re.compile(r'(?:otherwise\s+)?when\s+(.+?)(?:\s+then)?$')
+ASK_PATTERN = re.compile(r'ask\s+"([^"]*)"\s+into\s+(\w+)$')
+DEFINITION_PATTERN = re.compile(r'(?:make|do)\s+(?:(pure)\s+)?(\w+)\s*\((.*?)\)$')
+CALL_PATTERN = re.compile(r'(\w+)\s*\((.*)\)$')
+CALL_INTO_PATTERN = re.compile(r'(\w+)\s*\((.*)\)\s+into\s+(\w+)$')
+# 'add is 5' assigns a variable called add rather than adding to a list
+ASSIGN_PATTERN = re.compile(r'\w+\s+is\s')
+
+
+class Statement:
+    """Base class for every statement in the tree"""
+    # Whether running it might call a Jules function; the interpreter fills this in
+    calls = None
+
+    def __init__(self, line):
+        self.line = line  # 1-based line number in the source
+
+    def __repr__(self):
+        fields = ', '.join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"{type(self).__name__}({fields})"
+
+
+class Show(Statement):
+    """show <expression>"""
+    def __init__(self, line, expr):
+        super().__init__(line)
+        self.expr = expr
+
+
+class Assign(Statement):
+    """<name> is <expression>"""
+    def __init__(self, line, target, expr):
+        super().__init__(line)
+        self.target = target
+        self.expr = expr
+
+
+class When(Statement):
+    """when/otherwise when/otherwise/done"""
+    def __init__(self, line, branches, otherwise):
+        super().__init__(line)
+        self.branches = branches  # list of (condition, body) pairs
+        self.otherwise = otherwise  # body list, or None when there is no otherwise
+
+
+class RepeatTimes(Statement):
+    """repeat <count> times"""
+    def __init__(self, line, count_expr, body):
+        super().__init__(line)
+        self.count_expr = count_expr
+        self.body = body
+
+
+class RepeatEach(Statement):
+    """repeat each <item> in <list>"""
+    def __init__(self, line, item_name, list_expr, body):
+        super().__init__(line)
+        self.item_name = item_name
+        self.list_expr = list_expr
+        self.body = body
+
+
+class While(Statement):
+    """while <condition>"""
+    def __init__(self, line, condition, body):
+        super().__init__(line)
+        self.condition = condition
+        self.body = body
+
+
+class AddItem(Statement):
+    """add <expression> to <list>"""
+    def __init__(self, line, expr, target):
+        super().__init__(line)
+        self.expr = expr
+        self.target = target
+
+
+class SetIndex(Statement):
+    """set <list or thing>[<position>] to <expression>"""
+    def __init__(self, line, target, index, expr):
+        super().__init__(line)
+        self.target = target
+        self.index = index
+        self.expr = expr
+
+
+class SetField(Statement):
+    """set <thing>.<field> to <expression>"""
+    def __init__(self, line, target, field, expr):
+        super().__init__(line)
+        self.target = target
+        self.field = field
+        self.expr = expr
+
+
+class RemoveItem(Statement):
+    """remove <expression> from <list or thing>"""
+    def __init__(self, line, expr, target):
+        super().__init__(line)
+        self.expr = expr
+        self.target = target
+
+
+class Ask(Statement):
+    """ask "<prompt>" into <name>"""
+    def __init__(self, line, prompt, var_name):
+        super().__init__(line)
+        self.prompt = prompt
+        self.var_name = var_name
+
+
+class FunctionDef(Statement):
+    """make [pure] <name>(<params>)"""
+    def __init__(self, line, name, params, body, pure=False):
+        super().__init__(line)
+        self.name = name
+        self.params = params
+        self.body = body
+        self.pure = pure
+        self.callees = frozenset()  # names a pure function calls, found by the purity check
+
+
+class ProcedureDef(Statement):
+    """do <name>(<params>)"""
+    def __init__(self, line, name, params, body):
+        super().__init__(line)
+        self.name = name
+        self.params = params
+        self.body = body
+
+
+class Import(Statement):
+    """get <library>"""
+    def __init__(self, line, lib_name):
+        super().__init__(line)
+        self.lib_name = lib_name
+
+
+class Call(Statement):
+    """<name>(<args>) with an optional 'into <name>'"""
+    def __init__(self, line, name, args, into=None):
+        super().__init__(line)
+        self.name = name
+        self.args = args  # list of argument expressions
+        self.into = into
+        # Remembers what the name resolved to last time this call ran
+        self.site = CallSite(name)
+
+
+class Return(Statement):
+    """return [<expression>]"""
+    def __init__(self, line, expr):
+        super().__init__(line)
+        self.expr = expr  # None for a bare 'return'
+
+
+class Try(Statement):
+    """try/catch/done"""
+    def __init__(self, line, body, catch_body):
+        super().__init__(line)
+        self.body = body
+        self.catch_body = catch_body  # None when there is no catch
+
+
+class Stop(Statement):
+    """stop - leave the current loop"""
+
+
+class Skip(Statement):
+    """skip - go to the next loop iteration"""
+
+
+def child_bodies(statement):
+    """The statement lists nested directly inside a statement"""
+    if isinstance(statement, When):
+        bodies = [body for _, body in statement.branches]
+        if statement.otherwise is not None:
+            bodies.append(statement.otherwise)
+        return bodies
+    if isinstance(statement, Try):
+        return [body for body in (statement.body, statement.catch_body) if body is not None]
+    if isinstance(statement, (RepeatTimes, RepeatEach, While, FunctionDef, ProcedureDef)):
+        return [statement.body]
+    return []
+
+
+class JulesSyntaxError(Exception):
+    """Raised when a line of Jules code can't be understood"""
+    def __init__(self, message, line=None):
+        if line is not None:
+            message = f"Line {line}: {message}"
+        super().__init__(message)
+        self.line = line
+
+
+def strip_comment(line):
+    """Remove a trailing # comment, ignoring any # inside a text literal"""
+    if '#' not in line:
+        return line
+    in_text = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_text = not in_text
+        elif char == '#' and not in_text:
+            return line[:index]
+    return line
+
+
+def split_arguments(text):
+    """Split a comma separated argument list, respecting brackets and text"""
+    args = []
+    depth = 0
+    in_text = False
+    start = 0
+    for index, char in enumerate(text):
+        if char == '"':
+            in_text = not in_text
+        elif in_text:
+            continue
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(text[start:index].strip())
+            start = index + 1
+    args.append(text[start:].strip())
+    return [arg for arg in args if arg]
+
+
+def outside_brackets(text):
+    """Yield (index, char) for each character not inside text or brackets
+
+    The opening and closing brackets of a top level group are included.
+    """
+    depth = 0
+    in_text = False
+    for index, char in enumerate(text):
+        if char == '"':
+            in_text = not in_text
+        elif in_text:
+            continue
+        elif char in '([{':
+            if depth == 0:
+                yield index, char
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+            if depth == 0:
+                yield index, char
+        elif depth == 0:
+            yield index, char
+
+
+def find_word(text, word, last=False):
+    """Where ' word ' first (or last) appears outside text and brackets, or -1"""
+    found = -1
+    separator = f" {word} "
+    for index, char in outside_brackets(text):
+        if char == ' ' and text.startswith(separator, index):
+            if not last:
+                return index
+            found = index
+    return found
+
+
+def split_target(text):
+    """Split 'list[position]' into (list, position, None), or 'thing.field' into (thing, None, field)
+
+    Returns None when the text is neither.
+    """
+    text = text.strip()
+    opening = dot = -1
+    for index, char in outside_brackets(text):
+        if char == '[':
+            opening = index
+        elif char == '.':
+            dot = index
+    if opening > dot and text.endswith(']'):
+        container, index = text[:opening].strip(), text[opening + 1:-1].strip()
+        if container and index:
+            return container, index, None
+    elif dot > opening:
+        container, field = text[:dot].strip(), text[dot + 1:].strip()
+        if container and field.isidentifier():
+            return container, None, field
+    return None
+
+
+def first_word(line):
+    """Return the leading keyword of a line"""
+    match = WORD_PATTERN.match(line)
+    return match.group(0) if match else ''
+
+
+def opens_block(line):
+    """Check whether a line starts a block that needs a matching 'done'"""
+    keyword = first_word(line)
+    return keyword in BLOCK_KEYWORDS and (keyword != 'do' or line.startswith('do '))
+
+
+class BlockTable:
+    """Index of where every block starts, branches and ends
+
+    Built in a single pass over the source, so finding the 'done',
+    'otherwise' or 'catch' of a block is a dictionary lookup.
+    """
+    def __init__(self):
+        self.done = {}      # opener line index -> matching 'done' index
+        self.branches = {}  # 'when' line index -> 'otherwise' line indexes
+        self.catch = {}     # 'try' line index -> 'catch' line index
+        self.open_blocks = []  # (line index, keyword) still waiting for 'done'
+
+    @property
+    def is_complete(self):
+        """True when every block seen so far has been closed"""
+        return not self.open_blocks
+
+    def feed(self, index, line):
+        """Record one cleaned source line"""
+        if not line:
+            return
+        if opens_block(line):
+            keyword = first_word(line)
+            self.open_blocks.append((index, keyword))
+            if keyword == 'when':
+                self.branches[index] = []
+        elif line == 'done':
+            if not self.open_blocks:
+                raise JulesSyntaxError("'done' has no block to close", index + 1)
+            opener, _ = self.open_blocks.pop()
+            self.done[opener] = index
+        elif line == 'otherwise' or line.startswith('otherwise when'):
+            if not self.open_blocks or self.open_blocks[-1][1] != 'when':
+                raise JulesSyntaxError("'otherwise' needs to be inside a when block", index + 1)
+            self.branches[self.open_blocks[-1][0]].append(index)
+        elif line == 'catch':
+            if not self.open_blocks or self.open_blocks[-1][1] != 'try':
+                raise JulesSyntaxError("'catch' needs to be inside a try block", index + 1)
+            self.catch.setdefault(self.open_blocks[-1][0], index)
+
+    def check_complete(self):
+        """Complain about the innermost block that never got its 'done'"""
+        if self.open_blocks:
+            index, keyword = self.open_blocks[-1]
+            raise JulesSyntaxError(f"this '{keyword}' block is missing its 'done'", index + 1)
+
+
+def clean_line(line):
+    """Strip comments and surrounding whitespace from a source line"""
+    return strip_comment(line).strip()
+
+
+def build_block_table(lines):
+    """Match every block opener with its branches and 'done' in one pass"""
+    table = BlockTable()
+    for index, line in enumerate(lines):
+        table.feed(index, line)
+    table.check_complete()
+    return table
+
+
+class JulesParser:
+    """Builds a statement tree from Jules source code"""
+    def __init__(self, code, table=None):
+        self.lines = [clean_line(line) for line in code.split('\n')]
+        # A caller that already scanned the lines (like the REPL) can hand
+        # its table over instead of scanning them again
+        self.table = table if table is not None else build_block_table(self.lines)
+
+    def parse(self):
+        """Parse the whole program into a list of statements"""
+        statements = self._parse_block(0, len(self.lines))
+        # Imported here because the purity check needs the expression parser, which needs this module
+        from .purity import check_pure_functions
+        check_pure_functions(statements)
+        return statements
+
+    def _parse_block(self, start, end):
+        """Parse the lines in [start, end) into a list of statements"""
+        statements = []
+        i = start
+        while i < end:
+            line = self.lines[i]
+            if not line:
+                i += 1
+                continue
+
+            keyword = first_word(line)
+            if opens_block(line):
+                done_idx = self.table.done[i]
+                statements.append(self._parse_compound(keyword, i, done_idx))
+                i = done_idx + 1
+            else:
+                statements.append(self._parse_simple(keyword, line, i + 1))
+                i += 1
+        return statements
+
+    def _parse_simple(self, keyword, line, line_no):
+        """Parse a statement that fits on a single line"""
+        if keyword == 'show':
+            return Show(line_no, line[4:].strip())
+
+        if keyword == 'ask':
+            match = ASK_PATTERN.match(line)
+            if not match:
+                raise JulesSyntaxError('ask should look like: ask "question" into name', line_no)
+            return Ask(line_no, match.group(1), match.group(2))
+
+        if keyword == 'get':
+            return Import(line_no, line[3:].strip())
+
+        if keyword == 'return':
+            expr = line[6:].strip()
+            return Return(line_no, expr or None)
+
+        if keyword in ('add', 'set', 'remove') and not ASSIGN_PATTERN.match(line):
+            statement = self._parse_change(keyword, line, line_no)
+            if statement is not None:
+                return statement
+
+        if line == 'stop':
+            return Stop(line_no)
+
+        if line == 'skip':
+            return Skip(line_no)
+
+        match = CALL_INTO_PATTERN.match(line)
+        if match:
+            return Call(line_no, match.group(1), split_arguments(match.group(2)), match.group(3))
+
+        match = CALL_PATTERN.match(line)
+        if match:
+            return Call(line_no, match.group(1), split_arguments(match.group(2)))
+
+        if ' is ' in line:
+            target, expr = line.split(' is ', 1)
+            target = target.strip()
+            if not target.isidentifier() and split_target(target) is not None:
+                # 'contact.name is x' changes the thing, like 'set contact.name to x'
+                return self._parse_set(target, expr.strip(), line_no)
+            return Assign(line_no, target, expr.strip())
+
+        raise JulesSyntaxError(f"I don't understand '{line}'", line_no)
+
+    def _parse_change(self, keyword, line, line_no):
+        """Parse add/set/remove, or return None if the line is something else"""
+        if keyword == 'add':
+            split = find_word(line, 'to', last=True)
+            if split > len('add'):
+                return AddItem(line_no, line[3:split].strip(), line[split + 4:].strip())
+        elif keyword == 'remove':
+            split = find_word(line, 'from', last=True)
+            if split > len('remove'):
+                return RemoveItem(line_no, line[6:split].strip(), line[split + 6:].strip())
+        else:
+            split = find_word(line, 'to')
+            if split > len('set'):
+                return self._parse_set(line[3:split].strip(), line[split + 4:].strip(), line_no)
+        return None
+
+    def _parse_set(self, target, expr, line_no):
+        parts = split_target(target)
+        if parts is None:
+            raise JulesSyntaxError("set should look like 'set list[position] to value' "
+                                   "or 'set thing.field to value'", line_no)
+        container, index, field = parts
+        if field is None:
+            return SetIndex(line_no, container, index, expr)
+        return SetField(line_no, container, field, expr)
+
+    def _parse_compound(self, keyword, start, done_idx):
+        """Parse a block statement spanning [start, done_idx]"""
+        line = self.lines[start]
+        line_no = start + 1
+
+        if keyword == 'when':
+            return self._parse_when(start, done_idx)
+
+        if keyword == 'repeat':
+            match = REPEAT_EACH_PATTERN.match(line)
+            if match:
+                body = self._parse_block(start + 1, done_idx)
+                return RepeatEach(line_no, match.group(1), match.group(2).strip(), body)
+            match = REPEAT_TIMES_PATTERN.match(line)
+            if match:
+                body = self._parse_block(start + 1, done_idx)
+                return RepeatTimes(line_no, match.group(1), body)
+            raise JulesSyntaxError("repeat should be 'repeat 5 times' or 'repeat each item in list'", line_no)
+
+        if keyword == 'while':
+            condition = line[5:].strip()
+            return While(line_no, condition, self._parse_block(start + 1, done_idx))
+
+        if keyword in ('make', 'do'):
+            match = DEFINITION_PATTERN.match(line)
+            if not match:
+                raise JulesSyntaxError(f"{keyword} should look like: {keyword} name(param1, param2)", line_no)
+            pure, name = match.group(1) is not None, match.group(2)
+            params = [p.strip() for p in match.group(3).split(',') if p.strip()]
+            body = self._parse_block(start + 1, done_idx)
+            if keyword == 'make':
+                return FunctionDef(line_no, name, params, body, pure)
+            if pure:
+                raise JulesSyntaxError("only functions can be pure: use 'make pure name(...)'", line_no)
+            return ProcedureDef(line_no, name, params, body)
+
+        # try/catch
+        catch_idx = self.table.catch.get(start)
+        if catch_idx is None:
+            return Try(line_no, self._parse_block(start + 1, done_idx), None)
+        return Try(line_no, self._parse_block(start + 1, catch_idx),
+                   self._parse_block(catch_idx + 1, done_idx))
+
+    def _parse_when(self, start, done_idx):
+        """Parse a when block together with all of its otherwise branches"""
+        branches = []
+        otherwise = None
+        branch_start = start
+        for branch_end in self.table.branches[start] + [done_idx]:
+            header = self.lines[branch_start]
+            body = self._parse_block(branch_start + 1, branch_end)
+            if header == 'otherwise':
+                otherwise = body
+            else:
+                match = WHEN_PATTERN.match(header)
+                if not match:
+                    raise JulesSyntaxError("when should look like: when condition then", branch_start + 1)
+                branches.append((match.group(1), body))
+            branch_start = branch_end
+        return When(start + 1, branches, otherwise)
+
+
+def parse_program(code):
+    """Parse Jules source code into a list of statements"""
+    return JulesParser(code).parse()
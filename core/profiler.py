@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Jules Profiler
+
+Where a Jules program spends its time, by source line and by function.
+For every line and every function, procedure, library or built-in call it
+keeps the number of hits, the total time (including everything it ran)
+and the self time (excluding the lines and calls inside it). Calls to pure
+functions answered from the memo cache are hits that take no time, and the
+report says how many of a function's calls they were.
+
+Profiling is switched on with 'jules --profile'. The report is printed to
+stderr when the program ends, and --profile-stacks writes the time as
+collapsed stacks, the input format of flamegraph.pl and speedscope.
+
+Like tracing, it costs nothing when off: the interpreter swaps in its
+profiled code paths only when given a Profiler.
+"""
+
+import sys
+from collections import defaultdict
+from time import perf_counter
+
+# How many lines and functions the report lists
+PROFILE_REPORT_SIZE = 20
+
+# The name of the outermost stack frame, for the program's own top level
+PROGRAM = '<program>'
+
+# Indexes into a record: [hits, total seconds, self seconds, how many are running, remembered hits]
+HITS, TOTAL, SELF, ACTIVE, REMEMBERED = range(5)
+
+
+class Profiler:
+    """Collects hit counts and times while an interpreter runs
+
+    Call stacks are only kept when stacks_path names a file to save them in.
+    """
+    def __init__(self, stream=None, stacks_path=None, clock=perf_counter):
+        self.stream = stream if stream is not None else sys.stderr
+        self.stacks_path = stacks_path
+        self.clock = clock
+        self.lines = {}      # line number -> record
+        self.functions = {}  # (kind, name) -> record
+        self.stacks = defaultdict(float)  # 'a;b;c' -> self seconds
+        # [record, start, time in children, stack path, caller's stack path] per running line or call
+        self._running = []
+        self._path = PROGRAM if stacks_path is not None else None
+        self.started = clock()
+        self.elapsed = None
+
+    def start_line(self, line):
+        record = self.lines.get(line)
+        if record is None:
+            record = self.lines[line] = [0, 0.0, 0.0, 0, 0]
+        record[HITS] += 1
+        record[ACTIVE] += 1
+        path = self._path
+        self._running.append([record, self.clock(), 0.0, path, path])
+
+    def _function(self, kind, name):
+        key = (kind, name)
+        record = self.functions.get(key)
+        if record is None:
+            record = self.functions[key] = [0, 0.0, 0.0, 0, 0]
+        return record
+
+    def start_call(self, kind, name):
+        record = self._function(kind, name)
+        record[HITS] += 1
+        record[ACTIVE] += 1
+        caller = self._path
+        if caller is not None:
+            self._path = f"{caller};{name}"
+        self._running.append([record, self.clock(), 0.0, self._path, caller])
+
+    def remembered_call(self, kind, name):
+        """Count a call whose result came from the memo cache, so it ran nothing"""
+        record = self._function(kind, name)
+        record[HITS] += 1
+        record[REMEMBERED] += 1
+
+    def finish(self):
+        """End the line or call started last"""
+        record, start, children, path, caller = self._running.pop()
+        elapsed = self.clock() - start
+        own = elapsed - children
+        record[SELF] += own
+        record[ACTIVE] -= 1
+        if not record[ACTIVE]:
+            # A recursive call's time is already inside the outermost one's
+            record[TOTAL] += elapsed
+        if self._running:
+            self._running[-1][2] += elapsed
+        if path is not None:
+            self.stacks[path] += own
+        self._path = caller
+
+    def stop(self):
+        """Note the end of the program, finishing anything an error left running"""
+        while self._running:
+            self.finish()
+        if self.elapsed is None:
+            self.elapsed = self.clock() - self.started
+
+    def close(self, source=None):
+        """Stop, then print the report and save the call stacks if asked to"""
+        self.stop()
+        print(self.report(source), file=self.stream)
+        if self.stacks_path is not None:
+            self.write_stacks(self.stacks_path)
+
+    def report(self, source=None, limit=PROFILE_REPORT_SIZE):
+        """The slowest lines and functions by self time, as text"""
+        elapsed = self.elapsed if self.elapsed is not None else self.clock() - self.started
+        source_lines = source.splitlines() if source is not None else []
+        lines = [f"Profile: {elapsed * 1000:.1f}ms in total",
+                 '',
+                 f"{'line':>6} {'hits':>9} {'total ms':>10} {'self ms':>10}  source"]
+        by_self = sorted(self.lines.items(), key=lambda item: item[1][SELF], reverse=True)
+        for line, record in by_self[:limit]:
+            text = source_lines[line - 1].strip() if 0 < line <= len(source_lines) else ''
+            lines.append(f"{line:>6} {record[HITS]:>9} {record[TOTAL] * 1000:>10.2f} "
+                         f"{record[SELF] * 1000:>10.2f}  {text}")
+        if self.functions:
+            lines += ['', f"{'calls':>9} {'total ms':>10} {'self ms':>10}  name"]
+            by_self = sorted(self.functions.items(), key=lambda item: item[1][SELF], reverse=True)
+            for (kind, name), record in by_self[:limit]:
+                about = f"{kind}, {record[REMEMBERED]} remembered" if record[REMEMBERED] else kind
+                lines.append(f"{record[HITS]:>9} {record[TOTAL] * 1000:>10.2f} "
+                             f"{record[SELF] * 1000:>10.2f}  {name} ({about})")
+        return '\n'.join(lines)
+
+    def write_stacks(self, path):
+        """Save self time by call stack, one 'a;b;c microseconds' line each"""
+        with open(path, 'w') as file:
+            for stack, seconds in sorted(self.stacks.items()):
+                microseconds = round(seconds * 1e6)
+                if microseconds > 0:
+                    file.write(f"{stack} {microseconds}\n")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Jules Programs
+
+A program parsed once and run as often as needed, for services that embed
+Jules and run the same few programs again and again:
+
+    import jules
+    program = jules.compile(source)
+    shown = program.run(inputs=['Ada', 12])
+
+compile() does all the parsing: the statements, what each one calls, and
+the tree of every expression. A run only makes a fresh interpreter, so its
+variables, functions and caches are its own and runs never see each other.
+A Program never changes once made, so threads can share one. Libraries
+are loaded once per process and shared by every run.
+"""
+
+from types import MappingProxyType
+
+from .interpreter import JulesInterpreter, parse_ahead
+from .output import Output
+from .runtime import RECURSION_LIMIT
+
+
+class Program:
+    """A compiled Jules program; made by compile()"""
+    __slots__ = ('source', 'filename', '_statements', '_parsed')
+
+    def __init__(self, source, statements, parsed, filename=None):
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, 'filename', filename)
+        object.__setattr__(self, '_statements', statements)
+        object.__setattr__(self, '_parsed', MappingProxyType(parsed))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a compiled Jules program can't be changed")
+
+    def __delattr__(self, name):
+        raise AttributeError("a compiled Jules program can't be changed")
+
+    def run(self, inputs=None, output=None, recursion_limit=RECURSION_LIMIT, counters=None, budget=None):
+        """Run the program from the start, with nothing left over from other runs
+
+        inputs are the answers to give 'ask', in order; without them 'ask'
+        reads from the keyboard. What the program shows goes to output, an
+        Output, or is captured and returned as a string if there's none.
+        Errors in the program are raised, as they'd stop it, and so is
+        BudgetExceeded if it goes over a Budget it was given.
+        """
+        capturing = output is None
+        if capturing:
+            output = Output.capture()
+        interpreter = JulesInterpreter(output=output, recursion_limit=recursion_limit, counters=counters,
+                                       inputs=inputs, budget=budget)
+        interpreter.expression_cache.parsed = self._parsed
+        try:
+            interpreter.execute(self._statements, marked=True)
+        finally:
+            output.flush()
+        if capturing:
+            return output.getvalue()
+        return None
+
+    def __repr__(self):
+        if self.filename is not None:
+            return f"<Jules program from {self.filename}>"
+        return f"<Jules program, {len(self.source.splitlines())} lines>"
+
+
+def compile(source, filename=None):
+    """Parse Jules source into a Program; raises JulesSyntaxError if it can't be understood"""
+    statements, parsed = parse_ahead(source)
+    return Program(source, statements, parsed, filename)
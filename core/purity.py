@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Jules Pure Functions
+
+A function made with 'make pure' promises that its result depends only on
+its arguments, so every engine may remember results instead of running the
+body again. The promise is checked when the program is parsed: a pure
+function may not show, ask, get a library, make other functions, or use a
+variable that isn't one of its own. Calls are checked when it first runs,
+once the names it calls mean something: each one has to be another pure
+function or a pure built-in.
+
+Remembered results live in a bounded MemoCache shared by all of a program's
+pure functions. It forgets everything whenever a definition or import could
+change what a name means.
+"""
+
+import copy
+from collections import OrderedDict, namedtuple
+
+from .parser import (
+    JulesSyntaxError, Show, Assign, When, RepeatTimes, RepeatEach, While, Ask,
+    FunctionDef, ProcedureDef, Import, Call, Return, AddItem, SetIndex, SetField, RemoveItem,
+    child_bodies
+)
+from .expressions import (
+    parse_expression, Name, BinaryOp, And, Or, Not, Negate, CallExpr,
+    Index, Field, ListExpr, ThingExpr
+)
+from .compiler import find_local_names
+from .runtime import NumberList, Thing
+
+# How many results a MemoCache remembers by default
+MEMO_CACHE_SIZE = 4096
+
+# What a MemoCache hands back when it doesn't remember a call
+FORGOTTEN = object()
+
+MemoInfo = namedtuple('MemoInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+# Statements a pure function can't contain, and why
+FORBIDDEN = {
+    Show: "can't show anything",
+    Ask: "can't ask for input",
+    Import: "can't get a library",
+    FunctionDef: "can't make other functions",
+    ProcedureDef: "can't make procedures",
+}
+
+
+def check_pure_functions(statements):
+    """Check every 'make pure' in a program, noting on each the names it calls"""
+    for statement in statements:
+        if isinstance(statement, FunctionDef) and statement.pure:
+            statement.callees = check_pure(statement)
+        for body in child_bodies(statement):
+            check_pure_functions(body)
+
+
+def check_pure(definition):
+    """The names a pure function calls; raises JulesSyntaxError if it can't be pure"""
+    local_names = set(find_local_names(definition.params, definition.body))
+    callees = set()
+
+    def fail(line, reason):
+        raise JulesSyntaxError(f"'{definition.name}' is made pure, so it {reason}", line)
+
+    def visit_expression(text, line):
+        for node in walk(parse_expression(text)):
+            if isinstance(node, Name) and node.name not in local_names:
+                fail(line, f"can't use '{node.name}', which isn't one of its own variables")
+            if isinstance(node, CallExpr):
+                callees.add(node.name)
+
+    def visit(statements):
+        for statement in statements:
+            reason = FORBIDDEN.get(type(statement))
+            if reason is not None:
+                fail(statement.line, reason)
+            if isinstance(statement, Call):
+                callees.add(statement.name)
+            for text in expressions(statement):
+                visit_expression(text, statement.line)
+            for body in child_bodies(statement):
+                visit(body)
+
+    visit(definition.body)
+    return frozenset(callees)
+
+
+def expressions(statement):
+    """The expression texts a statement evaluates"""
+    if isinstance(statement, (Show, Assign)):
+        return [statement.expr]
+    if isinstance(statement, Return):
+        return [] if statement.expr is None else [statement.expr]
+    if isinstance(statement, When):
+        return [condition for condition, _ in statement.branches]
+    if isinstance(statement, RepeatTimes):
+        return [statement.count_expr]
+    if isinstance(statement, RepeatEach):
+        return [statement.list_expr]
+    if isinstance(statement, While):
+        return [statement.condition]
+    if isinstance(statement, Call):
+        return statement.args
+    if isinstance(statement, (AddItem, RemoveItem, SetField)):
+        return [statement.target, statement.expr]
+    if isinstance(statement, SetIndex):
+        return [statement.target, statement.index, statement.expr]
+    return []
+
+
+def walk(node):
+    """Every node of an expression tree"""
+    yield node
+    kind = type(node)
+    if kind in (BinaryOp, And, Or):
+        yield from walk(node.left)
+        yield from walk(node.right)
+    elif kind in (Not, Negate):
+        yield from walk(node.operand)
+    elif kind is CallExpr:
+        for arg in node.args:
+            yield from walk(arg)
+    elif kind is Index:
+        yield from walk(node.target)
+        yield from walk(node.index)
+    elif kind is Field:
+        yield from walk(node.target)
+    elif kind is ListExpr:
+        for item in node.items:
+            yield from walk(item)
+    elif kind is ThingExpr:
+        for _, value in node.pairs:
+            yield from walk(value)
+
+
+def check_callees(name, callees, symbols):
+    """Make sure everything a pure function calls is pure as well"""
+    for callee in sorted(callees):
+        if not symbols.is_pure(callee):
+            raise Exception(f"'{name}' is made pure, so it can only call pure functions, "
+                            f"and '{callee}' isn't one")
+
+
+def freeze(value):
+    """A hashable stand-in for a value, equal only for values that behave the same
+
+    Numbers keep their type, so 1, 1.0 and True are remembered separately.
+    Lists and things are frozen item by item. Anything else raises TypeError.
+    """
+    kind = type(value)
+    if kind is int or kind is str or value is None:
+        return value
+    if kind is float or kind is bool:
+        return kind, repr(value)
+    if kind is list or kind is NumberList:
+        return 'list', tuple([freeze(item) for item in value])
+    if kind is dict or kind is Thing:
+        return 'thing', frozenset([(key, freeze(item)) for key, item in value.items()])
+    raise TypeError(f"can't remember calls with {value!r}")
+
+
+def private(value):
+    """A copy of a result that nothing else can change"""
+    if isinstance(value, (list, dict, NumberList, Thing)):
+        return copy.deepcopy(value)
+    return value
+
+
+class MemoCache:
+    """Bounded LRU cache of pure function results, keyed by name and arguments"""
+    def __init__(self, maxsize=MEMO_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version = None  # the symbol table version the results belong to
+        self._checked = set()
+        self._entries = OrderedDict()
+
+    def recall(self, symbols, name, callees, args):
+        """(key, remembered result or FORGOTTEN) for a call to a pure function
+
+        The key is None when the arguments can't be remembered, in which case
+        the call just runs. Raises if the function calls something impure.
+        """
+        if self.version != symbols.version:
+            # A name may mean something else now, so old results can't be trusted
+            self._entries.clear()
+            self._checked.clear()
+            self.version = symbols.version
+        if name not in self._checked:
+            check_callees(name, callees, symbols)
+            self._checked.add(name)
+        try:
+            key = (name, tuple([freeze(arg) for arg in args]))
+        except TypeError:
+            return None, FORGOTTEN
+        value = self._entries.get(key, FORGOTTEN)
+        if value is FORGOTTEN:
+            self.misses += 1
+            return key, FORGOTTEN
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return key, private(value)
+
+    def remember(self, key, value):
+        """Keep the result of a call that recall() didn't know"""
+        self._entries[key] = private(value)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def info(self):
+        """Hit, miss and eviction counts and size"""
+        return MemoInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._entries))
+
+    def stats(self):
+        """info() as a dict, with the hit rate worked out"""
+        stats = self.info()._asdict()
+        calls = self.hits + self.misses
+        stats['hit_rate'] = self.hits / calls if calls else 0.0
+        return stats
+
+    def clear(self):
+        """Forget every result and reset the counters"""
+        self._entries.clear()
+        self._checked.clear()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
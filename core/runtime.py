@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Jules Runtime
+
+The value operations and built-in functions shared by every way of running
+Jules code, so that the interpreter and the virtual machine behave the same.
+"""
+
+import copy
+from array import array
+from collections.abc import MutableSequence, MutableMapping
+
+# How deeply Jules calls may nest by default
+RECURSION_LIMIT = 10000
+
+# Shorter lists stay ordinary Python lists; packing them wouldn't pay off
+PACKED_LIST_MIN_LENGTH = 16
+
+# A thing with more fields than this keeps them in a plain dict instead of a shape
+SHAPE_FIELD_LIMIT = 32
+
+# The range of whole numbers an array('q') can hold
+SMALLEST_PACKED_INT = -2 ** 63
+LARGEST_PACKED_INT = 2 ** 63 - 1
+
+
+def number_typecode(items):
+    """'q' if every item is a whole number that fits in 64 bits, 'd' if every one is a decimal"""
+    kinds = set(map(type, items))
+    if kinds == {int}:
+        if SMALLEST_PACKED_INT <= min(items) and max(items) <= LARGEST_PACKED_INT:
+            return 'q'
+    elif kinds == {float}:
+        return 'd'
+    return None
+
+
+def pack(items):
+    """Store a list as a NumberList if it's long enough and holds one kind of number"""
+    if len(items) < PACKED_LIST_MIN_LENGTH:
+        return items
+    typecode = number_typecode(items)
+    if typecode is None:
+        return items
+    return NumberList(array(typecode, items))
+
+
+class NumberList(MutableSequence):
+    """A list of whole numbers or of decimals, kept unboxed in an array
+
+    It looks like an ordinary list to Jules code: it shows, compares, joins
+    and iterates the same way. Storing a value the array can't hold, like
+    text or a decimal among whole numbers, moves the items into an ordinary
+    Python list, so every variable sharing the list still sees one list.
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items  # an array('q') or array('d'), or a list once unpacked
+
+    def tolist(self):
+        items = self.items
+        return items.tolist() if type(items) is array else list(items)
+
+    def _fits(self, value):
+        items = self.items
+        if type(items) is not array:
+            return True
+        if items.typecode == 'd':
+            return type(value) is float
+        return type(value) is int and SMALLEST_PACKED_INT <= value <= LARGEST_PACKED_INT
+
+    def _unpack(self):
+        self.items = self.items.tolist()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        return reversed(self.items)
+
+    def __contains__(self, value):
+        return value in self.items
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return NumberList(self.items[index])
+        return self.items[index]
+
+    def __setitem__(self, index, value):
+        if type(index) is slice:
+            value = list(value)
+            if not all(map(self._fits, value)):
+                self._unpack()
+        elif not self._fits(value):
+            self._unpack()
+        self.items[index] = value
+
+    def __delitem__(self, index):
+        del self.items[index]
+
+    def insert(self, index, value):
+        if not self._fits(value):
+            self._unpack()
+        self.items.insert(index, value)
+
+    def append(self, value):
+        if not self._fits(value):
+            self._unpack()
+        self.items.append(value)
+
+    def remove(self, value):
+        self.items.remove(value)
+
+    def extend(self, values):
+        values = list(values)
+        if not all(map(self._fits, values)):
+            self._unpack()
+        self.items.extend(values)
+
+    def __add__(self, other):
+        if isinstance(other, NumberList):
+            other = other.items
+        elif not isinstance(other, list):
+            return NotImplemented
+        items = self.items
+        if type(items) is array and (number_typecode(other) == items.typecode or not other):
+            return NumberList(items + array(items.typecode, other))
+        return pack(self.tolist() + list(other))
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        items = self.items
+        if type(items) is array and (number_typecode(other) == items.typecode or not other):
+            return NumberList(array(items.typecode, other) + items)
+        return pack(other + self.tolist())
+
+    def __mul__(self, count):
+        if not isinstance(count, int):
+            return NotImplemented
+        return NumberList(self.items * count)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if isinstance(other, NumberList):
+            return self.tolist() == other.tolist()
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        return self.tolist() < as_list(other)
+
+    def __le__(self, other):
+        return self.tolist() <= as_list(other)
+
+    def __gt__(self, other):
+        return self.tolist() > as_list(other)
+
+    def __ge__(self, other):
+        return self.tolist() >= as_list(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __copy__(self):
+        return NumberList(self.items[:])
+
+    def __deepcopy__(self, memo):
+        return NumberList(copy.deepcopy(self.items, memo))
+
+
+class Shape:
+    """The fields a thing has, in order, and where each one's value is kept
+
+    Shapes are shared: every thing that got the same fields in the same
+    order has the same Shape, reached through the transitions from the
+    empty one. So a field's offset can be remembered by checking the shape.
+    """
+    __slots__ = ('fields', 'offsets', 'transitions')
+
+    def __init__(self, fields=()):
+        self.fields = fields
+        self.offsets = {name: offset for offset, name in enumerate(fields)}
+        self.transitions = {}
+
+    def add(self, name):
+        """The shape after adding a field to a thing of this shape"""
+        shape = self.transitions.get(name)
+        if shape is None:
+            shape = self.transitions[name] = Shape(self.fields + (name,))
+        return shape
+
+    def __repr__(self):
+        return f"Shape({', '.join(map(str, self.fields))})"
+
+
+EMPTY_SHAPE = Shape()
+
+# The shape of a thing with too many fields, whose slots are a plain dict
+DICTIONARY = Shape()
+
+# Shapes of thing literals, by their field names
+_literal_shapes = {}
+
+
+def shape_of(fields):
+    """The shared shape for fields added in this order"""
+    shape = EMPTY_SHAPE
+    for name in fields:
+        shape = shape.add(name)
+    return shape
+
+
+class Thing(MutableMapping):
+    """A thing's fields: a shared Shape plus a compact list of values
+
+    It behaves like a dict with the same fields in the same order, and
+    shows the same way.
+    """
+    __slots__ = ('shape', 'slots')
+
+    def __init__(self, shape=EMPTY_SHAPE, slots=None):
+        self.shape = shape
+        self.slots = [] if slots is None else slots  # a dict once the shape is DICTIONARY
+
+    def __getitem__(self, name):
+        shape = self.shape
+        if shape is DICTIONARY:
+            return self.slots[name]
+        return self.slots[shape.offsets[name]]
+
+    def __setitem__(self, name, value):
+        shape = self.shape
+        if shape is DICTIONARY:
+            self.slots[name] = value
+            return
+        offset = shape.offsets.get(name)
+        if offset is not None:
+            self.slots[offset] = value
+        elif len(shape.fields) < SHAPE_FIELD_LIMIT:
+            self.shape = shape.add(name)
+            self.slots.append(value)
+        else:
+            self.slots = self.todict()
+            self.shape = DICTIONARY
+            self.slots[name] = value
+
+    def __delitem__(self, name):
+        shape = self.shape
+        if shape is DICTIONARY:
+            del self.slots[name]
+            return
+        offset = shape.offsets[name]
+        del self.slots[offset]
+        self.shape = shape_of(shape.fields[:offset] + shape.fields[offset + 1:])
+
+    def __contains__(self, name):
+        shape = self.shape
+        if shape is DICTIONARY:
+            return name in self.slots
+        return name in shape.offsets
+
+    def __iter__(self):
+        shape = self.shape
+        return iter(self.slots if shape is DICTIONARY else shape.fields)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def todict(self):
+        if self.shape is DICTIONARY:
+            return dict(self.slots)
+        return dict(zip(self.shape.fields, self.slots))
+
+    def __repr__(self):
+        return repr(self.todict())
+
+    def __copy__(self):
+        return Thing(self.shape, self.slots.copy())
+
+    def __deepcopy__(self, memo):
+        return Thing(self.shape, copy.deepcopy(self.slots, memo))
+
+
+def build_thing(keys, values):
+    """A new thing with the fields of a literal like {name: ..., phone: ...}"""
+    shape = _literal_shapes.get(keys)
+    if shape is None:
+        if len(set(keys)) == len(keys) and len(keys) <= SHAPE_FIELD_LIMIT:
+            shape = shape_of(keys)
+        else:
+            shape = False
+        _literal_shapes[keys] = shape
+    if shape:
+        return Thing(shape, values)
+    thing = Thing()
+    for key, value in zip(keys, values):
+        thing[key] = value
+    return thing
+
+
+class FieldSite:
+    """One place in a program that reads a field, and the shape it last saw"""
+    __slots__ = ('field', 'shape', 'offset')
+
+    def __init__(self, field):
+        self.field = field
+        self.shape = None
+        self.offset = None
+
+    def read(self, container):
+        """container.field, straight from the slot when the shape is the one seen before"""
+        if type(container) is Thing:
+            shape = container.shape
+            if shape is self.shape:
+                return container.slots[self.offset]
+            offset = shape.offsets.get(self.field)
+            if offset is not None:
+                self.shape = shape
+                self.offset = offset
+                return container.slots[offset]
+        return get_field(container, self.field)
+
+    def __repr__(self):
+        return f"FieldSite({self.field!r})"
+
+
+def as_list(value):
+    """An ordinary list with the same items, for anything list-like"""
+    return value.tolist() if isinstance(value, NumberList) else value
+
+
+def add(left, right):
+    """Add numbers, or join text when either side is text"""
+    if isinstance(left, str) or isinstance(right, str):
+        return str(left) + str(right)
+    result = left + right
+    if type(result) is list and len(result) >= PACKED_LIST_MIN_LENGTH:
+        return pack(result)
+    return result
+
+
+def subtract(left, right):
+    return left - right
+
+
+def multiply(left, right):
+    """Multiply numbers, or repeat a list or text"""
+    if type(left) is list or type(right) is list:
+        items, count = (left, right) if type(left) is list else (right, left)
+        if type(count) is int and len(items) * count >= PACKED_LIST_MIN_LENGTH:
+            typecode = number_typecode(items)
+            if typecode is not None:
+                # Repeat the packed items, never building the long list at all
+                return NumberList(array(typecode, items) * count)
+    return left * right
+
+
+def divide(left, right):
+    """Divide, warning instead of crashing on division by zero"""
+    if right == 0:
+        print("Warning: Division by zero!")
+        return 0
+    return left / right
+
+
+def remainder(left, right):
+    return left % right
+
+
+def contains(left, right):
+    """Check whether the text of one value appears in another"""
+    return str(right) in str(left)
+
+
+def get_index(container, index):
+    """Read an item from a list or text, or a field from a thing"""
+    if isinstance(container, (Thing, dict)):
+        if index in container:
+            return container[index]
+        raise Exception(f"'{index}' is not part of this thing")
+    if isinstance(container, (list, str, NumberList)):
+        if isinstance(index, int) and 0 <= index < len(container):
+            return container[index]
+        raise Exception(f"Position {index} is outside the list (it has {len(container)} items)")
+    raise Exception(f"Can't look inside {container} with [{index}]")
+
+
+def get_field(container, field):
+    """Read a field from a thing"""
+    if isinstance(container, (Thing, dict)) and field in container:
+        return container[field]
+    raise Exception(f"'{field}' is not part of {container}")
+
+
+def add_item(container, value):
+    """add <value> to <list>: put it on the end, changing the list itself"""
+    if not isinstance(container, (list, NumberList)):
+        raise Exception(f"Can't add to {container}, because it isn't a list")
+    container.append(value)
+
+
+def set_index(container, index, value):
+    """set <list>[<position>] to <value>, or set <thing>[<field>] to <value>"""
+    if isinstance(container, (Thing, dict)):
+        container[index] = value
+    elif isinstance(container, (list, NumberList)):
+        if not (isinstance(index, int) and 0 <= index < len(container)):
+            raise Exception(f"Position {index} is outside the list (it has {len(container)} items)")
+        container[index] = value
+    else:
+        raise Exception(f"Can't change {container} with [{index}]")
+
+
+def set_field(container, field, value):
+    """set <thing>.<field> to <value>, adding the field if it's new"""
+    if not isinstance(container, (Thing, dict)):
+        raise Exception(f"Can't set '{field}' on {container}, because it isn't a thing")
+    container[field] = value
+
+
+def remove_item(container, value):
+    """remove <value> from <list>, or remove a field from a thing"""
+    if isinstance(container, (Thing, dict)):
+        if value not in container:
+            raise Exception(f"'{value}' is not part of this thing")
+        del container[value]
+    elif isinstance(container, (list, NumberList)):
+        try:
+            container.remove(value)
+        except ValueError:
+            raise Exception(f"{value} isn't in the list") from None
+    else:
+        raise Exception(f"Can't remove anything from {container}")
+
+
+def to_number(value):
+    """The built-in number() function"""
+    try:
+        return float(value) if '.' in str(value) else int(value)
+    except ValueError:
+        print(f"Cannot convert {value} to a number")
+        return 0
+
+
+def to_text(value):
+    """The built-in text() function"""
+    return str(value)
+
+
+# Arithmetic and comparison operators by their Jules spelling
+BINARY_OPERATIONS = {
+    '+': add,
+    '-': subtract,
+    'times': multiply,
+    'divided by': divide,
+    '%': remainder,
+    'is': lambda left, right: left == right,
+    'is not': lambda left, right: left != right,
+    'greater than': lambda left, right: left > right,
+    'less than': lambda left, right: left < right,
+    'greater than or equal to': lambda left, right: left >= right,
+    'less than or equal to': lambda left, right: left <= right,
+    'contains': contains,
+}
+
+# Functions every Jules program can call without 'get'
+BUILTINS = {
+    'number': to_number,
+    'text': to_text,
+}
+
+# Built-ins whose result depends only on their arguments, so pure functions may call them
+PURE_BUILTINS = frozenset(['number', 'text'])
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Jules Server
+
+Runs Jules programs for other processes without starting a fresh Python
+for each one. 'jules serve' starts a pool of worker processes that have
+the interpreter and libraries imported already, and answers JSON requests
+over HTTP on a TCP port or a Unix socket:
+
+    POST /compile  {"source": "..."}
+                   -> {"program": id}
+    POST /run      {"source": "..." or "program": id, "inputs": [...], "timeout": seconds}
+                   -> {"program": id, "status": "ok", "exit_status": 0,
+                       "output": "...", "error": null, "drawing": null, "stats": {...}}
+    GET  /health   -> {"workers": 4, "running": 1, "waiting": 0}
+
+"inputs" are the answers 'ask' gets, in order. A run's status is "ok",
+"error" or "timeout", with exit status 0, 1 or 124. A program that draws
+gets its drawing back as SVG text in "drawing"; workers never save it to a
+file, whatever the program asks for.
+
+Each request goes to whichever worker is free. While every worker is busy,
+up to --backlog requests wait for one; more are turned away at once with
+503. Runs have a Budget: a program that goes past its timeout, or over
+--max-statements or --memory-limit, is stopped with an error. If it can't
+be stopped within KILL_GRACE seconds more, its worker is killed and
+replaced.
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import perf_counter
+
+from . import __version__
+from .budget import CHECK_INTERVAL, MEGABYTE
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Seconds a run may take; a request can ask for less, but not more
+RUN_TIMEOUT = 10.0
+
+# Seconds past its timeout a run gets to stop itself before its worker is killed
+KILL_GRACE = 1.0
+
+# The largest request body accepted, in bytes
+REQUEST_SIZE_LIMIT = 1024 * 1024
+
+# How many compiled programs the server, and each worker, keeps by id
+PROGRAM_STORE_SIZE = 1024
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_TIMEOUT = 124  # what the timeout command exits with
+
+
+def program_id(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+def work(connection):
+    """A worker process: run each job it's sent, and send back what happened"""
+    # Workers have no display, so drawings are recorded instead of shown
+    os.environ['JULES_DRAWING_BACKEND'] = 'svg'
+    from .libraries import preload_libraries
+    preload_libraries()
+    programs = OrderedDict()
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        connection.send(run_job(job, programs))
+
+
+def run_job(job, programs):
+    """The result of running one job, compiling its program unless it's kept already"""
+    from .program import compile
+    from .counters import Counters
+    from .output import Output
+    from .budget import Budget, BudgetExceeded
+    from .libraries import reset_libraries, library_module
+    # Nothing an earlier job drew is left for this one, and nothing is written to disk
+    reset_libraries(save_files=False)
+    start = perf_counter()
+    counters = Counters()
+    output = Output.capture()
+    result = {'program': job['program'], 'status': 'ok', 'exit_status': EXIT_OK, 'error': None}
+    try:
+        program = programs.get(job['program'])
+        if program is None:
+            program = programs[job['program']] = compile(job['source'])
+            if len(programs) > PROGRAM_STORE_SIZE:
+                programs.popitem(last=False)
+        else:
+            programs.move_to_end(job['program'])
+        program.run(job['inputs'], output, counters=counters, budget=Budget(**job['budget']))
+    except BudgetExceeded as e:
+        if e.kind == 'time':
+            result.update(status='timeout', exit_status=EXIT_TIMEOUT, error=str(e))
+        else:
+            result.update(status='error', exit_status=EXIT_ERROR, error=str(e))
+    except Exception as e:
+        result.update(status='error', exit_status=EXIT_ERROR, error=str(e))
+    result['output'] = output.getvalue()
+    drawing = library_module('drawing')
+    result['drawing'] = drawing.recorded() if drawing is not None else None
+    result['stats'] = dict(counters.as_dict(), wall_ms=(perf_counter() - start) * 1000)
+    return result
+
+
+class Worker:
+    """One worker process, and the pipe jobs go to it through"""
+    def __init__(self, context):
+        self.connection, their_end = context.Pipe()
+        self.process = context.Process(target=work, args=(their_end,), daemon=True)
+        self.process.start()
+        their_end.close()
+
+    def run(self, job, timeout):
+        """The job's result, or None if it took too long or the worker died"""
+        try:
+            self.connection.send(job)
+            if self.connection.poll(timeout):
+                return self.connection.recv()
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class Busy(Exception):
+    """Every worker is busy and the backlog is full"""
+
+
+class Pool:
+    """Workers that each run one job at a time, with a bounded number of jobs waiting"""
+    def __init__(self, workers, backlog):
+        # Workers are forked from a clean process, not from the server's threads
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.context = multiprocessing.get_context(method)
+        if method == 'forkserver':
+            self.context.set_forkserver_preload([f"{__package__}.program", f"{__package__}.libraries"])
+        self.size = workers
+        self.idle = queue.Queue()
+        for _ in range(workers):
+            self.idle.put(Worker(self.context))
+        self.admitted = threading.BoundedSemaphore(workers + backlog)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    def run(self, job, timeout):
+        """Run a job on the next free worker; raises Busy if it would have to wait behind too many"""
+        if not self.admitted.acquire(blocking=False):
+            raise Busy()
+        try:
+            with self.lock:
+                self.waiting += 1
+            worker = self.idle.get()
+            with self.lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                result = worker.run(job, timeout + KILL_GRACE)
+                if result is None:
+                    # Whatever it was doing, it can't be trusted to stop, so start another
+                    worker.stop()
+                    worker = Worker(self.context)
+                    result = {'program': job['program'], 'status': 'timeout', 'exit_status': EXIT_TIMEOUT,
+                              'error': f"The program ran out of time ({timeout:g}s)",
+                              'output': '', 'drawing': None, 'stats': None}
+                return result
+            finally:
+                self.idle.put(worker)
+                with self.lock:
+                    self.running -= 1
+        finally:
+            self.admitted.release()
+
+    def health(self):
+        with self.lock:
+            return {'workers': self.size, 'running': self.running, 'waiting': self.waiting}
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+
+class Service:
+    """What the server knows: its pool, the programs compiled so far, and the limits on runs"""
+    def __init__(self, pool, timeout=RUN_TIMEOUT, statements=None, memory=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.statements = statements
+        self.memory = memory
+        self.sources = OrderedDict()  # program id -> source
+        self.lock = threading.Lock()
+
+    def keep(self, source):
+        """Remember a program's source, returning its id"""
+        identity = program_id(source)
+        with self.lock:
+            self.sources[identity] = source
+            self.sources.move_to_end(identity)
+            if len(self.sources) > PROGRAM_STORE_SIZE:
+                self.sources.popitem(last=False)
+        return identity
+
+    def source(self, identity):
+        with self.lock:
+            return self.sources.get(identity)
+
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = f"Jules/{__version__}"
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.reply(200, self.server.service.pool.health())
+        else:
+            self.reply(404, {'error': f"Nothing at {self.path}"})
+
+    def do_POST(self):
+        try:
+            request = self.read_request()
+            if self.path == '/compile':
+                self.reply(200, self.compile(request))
+            elif self.path == '/run':
+                self.reply(200, self.run(request))
+            else:
+                raise RequestError(404, f"Nothing at {self.path}")
+        except RequestError as e:
+            self.reply(e.code, {'error': str(e)})
+        except Busy:
+            self.reply(503, {'error': 'Every worker is busy; try again soon'})
+        except Exception as e:
+            self.log_error('%s while answering %s: %s', type(e).__name__, self.path, e)
+            self.reply(500, {'error': f"Something went wrong in the server: {e}"})
+
+    def read_request(self):
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            raise RequestError(400, 'The request must say its Content-Length')
+        if length < 0:
+            raise RequestError(400, "The request's Content-Length can't be negative")
+        if length > REQUEST_SIZE_LIMIT:
+            raise RequestError(413, f"Requests can't be bigger than {REQUEST_SIZE_LIMIT} bytes")
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            raise RequestError(400, 'The request must be a JSON object')
+        if not isinstance(request, dict):
+            raise RequestError(400, 'The request must be a JSON object')
+        return request
+
+    def compile(self, request):
+        from .program import compile
+        from .parser import JulesSyntaxError
+        source = request.get('source')
+        if not isinstance(source, str):
+            raise RequestError(400, "'source' must be the program's text")
+        try:
+            compile(source)
+        except JulesSyntaxError as e:
+            raise RequestError(400, str(e))
+        return {'program': self.server.service.keep(source)}
+
+    def run(self, request):
+        service = self.server.service
+        source = request.get('source')
+        if source is not None:
+            if not isinstance(source, str):
+                raise RequestError(400, "'source' must be the program's text")
+            identity = service.keep(source)
+        else:
+            identity = request.get('program')
+            if not isinstance(identity, str):
+                raise RequestError(400, "Send the program's 'source', or the 'program' id /compile gave it")
+            source = service.source(identity)
+            if source is None:
+                raise RequestError(404, f"No program has the id {identity!r}; send its source instead")
+        inputs = request.get('inputs')
+        if inputs is None:
+            inputs = []
+        if not isinstance(inputs, list):
+            raise RequestError(400, "'inputs' must be a list of answers")
+        timeout = request.get('timeout')
+        if timeout is None:
+            timeout = service.timeout
+        # NaN would never run out, and nothing can finish in no time at all
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) \
+                or not math.isfinite(timeout) or timeout <= 0:
+            raise RequestError(400, "'timeout' must be a number of seconds above 0")
+        timeout = min(float(timeout), service.timeout)
+        job = {'program': identity, 'source': source, 'inputs': inputs,
+               'budget': {'statements': service.statements, 'seconds': timeout, 'memory': service.memory}}
+        return service.pool.run(job, timeout)
+
+    def reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TCPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def remove_socket(path):
+    """Remove the socket an earlier server left at path, refusing to remove anything else"""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "There is something other than a socket there", path)
+    os.remove(path)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=False):
+    """An HTTP server for a service, on a Unix socket if given one, else on host and port"""
+    if socket_path is not None:
+        remove_socket(socket_path)
+        server = UnixServer(socket_path, Handler)
+    else:
+        server = TCPServer((host, port), Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='jules serve', description='Run Jules programs sent over HTTP')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--backlog', type=int,
+                        help='requests that may wait for a free worker before more are turned away '
+                             '(default: as many as there are workers)')
+    parser.add_argument('--timeout', type=float, default=RUN_TIMEOUT,
+                        help=f'seconds a run may take (default: {RUN_TIMEOUT:g})')
+    parser.add_argument('--max-statements', type=int, metavar='N', help='statements a run may take')
+    parser.add_argument('--memory-limit', type=float, metavar='MB', help='memory a run may add to its worker, roughly: it is only checked every '
+                             f'{CHECK_INTERVAL} statements, so one statement can go far past it')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'(default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'(default: {DEFAULT_PORT})')
+    parser.add_argument('--socket', metavar='PATH', help='listen on a Unix socket instead of a port')
+    parser.add_argument('--verbose', action='store_true', help='log every request to stderr')
+    options = parser.parse_args(argv)
+    if options.workers < 1:
+        parser.error('--workers must be at least 1')
+    if not math.isfinite(options.timeout) or options.timeout <= 0:
+        parser.error('--timeout must be a number of seconds above 0')
+    if options.backlog is not None and options.backlog < 0:
+        parser.error('--backlog must be 0 or more')
+
+    pool = Pool(options.workers, options.backlog if options.backlog is not None else options.workers)
+    memory = int(options.memory_limit * MEGABYTE) if options.memory_limit is not None else None
+    service = Service(pool, options.timeout, options.max_statements, memory)
+    try:
+        server = make_server(service, options.host, options.port, options.socket, options.verbose)
+    except OSError as error:
+        pool.close()
+        parser.error(f"can't listen there: {error}")
+    where = options.socket or f"http://{options.host}:{options.port}"
+    print(f"Jules is serving on {where} with {options.workers} workers", file=sys.stderr)
+    # Stopping the server the usual way shuts it down as tidily as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda number, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if options.socket is not None:
+            remove_socket(options.socket)
+    return 0
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Jules Startup Profile
+
+'jules --startup-profile program.jules' runs the program again in a fresh
+Python with -X importtime, then reports how long it took from launch to
+exit and which imports the time went on, slowest first. The program's
+own output comes through as usual.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+ImportTime = namedtuple('ImportTime', ['module', 'self_us', 'cumulative_us'])
+
+# How many imports the report lists
+STARTUP_REPORT_SIZE = 20
+
+
+def package_root():
+    """The directory the top level package holding core lives in"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in __package__.split('.'):
+        root = os.path.dirname(root)
+    return root
+
+
+def parse_import_times(lines):
+    """ImportTimes from the lines -X importtime writes, and the other lines"""
+    times, others = [], []
+    for line in lines:
+        if not line.startswith('import time:'):
+            others.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except (ValueError, IndexError):
+            continue  # the header line
+        times.append(ImportTime(fields[2].strip(), self_us, cumulative_us))
+    return times, others
+
+
+def profile_startup(argv, stream=None):
+    """Run the jules command with argv under -X importtime and report on stream"""
+    if stream is None:
+        stream = sys.stderr
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root(), env.get('PYTHONPATH')]))
+    command = [sys.executable, '-X', 'importtime', '-m', f"{__package__}.cli"] + list(argv)
+    start = time.perf_counter()
+    finished = subprocess.run(command, env=env, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    times, others = parse_import_times(finished.stderr.splitlines())
+    for line in others:
+        print(line, file=stream)
+    print(format_report(times, elapsed), file=stream)
+    return finished.returncode
+
+
+def format_report(times, elapsed):
+    """The startup report: totals, then the slowest imports"""
+    importing = sum(entry.self_us for entry in times) / 1000
+    lines = [f"Startup profile: {elapsed * 1000:.1f}ms from launch to exit, "
+             f"{importing:.1f}ms of it importing {len(times)} modules",
+             f"  {'cumulative':>10}  {'self':>8}  module"]
+    slowest = sorted(times, key=lambda entry: entry.cumulative_us, reverse=True)
+    for entry in slowest[:STARTUP_REPORT_SIZE]:
+        lines.append(f"  {entry.cumulative_us / 1000:>8.2f}ms  {entry.self_us / 1000:>6.2f}ms  {entry.module}")
+    return '\n'.join(lines)
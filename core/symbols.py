@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Jules Symbol Table
+
+One table for every name a program can call: its own functions and
+procedures, the exports of libraries brought in with 'get', and the
+built-ins. Each call site remembers what its name resolved to and only
+looks it up again after a definition or import has changed the table.
+"""
+
+from .runtime import BUILTINS, PURE_BUILTINS
+
+# What a name can resolve to
+FUNCTION = 'function'
+PROCEDURE = 'procedure'
+NATIVE = 'native'  # a library export or built-in, called directly
+
+
+class SymbolTable:
+    """Everything callable by name, resolved in Jules' order of precedence"""
+    def __init__(self, builtins=BUILTINS):
+        self.functions = {}
+        self.procedures = {}
+        self.libraries = {}
+        self.builtins = dict(builtins)
+        # Functions made with 'make pure'
+        self.pure = set()
+        # Goes up every time a name might resolve differently
+        self.version = 0
+        self._entries = {name: (NATIVE, target) for name, target in self.builtins.items()}
+
+    def define_function(self, name, target, pure=False):
+        self.functions[name] = target
+        if pure:
+            self.pure.add(name)
+        else:
+            self.pure.discard(name)
+        self._changed([name])
+
+    def define_procedure(self, name, target):
+        self.procedures[name] = target
+        self._changed([name])
+
+    def add_library(self, lib_name, exports):
+        """Make a library's exports callable, after any already imported"""
+        self.libraries[lib_name] = exports
+        self._changed(exports)
+
+    def lookup(self, name):
+        """(kind, target) for a name, or None if nothing has that name"""
+        return self._entries.get(name)
+
+    def is_pure(self, name):
+        """Whether calling a name can only work out a result, never change anything"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return False
+        kind, target = entry
+        if kind is FUNCTION:
+            return name in self.pure
+        # A library export with a built-in's name isn't the built-in
+        return kind is NATIVE and name in PURE_BUILTINS and target is self.builtins.get(name)
+
+    def _changed(self, names):
+        for name in names:
+            entry = self._resolve(name)
+            if entry is None:
+                self._entries.pop(name, None)
+            else:
+                self._entries[name] = entry
+        self.version += 1
+
+    def _resolve(self, name):
+        # Functions beat procedures, which beat libraries, which beat built-ins
+        if name in self.functions:
+            return FUNCTION, self.functions[name]
+        if name in self.procedures:
+            return PROCEDURE, self.procedures[name]
+        for lib in self.libraries.values():
+            if name in lib:
+                return NATIVE, lib[name]
+        if name in self.builtins:
+            return NATIVE, self.builtins[name]
+        return None
+
+
+class CallSite:
+    """One place in a program that calls a name, and what it last resolved to
+
+    The table, its version and the entry are replaced together as one
+    tuple, so runs of the same parsed program in different threads can
+    never pair one table's entry with another table.
+    """
+    __slots__ = ('name', 'resolved')
+
+    def __init__(self, name):
+        self.name = name
+        self.resolved = (None, -1, None)  # (table, version, entry)
+
+    def resolve(self, table):
+        """The table entry for this name, looked up again only if the table changed"""
+        resolved_table, version, entry = self.resolved
+        if version != table.version or resolved_table is not table:
+            entry = table.lookup(self.name)
+            self.resolved = (table, table.version, entry)
+        return entry
+
+    def __repr__(self):
+        return f"CallSite({self.name!r})"
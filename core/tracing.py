@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Jules Tracing
+
+Structured events describing what the interpreter is doing, kept apart from
+the program's own output. A disabled tracer costs nothing: the interpreter
+only switches to its traced code paths when a level is turned on.
+
+Tracing is switched on with 'jules --trace LEVEL' or the JULES_TRACE
+environment variable. Events go to stderr, or to the file named by
+--trace-file or JULES_TRACE_FILE, one JSON object per line.
+"""
+
+import os
+import sys
+import json
+from collections import deque, namedtuple
+
+# Each level includes everything below it
+OFF = 0
+CALLS = 1        # function and procedure calls, library imports
+STATEMENTS = 2   # every statement that runs
+EXPRESSIONS = 3  # every expression and condition evaluated
+
+LEVELS = {
+    'off': OFF,
+    'calls': CALLS,
+    'statements': STATEMENTS,
+    'expressions': EXPRESSIONS,
+}
+
+# How many events a RingBuffer keeps by default
+RING_BUFFER_SIZE = 10000
+
+# line is None for calls and imports unless statements are traced too
+TraceEvent = namedtuple('TraceEvent', ['line', 'kind', 'duration', 'detail'])
+
+
+class RingBuffer:
+    """Keeps only the most recent events in memory"""
+    def __init__(self, size=RING_BUFFER_SIZE):
+        self.events = deque(maxlen=size)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """Writes each event as a line of JSON to a file or stream"""
+    def __init__(self, stream, owned=False):
+        self.stream = stream
+        self.owned = owned
+
+    @classmethod
+    def open(cls, path):
+        return cls(open(path, 'w'), owned=True)
+
+    def write(self, event):
+        self.stream.write(json.dumps(event._asdict(), default=str) + '\n')
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class Tracer:
+    """Hands events at or below its level to a sink"""
+    def __init__(self, level=OFF, sink=None):
+        self.level = level
+        self.sink = sink if sink is not None else RingBuffer()
+
+    @property
+    def enabled(self):
+        return self.level > OFF
+
+    def emit(self, line, kind, duration=None, detail=None):
+        self.sink.write(TraceEvent(line, kind, duration, detail))
+
+    def close(self):
+        self.sink.close()
+
+
+def parse_level(name):
+    """Turn a level name like 'statements' into its number"""
+    try:
+        return LEVELS[name.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown trace level '{name}' (choose from {', '.join(LEVELS)})")
+
+
+def make_tracer(level=None, path=None):
+    """Build a tracer from explicit settings, falling back to the environment"""
+    if path is None:
+        path = os.environ.get('JULES_TRACE_FILE')
+    if level is None:
+        # Naming a trace file is enough to turn statement tracing on
+        level = os.environ.get('JULES_TRACE', 'statements' if path else 'off')
+    level = parse_level(level) if isinstance(level, str) else level
+    if level == OFF:
+        return Tracer()
+    sink = FileSink.open(path) if path else FileSink(sys.stderr)
+    return Tracer(level, sink)
+
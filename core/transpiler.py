@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+"""
+Jules to Python Transpiler
+
+Translates a whole Jules program into Python source, then into a code
+object with compile(), so it runs directly on Python's own eval loop.
+Jules functions and procedures become real Python functions and
+'repeat n times' becomes a for loop over a range.
+
+Since Jules calls are Python calls here, every translated function takes
+how deeply it is nested as its first argument, _depth, and stops at the
+same limit as the other engines; the limit is written into the
+translation. A run also raises Python's own recursion limit to leave room
+for that many calls, with the usual Jules error as a backstop if Python
+runs out first.
+
+Every Jules variable is prefixed with 'v_' and every function or procedure
+with 'f_', so Jules names never clash with Python's.
+
+A program run with a Budget is translated with a call to _charge() at the
+top of every loop pass and call, so a loop that never ends is stopped like
+on the interpreter. Without one, the translation has no such calls at all.
+"""
+
+import marshal
+import sys
+
+from .parser import (
+    parse_program, JulesSyntaxError,
+    Show, Assign, When, RepeatTimes, RepeatEach, While, Ask,
+    FunctionDef, ProcedureDef, Import, Call, Return, Try, Stop, Skip,
+    AddItem, SetIndex, SetField, RemoveItem, child_bodies
+)
+from .expressions import (
+    parse_expression, Literal, Name, BinaryOp, And, Or, Not, Negate,
+    CallExpr, Index, Field, ListExpr, ThingExpr
+)
+from .compiler import find_local_names
+from .runtime import (
+    PACKED_LIST_MIN_LENGTH, RECURSION_LIMIT, FieldSite, add, multiply, divide, contains, get_index, build_thing,
+    pack, add_item, set_index, set_field, remove_item
+)
+from .symbols import SymbolTable
+from .purity import MemoCache, FORGOTTEN, private
+from .libraries import load_library
+from .output import Output
+from .cache import cached
+from .budget import Meter
+
+# Python spellings of the operators that map straight onto Python's own
+PYTHON_OPERATORS = {
+    '-': '-',
+    '%': '%',
+    'is': '==',
+    'is not': '!=',
+    'greater than': '>',
+    'less than': '<',
+    'greater than or equal to': '>=',
+    'less than or equal to': '<=',
+}
+
+# Marks a top level variable that did not exist before a loop borrowed its name
+MISSING = object()
+
+# Python frames one Jules call can take: a pure function's goes through _pure's wrapper
+FRAMES_PER_CALL = 2
+
+# Python frames left over for the helpers and libraries the deepest call runs
+FRAME_HEADROOM = 200
+
+
+def python_depth():
+    """How many Python frames are running below this one"""
+    depth = 0
+    frame = sys._getframe(1)
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def variable(name):
+    return f"v_{name}"
+
+
+def function(name):
+    return f"f_{name}"
+
+
+class Finish(BaseException):
+    """Raised by a top level 'return' to end the program with a value"""
+    def __init__(self, value=None):
+        super().__init__(value)
+        self.value = value
+
+
+class JulesNamespace(dict):
+    """Globals of a translated program; unknown variables read as their own name"""
+    def __missing__(self, key):
+        if key.startswith('v_'):
+            return key[2:]
+        raise KeyError(key)
+
+
+def find_definitions(statements, found=None):
+    """Map every function and procedure name in a program to its parameter counts"""
+    if found is None:
+        found = {}
+    for statement in statements:
+        if isinstance(statement, (FunctionDef, ProcedureDef)):
+            found.setdefault(statement.name, set()).add(len(statement.params))
+        for body in child_bodies(statement):
+            find_definitions(body, found)
+    return found
+
+
+def find_pure_names(statements, found=None):
+    """The names given to at least one pure function in a program"""
+    if found is None:
+        found = set()
+    for statement in statements:
+        if isinstance(statement, FunctionDef) and statement.pure:
+            found.add(statement.name)
+        for body in child_bodies(statement):
+            find_pure_names(body, found)
+    return found
+
+
+class Scope:
+    """What the transpiler needs to know about the function being written"""
+    def __init__(self, kind=None, local_names=()):
+        self.kind = kind  # None at the top level, else 'make' or 'do'
+        self.local_names = set(local_names)
+        self.loop_depth = 0
+
+
+class Transpiler:
+    """Writes the Python translation of a parsed Jules program"""
+    def __init__(self, source_name='<jules>', metered=False, depth_limit=RECURSION_LIMIT):
+        self.source_name = source_name
+        # Whether loop passes and calls charge a budget
+        self.metered = metered
+        # How many calls may be running inside each other
+        self.depth_limit = depth_limit
+        self.output = []
+        self.indent = 0
+        self.scope = Scope()
+        self.definitions = {}
+        self.pure_names = set()
+        self.temp_count = 0
+        self.field_sites = []
+        self._statement_writers = {
+            Show: self._write_show,
+            Assign: self._write_assign,
+            When: self._write_when,
+            RepeatTimes: self._write_repeat_times,
+            RepeatEach: self._write_repeat_each,
+            While: self._write_while,
+            Ask: self._write_ask,
+            FunctionDef: self._write_definition,
+            ProcedureDef: self._write_definition,
+            Import: self._write_import,
+            Call: self._write_call_statement,
+            Return: self._write_return,
+            Try: self._write_try,
+            Stop: self._write_stop,
+            Skip: self._write_skip,
+            AddItem: self._write_add_item,
+            SetIndex: self._write_set_index,
+            SetField: self._write_set_field,
+            RemoveItem: self._write_remove_item,
+        }
+
+    def transpile(self, statements):
+        """Return Python source for a whole program"""
+        self.definitions = find_definitions(statements)
+        self.pure_names = find_pure_names(statements)
+        self._line(f"# Python translation of {self.source_name}, generated by the Jules transpiler")
+        for name in sorted(self.definitions):
+            # Calling a function before its 'make' runs behaves like an unknown name
+            self._line(f"{function(name)} = _undefined({name!r})")
+        sites_at = len(self.output)
+        self._write_block(statements)
+        # Each place that reads a field gets its own FieldSite, made once
+        self.output[sites_at:sites_at] = [f"{reader} = _FieldSite({field!r}).read"
+                                          for reader, field in self.field_sites]
+        return '\n'.join(self.output) + '\n'
+
+    # -- helpers ---------------------------------------------------------
+
+    def _line(self, text):
+        self.output.append('    ' * self.indent + text)
+
+    def _temp(self, prefix):
+        self.temp_count += 1
+        return f"_{prefix}_{self.temp_count}"
+
+    def _write_block(self, statements):
+        if not statements:
+            self._line('pass')
+        for statement in statements:
+            self._statement_writers[type(statement)](statement)
+
+    def _indented(self, statements):
+        self.indent += 1
+        self._write_block(statements)
+        self.indent -= 1
+
+    def _charged(self, statements):
+        """An indented loop or function body, charging the budget first if there is one"""
+        self.indent += 1
+        if self.metered:
+            self._line('_charge()')
+        self._write_block(statements)
+        self.indent -= 1
+
+    def _is_local(self, name):
+        return self.scope.kind is not None and name in self.scope.local_names
+
+    # -- statements ------------------------------------------------------
+
+    def _write_show(self, statement):
+        self._line(f"_show({self._source(statement.expr)})")
+
+    def _write_assign(self, statement):
+        if not statement.target.isidentifier():
+            raise JulesSyntaxError(f"'{statement.target}' can't be used as a variable name", statement.line)
+        self._line(f"{variable(statement.target)} = {self._source(statement.expr)}")
+
+    def _write_when(self, statement):
+        keyword = 'if'
+        for condition, body in statement.branches:
+            self._line(f"{keyword} {self._source(condition)}:")
+            self._indented(body)
+            keyword = 'elif'
+        if statement.otherwise is not None:
+            self._line('else:')
+            self._indented(statement.otherwise)
+
+    def _write_loop(self, name, iterable, body):
+        """A for loop that puts the loop variable back afterwards"""
+        saved = self._temp('saved')
+        target = variable(name)
+        if self._is_local(name):
+            self._line(f"{saved} = {target}")
+        else:
+            self._line(f"{saved} = _G.get({target!r}, _MISSING)")
+        self._line('try:')
+        self.indent += 1
+        self._line(f"for {target} in {iterable}:")
+        self.scope.loop_depth += 1
+        self._charged(body)
+        self.scope.loop_depth -= 1
+        self.indent -= 1
+        self._line('finally:')
+        self.indent += 1
+        if self._is_local(name):
+            self._line(f"{target} = {saved}")
+        else:
+            self._line(f"_restore({target!r}, {saved})")
+        self.indent -= 1
+
+    def _write_repeat_times(self, statement):
+        count = self._source(statement.count_expr)
+        self._write_loop('count', f"range(1, int({count}) + 1)", statement.body)
+
+    def _write_repeat_each(self, statement):
+        self._write_loop(statement.item_name, self._source(statement.list_expr), statement.body)
+
+    def _write_while(self, statement):
+        self._line(f"while {self._source(statement.condition)}:")
+        self.scope.loop_depth += 1
+        self._charged(statement.body)
+        self.scope.loop_depth -= 1
+
+    def _write_ask(self, statement):
+        self._line(f"{variable(statement.var_name)} = _ask({statement.prompt!r})")
+
+    def _write_definition(self, statement):
+        for param in statement.params:
+            if not param.isidentifier():
+                raise JulesSyntaxError(f"'{param}' can't be used as a parameter name", statement.line)
+        kind = 'make' if isinstance(statement, FunctionDef) else 'do'
+        local_names = find_local_names(statement.params, statement.body)
+        params = ', '.join(['_depth'] + [variable(param) for param in statement.params])
+
+        self._line(f"def {function(statement.name)}({params}):")
+        outer_scope = self.scope
+        self.scope = Scope(kind, local_names)
+        self.indent += 1
+        self._line(f"if _depth > {self.depth_limit}:")
+        self._line('    _too_deep()')
+        if self.metered:
+            self._line('_charge()')
+        nested = sorted(set(find_definitions(statement.body)))
+        if nested:
+            # Functions made inside a function are still visible everywhere
+            self._line(f"global {', '.join(function(name) for name in nested)}")
+        for name in local_names[len(statement.params):]:
+            if name.isidentifier():
+                # Until it is assigned, a local reads whatever was visible at the call
+                self._line(f"{variable(name)} = _G[{variable(name)!r}]")
+        self._write_block(statement.body)
+        self.indent -= 1
+        self.scope = outer_scope
+
+        name = function(statement.name)
+        if isinstance(statement, FunctionDef) and statement.pure:
+            callees = sorted(statement.callees)
+            self._line(f"{name} = _pure({statement.name!r}, {name}, {callees!r})")
+        elif statement.name in self.pure_names:
+            # Pure functions check what they call, so they need to know it isn't pure any more
+            self._line(f"_define({statement.name!r}, {name})")
+
+    def _write_import(self, statement):
+        self._line(f"_import({statement.lib_name!r})")
+
+    def _write_call_statement(self, statement):
+        call = self._call(statement.name, [self._source(arg) for arg in statement.args])
+        if statement.into:
+            self._line(f"{variable(statement.into)} = {call}")
+        else:
+            self._line(call)
+
+    def _write_return(self, statement):
+        value = 'None' if statement.expr is None else self._source(statement.expr)
+        if self.scope.kind is None:
+            self._line(f"raise _Finish({value})")
+        elif self.scope.kind == 'do':
+            # Procedures work out the value but never hand it back
+            if statement.expr is not None:
+                self._line(value)
+            self._line('return None')
+        else:
+            self._line(f"return {value}")
+
+    def _write_try(self, statement):
+        if statement.catch_body is None:
+            self._write_block(statement.body)
+            return
+        error = self._temp('error')
+        self._line('try:')
+        self._indented(statement.body)
+        self._line(f"except Exception as {error}:")
+        self.indent += 1
+        self._line(f"{variable('error')} = _error_text({error})")
+        self._write_block(statement.catch_body)
+        self.indent -= 1
+
+    def _leave(self, keyword):
+        if self.scope.loop_depth:
+            self._line(keyword)
+        elif self.scope.kind is None:
+            self._line('raise _Finish(None)')
+        else:
+            self._line('return None')
+
+    def _write_stop(self, statement):
+        self._leave('break')
+
+    def _write_skip(self, statement):
+        self._leave('continue')
+
+    def _write_add_item(self, statement):
+        self._line(f"_add_item({self._source(statement.target)}, {self._source(statement.expr)})")
+
+    def _write_set_index(self, statement):
+        target, index = self._source(statement.target), self._source(statement.index)
+        self._line(f"_set_index({target}, {index}, {self._source(statement.expr)})")
+
+    def _write_set_field(self, statement):
+        target = self._source(statement.target)
+        self._line(f"_set_field({target}, {statement.field!r}, {self._source(statement.expr)})")
+
+    def _write_remove_item(self, statement):
+        self._line(f"_remove_item({self._source(statement.target)}, {self._source(statement.expr)})")
+
+    # -- expressions -----------------------------------------------------
+
+    def _source(self, text):
+        return self._expression(parse_expression(text))
+
+    def _call(self, name, args):
+        arity = self.definitions.get(name)
+        if arity is None:
+            return f"_call_native({name!r}, [{', '.join(args)}])"
+        if len(arity) == 1 and len(args) not in arity:
+            return f"_wrong_arguments({name!r}, {arity.pop()}, {len(args)})"
+        depth = '1' if self.scope.kind is None else '_depth + 1'
+        return f"{function(name)}({', '.join([depth] + args)})"
+
+    def _expression(self, node):
+        kind = type(node)
+        if kind is Literal:
+            return repr(node.value)
+        if kind is Name:
+            return variable(node.name)
+        if kind is BinaryOp:
+            left = self._expression(node.left)
+            right = self._expression(node.right)
+            if node.op == '+':
+                if isinstance(node.right, Literal) and isinstance(node.right.value, str):
+                    return f"(str({left}) + {right})"
+                return f"_add({left}, {right})"
+            if node.op == 'times':
+                # Repeating a list may make one long enough to pack
+                return f"_multiply({left}, {right})"
+            if node.op == 'divided by':
+                return f"_divide({left}, {right})"
+            if node.op == 'contains':
+                return f"_contains({left}, {right})"
+            return f"({left} {PYTHON_OPERATORS[node.op]} {right})"
+        if kind is And:
+            return f"({self._expression(node.left)} and {self._expression(node.right)})"
+        if kind is Or:
+            return f"({self._expression(node.left)} or {self._expression(node.right)})"
+        if kind is Not:
+            return f"(not {self._expression(node.operand)})"
+        if kind is Negate:
+            return f"(-{self._expression(node.operand)})"
+        if kind is CallExpr:
+            return self._call(node.name, [self._expression(arg) for arg in node.args])
+        if kind is Index:
+            return f"_get_index({self._expression(node.target)}, {self._expression(node.index)})"
+        if kind is Field:
+            reader = self._temp('field')
+            self.field_sites.append((reader, node.field))
+            return f"{reader}({self._expression(node.target)})"
+        if kind is ListExpr:
+            items = f"[{', '.join(self._expression(item) for item in node.items)}]"
+            if len(node.items) >= PACKED_LIST_MIN_LENGTH:
+                return f"_pack({items})"
+            return items
+        if kind is ThingExpr:
+            keys = tuple(key for key, _ in node.pairs)
+            values = ', '.join(self._expression(value) for _, value in node.pairs)
+            return f"_build_thing({keys!r}, [{values}])"
+        raise TypeError(f"Can't translate {node!r}")
+
+
+def transpile(statements, source_name='<jules>', metered=False, depth_limit=RECURSION_LIMIT):
+    """Translate a parsed Jules program into Python source"""
+    return Transpiler(source_name, metered, depth_limit).transpile(statements)
+
+
+class PythonProgram:
+    """A Jules program translated into a Python code object
+
+    Given a Budget, every run of it keeps to that budget. recursion_limit
+    is how many calls may be running inside each other, unless the budget
+    says.
+    """
+    def __init__(self, source, filename='<jules>', cache=False, budget=None, recursion_limit=RECURSION_LIMIT):
+        self.budget = budget
+        if budget is not None and budget.depth is not None:
+            recursion_limit = budget.depth
+        self.recursion_limit = recursion_limit
+        metered = budget is not None and budget.metered()
+        def translate():
+            python_source = transpile(parse_program(source), filename, metered, recursion_limit)
+            return python_source, marshal.dumps(compile(python_source, filename, 'exec'))
+        kind = 'python-metered' if metered else 'python'
+        if recursion_limit != RECURSION_LIMIT:
+            kind += f"-depth{recursion_limit}"
+        python_source, code = cached(filename, source, kind, translate) if cache else translate()
+        self.python_source = python_source
+        self.code = marshal.loads(code)
+        self.variables = {}
+        # Library exports, built-ins and pure functions; other functions are plain Python functions
+        self.symbols = SymbolTable()
+        self.libraries = self.symbols.libraries
+        # Results of calls to pure functions
+        self.memo = MemoCache()
+
+    def run(self, output=None):
+        """Run the program and return the value of a top level 'return'"""
+        if output is None:
+            output = Output()
+        recursion_limit = self.recursion_limit
+        namespace = JulesNamespace()
+        namespace.update(self._helpers(namespace, output, recursion_limit))
+        if self.budget is not None and self.budget.metered():
+            namespace['_charge'] = Meter(self.budget).charge
+        python_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(python_depth() + recursion_limit * FRAMES_PER_CALL + FRAME_HEADROOM)
+        try:
+            with output.active():
+                exec(self.code, namespace)
+            value = None
+        except Finish as finish:
+            value = finish.value
+        except RecursionError:
+            raise Exception(f"Too many calls inside each other (the limit is {recursion_limit})") from None
+        finally:
+            sys.setrecursionlimit(python_limit)
+            self.variables = {key[2:]: value for key, value in namespace.items()
+                              if key.startswith('v_')}
+        return value
+
+    def stats(self):
+        """Counters from the pure function cache, as plain data"""
+        return {'memo': self.memo.stats()}
+
+    def _helpers(self, namespace, output, recursion_limit):
+        """The functions translated code calls into"""
+        symbols = self.symbols
+        memo = self.memo
+
+        def too_deep():
+            raise Exception(f"Too many calls inside each other (the limit is {recursion_limit})")
+
+        def error_text(error):
+            # What 'error' holds in a catch block, worded as the other engines word it
+            if isinstance(error, RecursionError):
+                return f"Too many calls inside each other (the limit is {recursion_limit})"
+            return str(error)
+
+        def ask(prompt):
+            # The prompt has to come after everything shown so far
+            output.flush()
+            return input(prompt + " ")
+
+        def restore(key, value):
+            if value is MISSING:
+                namespace.pop(key, None)
+            else:
+                namespace[key] = value
+
+        def call_native(name, args):
+            entry = symbols.lookup(name)
+            if entry is None:
+                print(f"Unknown function or procedure: {name}")
+                return None
+            return entry[1](*args)
+
+        def undefined(name):
+            return lambda depth, *args: call_native(name, list(args))
+
+        def wrong_arguments(name, expected, got):
+            raise Exception(f"Function '{name}' expects {expected} arguments, but got {got}")
+
+        def pure(name, func, callees):
+            def remembered(depth, *args):
+                key, value = memo.recall(symbols, name, callees, args)
+                if value is not FORGOTTEN:
+                    return value
+                # Whatever the body does to a list or thing it was given stays inside the call
+                value = func(depth, *[private(arg) for arg in args])
+                if key is not None:
+                    memo.remember(key, value)
+                return value
+            symbols.define_function(name, remembered, pure=True)
+            return remembered
+
+        def define(name, func):
+            symbols.define_function(name, func)
+
+        def import_library(lib_name):
+            if lib_name not in symbols.libraries:
+                functions = load_library(lib_name)
+                if functions is not None:
+                    symbols.add_library(lib_name, functions)
+
+        return {
+            '_G': namespace,
+            '_show': output.show,
+            '_ask': ask,
+            '_add': add,
+            '_multiply': multiply,
+            '_divide': divide,
+            '_pack': pack,
+            '_contains': contains,
+            '_get_index': get_index,
+            '_build_thing': build_thing,
+            '_FieldSite': FieldSite,
+            '_add_item': add_item,
+            '_set_index': set_index,
+            '_set_field': set_field,
+            '_remove_item': remove_item,
+            '_call_native': call_native,
+            '_undefined': undefined,
+            '_wrong_arguments': wrong_arguments,
+            '_import': import_library,
+            '_pure': pure,
+            '_define': define,
+            '_restore': restore,
+            '_MISSING': MISSING,
+            '_Finish': Finish,
+            '_error_text': error_text,
+            '_too_deep': too_deep,
+        }
+
+
+def run_file(filename, emit=False, output=None, cache=True, budget=None, recursion_limit=None):
+    """Run a Jules program by translating it to Python, or just print the translation"""
+    if output is None:
+        output = Output()
+    try:
+        with open(filename, 'r') as file:
+            code = file.read()
+        program = PythonProgram(code, filename, cache, budget,
+                                recursion_limit if recursion_limit is not None else RECURSION_LIMIT)
+        if emit:
+            print(program.python_source, end='')
+        else:
+            program.run(output)
+    except FileNotFoundError:
+        print(f"Could not find file: {filename}")
+    except JulesSyntaxError as e:
+        # Reported before any of the program has run
+        print(f"Oops! {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        output.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_file(sys.argv[1])
+    else:
+        print("Usage: python -m jules.core.transpiler your_program.jules")
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Jules Virtual Machine
+
+Runs bytecode from compiler.py with one dispatch loop. Jules function calls
+push a frame onto the machine's own stack instead of recursing in Python.
+
+With a Budget, every jump back to the top of a loop and every call is
+charged to it, so a loop that never ends is stopped like on the interpreter.
+"""
+
+import sys
+
+from .parser import parse_program, JulesSyntaxError
+from .compiler import (
+    compile_program,
+    LOAD_FAST, LOAD_GLOBAL, LOAD_CONST, STORE_FAST, STORE_GLOBAL, BINARY_ADD,
+    COMPARE_LT, COMPARE_GT, COMPARE_EQ, COMPARE_LE, COMPARE_GE, BINARY_SUB,
+    BINARY_OP, POP_JUMP_IF_FALSE, JUMP, FOR_ITER, CALL, RETURN_VALUE, POP_TOP,
+    SHOW, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, UNARY_NOT,
+    UNARY_NEG, INDEX, FIELD, BUILD_LIST, BUILD_THING, GET_RANGE_ITER, GET_ITER,
+    SAVE_FAST, RESTORE_FAST, SAVE_GLOBAL, RESTORE_GLOBAL, ASK, SETUP_TRY,
+    POP_TRY, MAKE_FUNCTION, MAKE_PROCEDURE, IMPORT, ADD_ITEM, SET_INDEX, SET_FIELD,
+    REMOVE_ITEM
+)
+from .runtime import (
+    PACKED_LIST_MIN_LENGTH, RECURSION_LIMIT, Thing, add, get_index, build_thing, pack,
+    add_item, set_index, set_field, remove_item
+)
+from .symbols import SymbolTable, FUNCTION, NATIVE
+from .libraries import load_library
+from .purity import MemoCache, MEMO_CACHE_SIZE, FORGOTTEN, private
+from .output import Output
+from .cache import cached
+from .budget import Meter
+
+# Marks a local slot that hasn't been given a value yet
+UNSET = object()
+
+
+class Frame:
+    """One running function, procedure or the top level program"""
+    __slots__ = ('code', 'pc', 'stack', 'locals', 'handlers', 'memo_key')
+
+    def __init__(self, code, local_values):
+        self.code = code
+        self.pc = 0
+        self.stack = []
+        self.locals = local_values
+        self.handlers = []  # (handler pc, stack depth) for each open try
+        self.memo_key = None  # set when the result of a pure function should be remembered
+
+
+class JulesVM:
+    """Runs compiled Jules bytecode"""
+    def __init__(self, output=None, recursion_limit=RECURSION_LIMIT, memo_cache_size=MEMO_CACHE_SIZE, budget=None):
+        self.variables = {}
+        # Where 'show' writes
+        self.output = output if output is not None else Output()
+        # How many calls may be running inside each other
+        self.recursion_limit = recursion_limit
+        # Results of calls to pure functions
+        self.memo = MemoCache(memo_cache_size)
+        self.symbols = SymbolTable()
+        self.functions = self.symbols.functions
+        self.procedures = self.symbols.procedures
+        self.libraries = self.symbols.libraries
+        # Charged for each loop pass and call, only when there's a budget to keep to
+        self.meter = None
+        if budget is not None:
+            if budget.depth is not None:
+                self.recursion_limit = budget.depth
+            if budget.metered():
+                self.meter = Meter(budget)
+
+    def stats(self):
+        """Counters from the pure function cache, as plain data"""
+        return {'memo': self.memo.stats()}
+
+    def parse_and_execute(self, code):
+        """Parse, compile and run Jules code"""
+        return self.execute(parse_program(code))
+
+    def execute(self, statements):
+        """Compile and run an already parsed list of statements"""
+        return self.run(compile_program(statements))
+
+    def run(self, code):
+        """Run a compiled program and return the value of a top level 'return'"""
+        with self.output.active():
+            return self._run_frames([Frame(code, None)])
+
+    def _leave_loops(self, frame, depth):
+        """Put back the variables of the loops an error takes frame out of, down to stack depth"""
+        at = frame.pc - 1
+        for first, restore, slot in frame.code.loop_restores:
+            if first <= at < restore and slot >= depth:
+                opcode, argument = frame.code.instructions[restore]
+                value = frame.stack[slot]
+                if opcode == RESTORE_FAST:
+                    frame.locals[argument] = value
+                elif value is not UNSET:
+                    self.variables[argument] = value
+                else:
+                    self.variables.pop(argument, None)
+
+    def _new_frame(self, code, name, args, kind):
+        """Build the frame for a call to a function or procedure"""
+        params = code.params
+        if len(args) != len(params):
+            raise Exception(f"{kind} '{name}' expects {len(params)} arguments, but got {len(args)}")
+        local_values = args + [UNSET] * (len(code.local_names) - len(args))
+        return Frame(code, local_values)
+
+    def _run_frames(self, frames):
+        variables = self.variables
+        symbols = self.symbols
+        show = self.output.show
+        meter = self.meter
+
+        frame = frames[-1]
+        instructions = frame.code.instructions
+        local_names = frame.code.local_names
+        stack = frame.stack
+        local_values = frame.locals
+        pc = frame.pc
+
+        while True:
+            try:
+                while True:
+                    opcode, argument = instructions[pc]
+                    pc += 1
+
+                    if opcode == LOAD_FAST:
+                        value = local_values[argument]
+                        if value is UNSET:
+                            name = local_names[argument]
+                            value = variables.get(name, name)
+                        stack.append(value)
+                    elif opcode == LOAD_GLOBAL:
+                        stack.append(variables.get(argument, argument))
+                    elif opcode == LOAD_CONST:
+                        stack.append(argument)
+                    elif opcode == STORE_FAST:
+                        local_values[argument] = stack.pop()
+                    elif opcode == STORE_GLOBAL:
+                        variables[argument] = stack.pop()
+                    elif opcode == BINARY_ADD:
+                        right = stack.pop()
+                        stack[-1] = add(stack[-1], right)
+                    elif opcode == COMPARE_LT:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] < right
+                    elif opcode == COMPARE_GT:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] > right
+                    elif opcode == COMPARE_EQ:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] == right
+                    elif opcode == COMPARE_LE:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] <= right
+                    elif opcode == COMPARE_GE:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] >= right
+                    elif opcode == BINARY_SUB:
+                        right = stack.pop()
+                        stack[-1] = stack[-1] - right
+                    elif opcode == BINARY_OP:
+                        right = stack.pop()
+                        stack[-1] = argument(stack[-1], right)
+                    elif opcode == POP_JUMP_IF_FALSE:
+                        if not stack.pop():
+                            pc = argument
+                    elif opcode == JUMP:
+                        if meter is not None and argument < pc:
+                            # Each pass of a loop ends with a jump back to its top
+                            meter.charge()
+                        pc = argument
+                    elif opcode == FOR_ITER:
+                        for item in stack[-1]:
+                            stack.append(item)
+                            break
+                        else:
+                            stack.pop()
+                            pc = argument
+                    elif opcode == CALL:
+                        site, count = argument
+                        if count:
+                            args = stack[-count:]
+                            del stack[-count:]
+                        else:
+                            args = []
+                        resolved = site.resolved
+                        if resolved[1] != symbols.version or resolved[0] is not symbols:
+                            entry = site.resolve(symbols)
+                        else:
+                            entry = resolved[2]
+                        if entry is None:
+                            print(f"Unknown function or procedure: {site.name}")
+                            stack.append(None)
+                            continue
+                        kind, target = entry
+                        if kind is NATIVE:
+                            stack.append(target(*args))
+                            continue
+                        if len(frames) > self.recursion_limit:
+                            raise Exception(f"Too many calls inside each other (the limit is {self.recursion_limit})")
+                        if meter is not None:
+                            meter.charge()
+                        callee = self._new_frame(target, site.name, args,
+                                                 'Function' if kind is FUNCTION else 'Procedure')
+                        if target.pure:
+                            key, value = self.memo.recall(symbols, site.name, target.callees, args)
+                            if value is not FORGOTTEN:
+                                stack.append(value)
+                                continue
+                            callee.memo_key = key
+                            # Whatever the body does to a list or thing it was given stays inside the call
+                            callee.locals[:len(args)] = [private(arg) for arg in args]
+                        frame.pc = pc
+                        frames.append(callee)
+                        frame = callee
+                        instructions = callee.code.instructions
+                        local_names = callee.code.local_names
+                        stack = callee.stack
+                        local_values = callee.locals
+                        pc = 0
+                    elif opcode == RETURN_VALUE:
+                        value = stack.pop()
+                        frames.pop()
+                        if frame.memo_key is not None:
+                            self.memo.remember(frame.memo_key, value)
+                        if not frames:
+                            return value
+                        frame = frames[-1]
+                        instructions = frame.code.instructions
+                        local_names = frame.code.local_names
+                        stack = frame.stack
+                        local_values = frame.locals
+                        pc = frame.pc
+                        stack.append(value)
+                    elif opcode == POP_TOP:
+                        stack.pop()
+                    elif opcode == SHOW:
+                        show(stack.pop())
+                    elif opcode == JUMP_IF_FALSE_OR_POP:
+                        if not stack[-1]:
+                            pc = argument
+                        else:
+                            stack.pop()
+                    elif opcode == JUMP_IF_TRUE_OR_POP:
+                        if stack[-1]:
+                            pc = argument
+                        else:
+                            stack.pop()
+                    elif opcode == UNARY_NOT:
+                        stack[-1] = not stack[-1]
+                    elif opcode == UNARY_NEG:
+                        stack[-1] = -stack[-1]
+                    elif opcode == INDEX:
+                        index = stack.pop()
+                        stack[-1] = get_index(stack[-1], index)
+                    elif opcode == FIELD:
+                        container = stack[-1]
+                        if type(container) is Thing and container.shape is argument.shape:
+                            stack[-1] = container.slots[argument.offset]
+                        else:
+                            stack[-1] = argument.read(container)
+                    elif opcode == BUILD_LIST:
+                        if argument:
+                            items = stack[-argument:]
+                            del stack[-argument:]
+                        else:
+                            items = []
+                        stack.append(pack(items) if argument >= PACKED_LIST_MIN_LENGTH else items)
+                    elif opcode == BUILD_THING:
+                        count = len(argument)
+                        values = stack[-count:] if count else []
+                        if count:
+                            del stack[-count:]
+                        stack.append(build_thing(argument, values))
+                    elif opcode == GET_RANGE_ITER:
+                        stack[-1] = iter(range(1, int(stack[-1]) + 1))
+                    elif opcode == GET_ITER:
+                        stack[-1] = iter(stack[-1])
+                    elif opcode == SAVE_FAST:
+                        stack.append(local_values[argument])
+                    elif opcode == RESTORE_FAST:
+                        local_values[argument] = stack.pop()
+                    elif opcode == SAVE_GLOBAL:
+                        stack.append(variables.get(argument, UNSET))
+                    elif opcode == RESTORE_GLOBAL:
+                        value = stack.pop()
+                        if value is not UNSET:
+                            variables[argument] = value
+                        elif argument in variables:
+                            del variables[argument]
+                    elif opcode == ADD_ITEM:
+                        value = stack.pop()
+                        add_item(stack.pop(), value)
+                    elif opcode == SET_INDEX:
+                        value = stack.pop()
+                        index = stack.pop()
+                        set_index(stack.pop(), index, value)
+                    elif opcode == SET_FIELD:
+                        value = stack.pop()
+                        set_field(stack.pop(), argument, value)
+                    elif opcode == REMOVE_ITEM:
+                        value = stack.pop()
+                        remove_item(stack.pop(), value)
+                    elif opcode == ASK:
+                        self.output.flush()
+                        stack.append(input(argument + " "))
+                    elif opcode == SETUP_TRY:
+                        frame.handlers.append((argument, len(stack)))
+                    elif opcode == POP_TRY:
+                        frame.handlers.pop()
+                    elif opcode == MAKE_FUNCTION:
+                        symbols.define_function(argument.name, argument, pure=argument.pure)
+                    elif opcode == MAKE_PROCEDURE:
+                        symbols.define_procedure(argument.name, argument)
+                    elif opcode == IMPORT:
+                        if argument not in symbols.libraries:
+                            library = load_library(argument)
+                            if library is not None:
+                                symbols.add_library(argument, library)
+                    else:
+                        raise Exception(f"Unknown opcode {opcode}")
+            except Exception as error:
+                # Unwind to the nearest try block, leaving frames as needed
+                frame.pc = pc
+                while frames and not frames[-1].handlers:
+                    frames.pop()
+                if not frames:
+                    raise
+                frame = frames[-1]
+                handler_pc, depth = frame.handlers.pop()
+                instructions = frame.code.instructions
+                local_names = frame.code.local_names
+                stack = frame.stack
+                self._leave_loops(frame, depth)
+                del stack[depth:]
+                stack.append(str(error))
+                local_values = frame.locals
+                pc = handler_pc
+
+
+def run_file(filename, output=None, recursion_limit=None, cache=True, budget=None):
+    """Run a Jules program from file on the virtual machine, compiling it only if the cache can't help"""
+    if output is None:
+        output = Output()
+    if recursion_limit is None:
+        recursion_limit = RECURSION_LIMIT
+    try:
+        with open(filename, 'r') as file:
+            code = file.read()
+        def build():
+            return compile_program(parse_program(code))
+        JulesVM(output, recursion_limit, budget=budget).run(cached(filename, code, 'vm', build) if cache else build())
+    except FileNotFoundError:
+        print(f"Could not find file: {filename}")
+    except JulesSyntaxError as e:
+        # Reported before any of the program has run
+        print(f"Oops! {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        output.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_file(sys.argv[1])
+    else:
+        print("Usage: python -m jules.core.vm your_program.jules")
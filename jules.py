@@ -3,19 +3,25 @@
 Jules Language Interpreter
 
 A simple and friendly programming language designed for beginners.
+
+'python jules.py' runs programs with the interpreter in the core package.
+The line-by-line interpreter below is the original one, kept so the
+benchmarks can compare against it.
 """
 
 import re
-import sys
-import os
-import importlib.util
+
+from core.symbols import SymbolTable, FUNCTION, PROCEDURE
+from core.libraries import load_library
 
 class JulesInterpreter:
     def __init__(self):
         self.variables = {}
-        self.functions = {}
-        self.procedures = {}
-        self.libraries = {}
+        # Functions, procedures, library exports and built-ins, all callable by name
+        self.symbols = SymbolTable()
+        self.functions = self.symbols.functions
+        self.procedures = self.symbols.procedures
+        self.libraries = self.symbols.libraries
         
     def tokenize(self, code):
         """Convert code string into tokens"""
@@ -128,7 +134,7 @@ class JulesInterpreter:
             
             # Parse function definitions
             elif line.startswith('make'):
-                match = re.match(r'make\s+(\w+)\((.*?)\)', line)
+                match = re.match(r'make\s+(?:pure\s+)?(\w+)\((.*?)\)', line)
                 if match:
                     func_name = match.group(1)
                     params = [p.strip() for p in match.group(2).split(',') if p.strip()]
@@ -136,10 +142,10 @@ class JulesInterpreter:
                     done_idx = self._find_matching_done(lines, i)
                     func_body = lines[i+1:done_idx]
                     
-                    self.functions[func_name] = {
+                    self.symbols.define_function(func_name, {
                         'params': params,
                         'body': func_body
-                    }
+                    })
                     
                     i = done_idx
             
@@ -153,10 +159,10 @@ class JulesInterpreter:
                     done_idx = self._find_matching_done(lines, i)
                     proc_body = lines[i+1:done_idx]
                     
-                    self.procedures[proc_name] = {
+                    self.symbols.define_procedure(proc_name, {
                         'params': params,
                         'body': proc_body
-                    }
+                    })
                     
                     i = done_idx
             
@@ -165,6 +171,17 @@ class JulesInterpreter:
                 lib_name = line[3:].strip()
                 self._import_library(lib_name)
             
+            # Parse special syntax for a function call with 'into'
+            elif ' into ' in line and re.match(r'(\w+)\((.*?)\)\s+into\s+(\w+)', line):
+                match = re.match(r'(\w+)\((.*?)\)\s+into\s+(\w+)', line)
+                func_name = match.group(1)
+                arg_str = match.group(2)
+                var_name = match.group(3)
+                
+                args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
+                result = self._call(func_name, args)
+                self.variables[var_name] = result
+            
             # Parse function/procedure calls
             elif '(' in line and ')' in line:
                 call_match = re.match(r'(\w+)\((.*?)\)', line)
@@ -172,46 +189,7 @@ class JulesInterpreter:
                     func_name = call_match.group(1)
                     arg_str = call_match.group(2)
                     args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
-                    
-                    # Check if it's a function call
-                    if func_name in self.functions:
-                        result = self._call_function(func_name, args)
-                    # Check if it's a procedure call
-                    elif func_name in self.procedures:
-                        self._call_procedure(func_name, args)
-                    # Check if it's a library function
-                    elif any(func_name in lib for lib in self.libraries.values()):
-                        for lib in self.libraries.values():
-                            if func_name in lib:
-                                result = lib[func_name](*args)
-                                break
-                    # Built-in function
-                    elif func_name == 'number':
-                        result = float(args[0]) if '.' in str(args[0]) else int(args[0])
-                    elif func_name == 'text':
-                        result = str(args[0])
-                    else:
-                        print(f"Unknown function or procedure: {func_name}")
-            
-            # Parse special syntax for library function call with 'into'
-            elif ' into ' in line and not line.startswith('ask'):
-                match = re.match(r'(\w+)\((.*?)\)\s+into\s+(\w+)', line)
-                if match:
-                    func_name = match.group(1)
-                    arg_str = match.group(2)
-                    var_name = match.group(3)
-                    
-                    args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
-                    
-                    # Look for the function in libraries
-                    if any(func_name in lib for lib in self.libraries.values()):
-                        for lib in self.libraries.values():
-                            if func_name in lib:
-                                result = lib[func_name](*args)
-                                self.variables[var_name] = result
-                                break
-                    else:
-                        print(f"Unknown function: {func_name}")
+                    result = self._call(func_name, args)
                 
             # Parse return statement
             elif line.startswith('return'):
@@ -261,19 +239,9 @@ class JulesInterpreter:
                 arg_str = call_match.group(2)
                 args = [self._parse_expression(arg.strip()) for arg in arg_str.split(',') if arg.strip()]
                 
-                # Check if it's a function call
-                if func_name in self.functions:
-                    return self._call_function(func_name, args)
-                # Check if it's a library function
-                elif any(func_name in lib for lib in self.libraries.values()):
-                    for lib in self.libraries.values():
-                        if func_name in lib:
-                            return lib[func_name](*args)
-                # Built-in function
-                elif func_name == 'number':
-                    return float(args[0]) if '.' in str(args[0]) else int(args[0])
-                elif func_name == 'text':
-                    return str(args[0])
+                entry = self.symbols.lookup(func_name)
+                if entry is not None:
+                    return self._invoke(entry, func_name, args)
         
         # Number
         try:
@@ -452,6 +420,22 @@ class JulesInterpreter:
                 return i
         return None
     
+    def _call(self, func_name, args):
+        """Call a function, procedure, library function or built-in by name"""
+        entry = self.symbols.lookup(func_name)
+        if entry is None:
+            print(f"Unknown function or procedure: {func_name}")
+            return None
+        return self._invoke(entry, func_name, args)
+    
+    def _invoke(self, entry, func_name, args):
+        kind, target = entry
+        if kind == FUNCTION:
+            return self._call_function(func_name, args)
+        if kind == PROCEDURE:
+            return self._call_procedure(func_name, args)
+        return target(*args)
+    
     def _call_function(self, func_name, args):
         """Call a Jules function"""
         if func_name not in self.functions:
@@ -503,21 +487,9 @@ class JulesInterpreter:
         if lib_name in self.libraries:
             return  # Already imported
         
-        # Check built-in libraries first
-        if lib_name == 'drawing':
-            try:
-                # Try to import the drawing module
-                spec = importlib.util.spec_from_file_location("drawing", os.path.join("libs", "drawing.py"))
-                drawing_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(drawing_module)
-                self.libraries['drawing'] = drawing_module.drawing_functions
-                return
-            except Exception as e:
-                print(f"Could not import drawing library: {e}")
-                return
-        
-        # Custom libraries would be handled here
-        print(f"Library '{lib_name}' not found")
+        functions = load_library(lib_name)
+        if functions is not None:
+            self.symbols.add_library(lib_name, functions)
 
 
 def run_file(filename):
@@ -573,7 +545,7 @@ def run_interactive():
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        run_file(sys.argv[1])
-    else:
-        run_interactive() 
\ No newline at end of file
+    # Every run goes through the core package's command line, so options
+    # like --no-cache never change which interpreter runs the program
+    from core.cli import main
+    main()
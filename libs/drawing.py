@@ -2,24 +2,165 @@
 Jules Drawing Library
 
 A simple wrapper for Python's turtle module that can be used in Jules programs.
+
+Drawing happens on one of two backends:
+
+    'tk'   a live turtle window (the default)
+    'svg'  no window: turtles record what they draw, and done() saves it
+           all as an SVG file
+
+Choose with setup(width, height, "svg", "picture.svg") before creating any
+turtles, or with the JULES_DRAWING_BACKEND and JULES_DRAWING_FILE
+environment variables.
+
+The 'tk' window normally redraws after every move. Drawing between
+begin_frame() and end_frame() redraws once, at end_frame(). And
+set_frame_rate(30) (or JULES_DRAWING_FPS=30) batches automatically: the
+window is redrawn at most 30 times a second, with the same final picture.
+
+A process that runs one program after another, like a 'jules serve'
+worker, calls reset() before each, so no turtle or drawing is left over.
+reset(save_files=False) also stops done() writing the SVG anywhere; the
+host takes it from recorded() instead.
 """
 
-import turtle
+import os
+from collections.abc import Mapping
+from contextlib import contextmanager
 from functools import wraps
+from time import perf_counter
+
+from .recording import Drawing
+
+BACKENDS = ('tk', 'svg')
+
+# Where done() saves an SVG drawing if setup() doesn't say
+DRAWING_FILE = 'drawing.svg'
 
 # Store all created turtles
 turtles = {}
 turtle_count = 0
 
+# The backend in use, chosen on first need; turtle is imported only for 'tk'
+backend = None
+turtle = None
+drawing = None  # what the 'svg' backend records into
+drawing_file = None
+
+# Automatic batching: redraw at most this many times a second, or after every move if 0
+frame_rate = 0
+frame_depth = 0  # begin_frame calls still waiting for their end_frame
+last_redraw = 0.0
+
+# Whether done() saves an SVG drawing to drawing_file
+save_files = True
+
+
+def reset(save_files=True):
+    """Forget every turtle and drawing, as if no program had used the library yet"""
+    global turtle_count, backend, drawing, drawing_file, frame_rate, frame_depth, last_redraw
+    turtles.clear()
+    turtle_count = 0
+    backend = None
+    drawing = None
+    drawing_file = None
+    frame_rate = 0
+    frame_depth = 0
+    last_redraw = 0.0
+    globals()['save_files'] = save_files
+
+
+def recorded():
+    """Everything drawn on the 'svg' backend so far, as SVG, or None if nothing was"""
+    if backend != 'svg' or drawing is None:
+        return None
+    return drawing.svg()
+
+
+def choose_backend(name=None, filename=None):
+    """Pick the backend, from the environment if no name is given"""
+    global backend, turtle, drawing, drawing_file
+    if name is None:
+        name = os.environ.get('JULES_DRAWING_BACKEND', 'tk')
+    if name not in BACKENDS:
+        raise Exception(f"Unknown drawing backend '{name}' (choose from {', '.join(BACKENDS)})")
+    if name != backend and turtles:
+        raise Exception("Choose the drawing backend before creating any turtles")
+    if name == 'tk' and turtle is None:
+        import turtle
+        fps = os.environ.get('JULES_DRAWING_FPS')
+        if fps:
+            batch_redraws(float(fps))
+    if name == 'svg' and drawing is None:
+        drawing = Drawing()
+    backend = name
+    drawing_file = filename or drawing_file or os.environ.get('JULES_DRAWING_FILE', DRAWING_FILE)
+
+
+def current_backend():
+    if backend is None:
+        choose_backend()
+    return backend
+
+
+def batch_redraws(fps):
+    """Redraw the 'tk' window at most fps times a second, or after every move if 0"""
+    global frame_rate
+    frame_rate = max(0, fps)
+    if turtle is not None:
+        turtle.tracer(0 if frame_rate or frame_depth else 1)
+
+
+def redraw_if_due():
+    """Redraw a batching 'tk' window if a frame's worth of time has gone by"""
+    global last_redraw
+    now = perf_counter()
+    if now - last_redraw >= 1 / frame_rate:
+        turtle.update()
+        last_redraw = now
+
+
+@contextmanager
+def one_redraw():
+    """Redraw the 'tk' window once, at the end, for everything drawn inside"""
+    if backend != 'tk' or frame_rate or frame_depth:
+        yield  # nothing to save: not a window, or already batching
+        return
+    turtle.tracer(0)
+    try:
+        yield
+    finally:
+        turtle.update()
+        turtle.tracer(1)
+
+
+def as_point(value):
+    """(x, y) from a Jules point: a list like [10, 20] or a thing like {x: 10, y: 20}"""
+    try:
+        if isinstance(value, Mapping):
+            return float(value['x']), float(value['y'])
+        x, y = value
+        return float(x), float(y)
+    except (KeyError, TypeError, ValueError):
+        raise Exception(f"{value!r} isn't a point; use a list like [10, 20] or a thing like {{x: 10, y: 20}}")
+
+
+def as_points(values):
+    return [as_point(value) for value in values]
+
+
 def jules_function(func):
     """Decorator for Jules library functions to handle errors gracefully"""
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
-            return func(*args, **kwargs)
+            result = func(*args, **kwargs)
         except Exception as e:
             print(f"Oops! {e}")
             return None
+        if frame_rate and not frame_depth and backend == 'tk':
+            redraw_if_due()
+        return result
     return wrapper
 
 @jules_function
@@ -28,7 +169,7 @@ def create_turtle():
     global turtle_count
     turtle_count += 1
     turtle_id = f"turtle_{turtle_count}"
-    turtles[turtle_id] = turtle.Turtle()
+    turtles[turtle_id] = turtle.Turtle() if current_backend() == 'tk' else drawing.new_turtle()
     return turtle_id
 
 @jules_function
@@ -132,7 +273,10 @@ def end_fill(turtle_id):
 @jules_function
 def clear_screen():
     """Clear the screen"""
-    turtle.clear()
+    if current_backend() == 'tk':
+        turtle.clear()
+    else:
+        drawing.clear()
 
 @jules_function
 def hide_turtle(turtle_id):
@@ -174,6 +318,79 @@ def draw_circle(turtle_id, radius):
     else:
         print(f"Turtle {turtle_id} not found")
 
+@jules_function
+def draw_polyline(turtle_id, points):
+    """Draw lines joining a list of points, starting from the first without drawing"""
+    if turtle_id in turtles:
+        trace_points(turtles[turtle_id], as_points(points))
+    else:
+        print(f"Turtle {turtle_id} not found")
+
+@jules_function
+def draw_polygon(turtle_id, points, fill=None):
+    """Draw a closed shape through a list of points, filled with a color if one is given"""
+    if turtle_id in turtles:
+        points = as_points(points)
+        if points:
+            points.append(points[0])
+        trace_points(turtles[turtle_id], points, fill)
+    else:
+        print(f"Turtle {turtle_id} not found")
+
+@jules_function
+def draw_regular_polygon(turtle_id, sides, size):
+    """Draw a shape with equal sides, from where the turtle is and the way it faces"""
+    if sides < 1:
+        raise Exception("A shape needs at least one side")
+    if turtle_id in turtles:
+        t = turtles[turtle_id]
+        angle = 360 / sides
+        with one_redraw():
+            for _ in range(int(sides)):
+                t.forward(size)
+                t.right(angle)
+    else:
+        print(f"Turtle {turtle_id} not found")
+
+@jules_function
+def stamp_many(turtle_id, points):
+    """Stamp the turtle's shape at each point, then put it back where it was"""
+    if turtle_id in turtles:
+        t = turtles[turtle_id]
+        points = as_points(points)
+        start, was_down = t.position(), t.isdown()
+        with one_redraw():
+            t.penup()
+            for x, y in points:
+                t.goto(x, y)
+                t.stamp()
+            t.goto(*start)
+            if was_down:
+                t.pendown()
+    else:
+        print(f"Turtle {turtle_id} not found")
+
+
+def trace_points(t, points, fill=None):
+    """Move a turtle through points, drawing from the first on, with the pen as it was after"""
+    if not points:
+        return
+    was_down, fill_color = t.isdown(), t.fillcolor()
+    with one_redraw():
+        t.penup()
+        t.goto(*points[0])
+        t.pendown()
+        if fill is not None:
+            t.fillcolor(fill)
+            t.begin_fill()
+        for x, y in points[1:]:
+            t.goto(x, y)
+        if fill is not None:
+            t.end_fill()
+            t.fillcolor(fill_color)
+        if not was_down:
+            t.penup()
+
 @jules_function
 def write_text(turtle_id, text, font_size=12):
     """Write text at the current position"""
@@ -183,19 +400,60 @@ def write_text(turtle_id, text, font_size=12):
         print(f"Turtle {turtle_id} not found")
 
 @jules_function
-def setup(width=800, height=600):
-    """Set up the drawing window size"""
-    turtle.setup(width, height)
+def setup(width=800, height=600, backend_name=None, filename=None):
+    """Set up the drawing window size, and optionally the backend and the SVG file"""
+    if backend_name is not None or filename is not None:
+        choose_backend(backend_name or backend, filename)
+    if current_backend() == 'tk':
+        turtle.setup(width, height)
+    else:
+        drawing.width = width
+        drawing.height = height
 
 @jules_function
 def title(title_text):
     """Set the window title"""
-    turtle.title(title_text)
+    if current_backend() == 'tk':
+        turtle.title(title_text)
+    else:
+        drawing.title = title_text
 
 @jules_function
 def done():
-    """Finish drawing and keep the window open"""
-    turtle.done()
+    """Finish drawing and keep the window open, or save the SVG file"""
+    if current_backend() == 'tk':
+        if frame_rate or frame_depth:
+            turtle.update()
+        turtle.done()
+    elif save_files:
+        drawing.save(drawing_file)
+
+@jules_function
+def begin_frame():
+    """Stop redrawing the window until end_frame"""
+    global frame_depth
+    frame_depth += 1
+    if current_backend() == 'tk':
+        turtle.tracer(0)
+
+@jules_function
+def end_frame():
+    """Show everything drawn since begin_frame in one redraw"""
+    global frame_depth, last_redraw
+    if frame_depth == 0:
+        raise Exception("end_frame() without a begin_frame()")
+    frame_depth -= 1
+    if current_backend() == 'tk' and frame_depth == 0:
+        turtle.update()
+        last_redraw = perf_counter()
+        if not frame_rate:
+            turtle.tracer(1)
+
+@jules_function
+def set_frame_rate(fps):
+    """Redraw the window at most fps times a second instead of after every move (0 to stop)"""
+    current_backend()
+    batch_redraws(fps)
 
 # Register functions in a dictionary for easy import to Jules
 drawing_functions = {
@@ -220,5 +478,12 @@ drawing_functions = {
     "write_text": write_text,
     "setup": setup,
     "title": title,
-    "done": done
+    "done": done,
+    "begin_frame": begin_frame,
+    "end_frame": end_frame,
+    "set_frame_rate": set_frame_rate,
+    "draw_polyline": draw_polyline,
+    "draw_polygon": draw_polygon,
+    "draw_regular_polygon": draw_regular_polygon,
+    "stamp_many": stamp_many
 } 
\ No newline at end of file
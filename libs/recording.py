@@ -0,0 +1,245 @@
+"""
+Jules Drawing Recorder
+
+A stand-in for turtle that needs no display. Turtles move the same way
+turtle's do, but instead of animating on a Tk screen they record what they
+draw in a display list, which is written out as an SVG file in one pass.
+
+Pen moves that follow each other with the same color and width are kept as
+one polyline, so a long run of forward/turn calls costs a float sum and a
+list append per segment.
+"""
+
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+
+class Path:
+    """Connected lines drawn by one turtle with one pen"""
+    __slots__ = ('points', 'color', 'width')
+
+    def __init__(self, x, y, color, width):
+        self.points = [x, y]  # x and y, one after the other
+        self.color = color
+        self.width = width
+
+
+class Fill:
+    """A filled shape, the points a turtle passed between begin_fill and end_fill"""
+    __slots__ = ('points', 'color')
+
+    def __init__(self, x, y):
+        self.points = [x, y]
+        self.color = None  # set at end_fill, like turtle does
+
+
+class Stamp:
+    """A copy of a turtle's shape left on the drawing"""
+    __slots__ = ('points', 'color', 'fill_color')
+
+    def __init__(self, points, color, fill_color):
+        self.points = points
+        self.color = color
+        self.fill_color = fill_color
+
+
+class Text:
+    """Words written at a point"""
+    __slots__ = ('x', 'y', 'text', 'color', 'font')
+
+    def __init__(self, x, y, text, color, font):
+        self.x = x
+        self.y = y
+        self.text = text
+        self.color = color
+        self.font = font
+
+
+class Drawing:
+    """The display list every recording turtle adds to, in drawing order"""
+    def __init__(self, width=800, height=600):
+        self.width = width
+        self.height = height
+        self.title = None
+        self.items = []
+
+    def new_turtle(self):
+        return RecordingTurtle(self)
+
+    def clear(self):
+        self.items.clear()
+
+    def svg(self):
+        """The whole drawing as SVG, with turtle's origin in the middle and y pointing up"""
+        left, top = -self.width / 2, -self.height / 2
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+                 f'viewBox="{left:g} {top:g} {self.width} {self.height}">\n']
+        if self.title is not None:
+            parts.append(f'<title>{escape(str(self.title))}</title>\n')
+        parts.append(f'<rect x="{left:g}" y="{top:g}" width="{self.width}" height="{self.height}" fill="white"/>\n')
+        for item in self.items:
+            kind = type(item)
+            if kind is Path:
+                if len(item.points) > 2:
+                    parts.append(f'<polyline points="{svg_points(item.points)}" fill="none" '
+                                 f'stroke={quoteattr(svg_color(item.color))} stroke-width="{item.width:g}" '
+                                 f'stroke-linecap="round" stroke-linejoin="round"/>\n')
+            elif kind is Fill:
+                if item.color is not None and len(item.points) > 4:
+                    parts.append(f'<polygon points="{svg_points(item.points)}" '
+                                 f'fill={quoteattr(svg_color(item.color))} stroke="none"/>\n')
+            elif kind is Stamp:
+                parts.append(f'<polygon points="{svg_points(item.points)}" '
+                             f'fill={quoteattr(svg_color(item.fill_color))} '
+                             f'stroke={quoteattr(svg_color(item.color))} stroke-width="1"/>\n')
+            else:
+                family, size = item.font[0], item.font[1]
+                parts.append(f'<text x="{item.x:.2f}" y="{-item.y:.2f}" font-family={quoteattr(str(family))} '
+                             f'font-size="{size}" fill={quoteattr(svg_color(item.color))}>'
+                             f'{escape(str(item.text))}</text>\n')
+        parts.append('</svg>\n')
+        return ''.join(parts)
+
+    def save(self, filename):
+        with open(filename, 'w') as file:
+            file.write(self.svg())
+
+
+def svg_points(points):
+    """x1,-y1 x2,-y2 ... from a flat list of turtle coordinates"""
+    return ' '.join(['%.2f,%.2f' % (points[index], -points[index + 1])
+                     for index in range(0, len(points), 2)])
+
+
+def svg_color(color):
+    """A color for SVG from a color name, '#rrggbb', or red, green and blue from 0 to 1"""
+    if isinstance(color, str):
+        return color
+    red, green, blue = (round(float(part) * 255) for part in color)
+    return f"rgb({red},{green},{blue})"
+
+
+# Turtle's "classic" arrow shape, pointing up
+ARROW = ((0, 0), (-5, -9), (0, -7), (5, -9))
+
+
+class RecordingTurtle:
+    """The parts of turtle.Turtle the drawing library uses, recording instead of animating"""
+    def __init__(self, drawing):
+        self.drawing = drawing
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0  # degrees anticlockwise from east, as in turtle's standard mode
+        self._dx = 1.0
+        self._dy = 0.0
+        self.drawing_pen = True
+        self.color = 'black'
+        self.fill_color = 'black'
+        self.width = 1
+        self.visible = True
+        self._path = None
+        self._fill = None
+
+    def _turn(self, angle):
+        self.heading = (self.heading + angle) % 360
+        radians = math.radians(self.heading)
+        self._dx = math.cos(radians)
+        self._dy = math.sin(radians)
+
+    def _move(self, x, y):
+        if self.drawing_pen:
+            path = self._path
+            items = self.drawing.items
+            # Start a new line if the pen changed or something was drawn over this one
+            if path is None or not items or items[-1] is not path:
+                path = self._path = Path(self.x, self.y, self.color, self.width)
+                items.append(path)
+            path.points += (x, y)
+        if self._fill is not None:
+            self._fill.points += (x, y)
+        self.x = x
+        self.y = y
+
+    def forward(self, distance):
+        self._move(self.x + distance * self._dx, self.y + distance * self._dy)
+
+    def backward(self, distance):
+        self.forward(-distance)
+
+    def right(self, angle):
+        self._turn(-angle)
+
+    def left(self, angle):
+        self._turn(angle)
+
+    def goto(self, x, y):
+        self._move(float(x), float(y))
+
+    def circle(self, radius):
+        """The same many-sided shape turtle draws for a circle, ending where it started"""
+        steps = 1 + int(min(11 + abs(radius) / 6.0, 59.0))
+        step_angle = 360.0 / steps
+        length = 2.0 * radius * math.sin(math.radians(step_angle / 2))
+        if radius < 0:
+            length, step_angle = -length, -step_angle
+        self._turn(step_angle / 2)
+        for _ in range(steps):
+            self.forward(length)
+            self._turn(step_angle)
+        self._turn(-step_angle / 2)
+
+    def penup(self):
+        self.drawing_pen = False
+        self._path = None
+
+    def pendown(self):
+        self.drawing_pen = True
+
+    def isdown(self):
+        return self.drawing_pen
+
+    def position(self):
+        return self.x, self.y
+
+    def pencolor(self, color):
+        self.color = color
+        self._path = None
+
+    def fillcolor(self, color=None):
+        if color is None:
+            return self.fill_color
+        self.fill_color = color
+
+    def pensize(self, width):
+        self.width = width
+        self._path = None
+
+    def speed(self, speed):
+        pass  # nothing animates, so every speed is the fastest
+
+    def begin_fill(self):
+        # The fill goes in the list now, so lines drawn around it stay on top
+        self._fill = Fill(self.x, self.y)
+        self.drawing.items.append(self._fill)
+
+    def end_fill(self):
+        if self._fill is not None:
+            self._fill.color = self.fill_color
+            self._fill = None
+
+    def hideturtle(self):
+        self.visible = False
+
+    def showturtle(self):
+        self.visible = True
+
+    def stamp(self):
+        # The arrow is drawn pointing up, so turn it to face the turtle's heading
+        cos, sin = self._dy, -self._dx
+        points = []
+        for x, y in ARROW:
+            points += (self.x + x * cos - y * sin, self.y + x * sin + y * cos)
+        self.drawing.items.append(Stamp(points, self.color, self.fill_color))
+
+    def write(self, text, font=('Arial', 8, 'normal')):
+        self.drawing.items.append(Text(self.x, self.y, text, self.color, font))
@@ -0,0 +1,15 @@
+"""
+Shared set-up for the tests
+
+Tests import the core package from the repository root, and run programs
+without writing caches or opening drawing windows.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['JULES_CACHE'] = '0'
+os.environ['JULES_DRAWING_BACKEND'] = 'svg'
@@ -0,0 +1,134 @@
+"""
+Budgets: each limit stops a program on every engine, and the meter counts right
+"""
+
+import pytest
+
+from core import budget as budget_module
+from core.budget import Budget, BudgetExceeded, Meter, CHECK_INTERVAL, MEGABYTE
+from core.output import Output
+from core import interpreter, vm, transpiler
+
+FOREVER = "x is 0\nwhile yes\n    x is x + 1\ndone\nshow x\n"
+
+DOWN = "make down(n)\n    return down(n + 1)\ndone\nshow down(1)\n"
+
+FINITE = "make down(n)\n    when n is 0\n        return 0\n    done\n    return down(n - 1)\ndone\nshow down({})\n"
+
+CAUGHT = """x is 0
+try
+    while yes
+        x is x + 1
+    done
+catch
+    show "caught: " + error
+done
+"""
+
+
+def run(engine, tmp_path, source, budget):
+    """What a program shows on one engine, its errors included"""
+    path = tmp_path / 'program.jules'
+    path.write_text(source)
+    output = Output.capture()
+    engine.run_file(str(path), output=output, cache=False, budget=budget)
+    return output.getvalue()
+
+
+ENGINES = [interpreter, vm, transpiler]
+ENGINE_IDS = ['interpreter', 'vm', 'python']
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_statements(engine, tmp_path, capsys):
+    run(engine, tmp_path, FOREVER, Budget(statements=5000))
+    assert capsys.readouterr().out == "An error occurred: The program ran more than 5000 statements\n"
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_time(engine, tmp_path, capsys):
+    run(engine, tmp_path, FOREVER, Budget(seconds=0.2))
+    assert capsys.readouterr().out == "An error occurred: The program ran out of time (0.2s)\n"
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_memory(engine, tmp_path, capsys, monkeypatch):
+    # Every look at the memory finds another megabyte in use
+    in_use = iter(range(0, 1000 * MEGABYTE, MEGABYTE))
+    monkeypatch.setattr(budget_module, 'memory_in_use', lambda: next(in_use))
+    run(engine, tmp_path, FOREVER, Budget(memory=10 * MEGABYTE))
+    assert capsys.readouterr().out == "An error occurred: The program used more than 10MB\n"
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_depth(engine, tmp_path, capsys):
+    run(engine, tmp_path, DOWN, Budget(depth=50))
+    assert capsys.readouterr().out == "An error occurred: Too many calls inside each other (the limit is 50)\n"
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_depth_is_exact(engine, tmp_path, capsys):
+    # 50 calls deep fit, one more does not: no engine gets slack from Python's own limit
+    assert run(engine, tmp_path, FINITE.format(49), Budget(depth=50)) == '0\n'
+    run(engine, tmp_path, FINITE.format(60), Budget(depth=50))
+    assert capsys.readouterr().out == "An error occurred: Too many calls inside each other (the limit is 50)\n"
+
+
+@pytest.mark.parametrize('engine', [vm, transpiler], ids=ENGINE_IDS[1:])
+def test_try_catches_going_over(engine, tmp_path, capsys):
+    shown = run(engine, tmp_path, CAUGHT, Budget(statements=100))
+    assert shown == "caught: The program ran more than 100 statements\n"
+
+
+def test_interpreter_keeps_going_over_after_a_catch(tmp_path, capsys):
+    # The catch block is a block to run too, so it runs into the same limit
+    shown = run(interpreter, tmp_path, CAUGHT, Budget(statements=100))
+    assert shown == ''
+    assert capsys.readouterr().out == "An error occurred: The program ran more than 100 statements\n"
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=ENGINE_IDS)
+def test_no_budget_no_limit(engine, tmp_path):
+    source = "x is 0\nwhile x less than 50000\n    x is x + 1\ndone\nshow x\n"
+    assert run(engine, tmp_path, source, None) == '50000\n'
+
+
+def test_unmetered_translation_has_no_charges():
+    from core.parser import parse_program
+    statements = parse_program(FOREVER)
+    assert '_charge()' not in transpiler.transpile(statements)
+    assert '_charge()' in transpiler.transpile(statements, metered=True)
+
+
+def test_meter_counts_exactly():
+    meter = Meter(Budget(statements=CHECK_INTERVAL + 5))
+    for _ in range(CHECK_INTERVAL + 5):
+        meter.charge()
+    with pytest.raises(BudgetExceeded) as going_over:
+        meter.charge()
+    assert going_over.value.kind == 'statements'
+    # Once over, it stays over
+    with pytest.raises(BudgetExceeded):
+        meter.charge()
+
+
+def test_meter_looks_at_the_clock_every_interval():
+    now = [0.0]
+    meter = Meter(Budget(seconds=1.0), clock=lambda: now[0])
+    now[0] = 5.0
+    for _ in range(CHECK_INTERVAL):
+        meter.charge()
+    with pytest.raises(BudgetExceeded) as going_over:
+        meter.charge()
+    assert going_over.value.kind == 'time'
+
+
+def test_cli_accepts_budgets_on_every_engine(tmp_path, capsys):
+    from core.cli import main
+    path = tmp_path / 'forever.jules'
+    path.write_text(FOREVER)
+    for engine in ([], ['--vm'], ['--python']):
+        main([*engine, '--no-cache', '--max-statements', '2000', str(path)])
+        assert capsys.readouterr().out == "An error occurred: The program ran more than 2000 statements\n"
+    with pytest.raises(SystemExit):
+        main(['--emit-python', '--max-statements', '2000', str(path)])
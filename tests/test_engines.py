@@ -0,0 +1,190 @@
+"""
+The interpreter, the VM and the Python translation have to agree
+
+Every example runs on each engine in a fresh Python, the way 'jules' runs
+it, with the same answers for 'ask', and what each shows is compared.
+"""
+
+import glob
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+ENGINES = ([], ['--vm'], ['--python'])
+
+# Answers for the examples that ask questions
+ANSWERS = '5\n50\n25\n37\n3\nq\n'
+
+EXAMPLES = sorted(glob.glob(os.path.join(ROOT, 'examples', '*.jules'))
+                  + [os.path.join(ROOT, 'example.jules'), os.path.join(ROOT, 'sample.jules')])
+
+
+def run(path, *options, answers=ANSWERS, cwd=None):
+    """What 'jules' shows running path with options, errors included"""
+    result = subprocess.run([sys.executable, '-m', 'core.cli', *options, path],
+                            input=answers, capture_output=True, text=True, cwd=ROOT, timeout=60,
+                            env=dict(os.environ, JULES_DRAWING_FILE=os.path.join(cwd or ROOT, 'drawing.svg')))
+    return result.stdout + result.stderr
+
+
+def run_source(tmp_path, source, *options):
+    path = tmp_path / 'program.jules'
+    path.write_text(source)
+    return run(str(path), *options, cwd=str(tmp_path))
+
+
+@pytest.mark.parametrize('example', EXAMPLES, ids=os.path.basename)
+def test_examples_agree(example, tmp_path):
+    shown = run(example, cwd=str(tmp_path))
+    assert shown
+    for engine in ENGINES[1:]:
+        assert run(example, *engine, cwd=str(tmp_path)) == shown, f"{engine[0]} differs"
+
+
+PROGRAMS = {
+    'while_past_1000': """
+x is 0
+while x less than 5000
+    x is x + 1
+done
+show x
+""",
+    'lists_built_by_plus': """
+xs is []
+repeat 40 times
+    xs is xs + [count]
+done
+show xs
+add 1.5 to xs
+show xs
+""",
+    'deep_recursion': """
+make depth(n)
+    when n is 0
+        return 0
+    done
+    return 1 + depth(n - 1)
+done
+show depth(5000)
+""",
+    'too_deep': """
+make down(n)
+    return down(n + 1)
+done
+try
+    show down(1)
+catch
+    show "caught: " + error
+done
+""",
+    'deep_but_finite': """
+make depth(n)
+    when n is 0
+        return 0
+    done
+    return 1 + depth(n - 1)
+done
+show depth(12000)
+""",
+    'loops_left_by_an_error': """
+item is "orig"
+count is "c0"
+try
+    repeat each item in [1, 2]
+        repeat 3 times
+            repeat 2 times
+                show [1][5]
+            done
+        done
+    done
+catch
+    show "caught"
+done
+show item
+show count
+make inside()
+    item is "local"
+    try
+        repeat each item in [1, 2]
+            show [1][5]
+        done
+    catch
+        show item
+    done
+    return item
+done
+show inside()
+""",
+    'things_and_text': """
+point is {x: 1, y: 2}
+set point.x to point.x + 10
+show "x is " + point.x
+names is ["a", "b"]
+repeat each name in names
+    show name + "!"
+done
+""",
+}
+
+
+TOO_DEEP = {
+    'too_deep': "caught: Too many calls inside each other (the limit is 10000)\n",
+    # Stops on its own, but only after going past the limit
+    'deep_but_finite': "An error occurred: Too many calls inside each other (the limit is 10000)\n",
+}
+
+
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+def test_programs_agree(name, tmp_path):
+    shown = run_source(tmp_path, PROGRAMS[name])
+    assert 'error' not in shown.lower() or name in TOO_DEEP
+    for engine in ENGINES[1:]:
+        assert run_source(tmp_path, PROGRAMS[name], *engine) == shown, f"{engine[0]} differs"
+
+
+@pytest.mark.parametrize('name', sorted(TOO_DEEP))
+def test_too_deep_is_the_same_error_everywhere(name, tmp_path):
+    for engine in ENGINES:
+        assert run_source(tmp_path, PROGRAMS[name], *engine) == TOO_DEEP[name], engine
+
+
+def test_plus_packs_lists_on_every_engine():
+    from core.interpreter import JulesInterpreter
+    from core.vm import JulesVM
+    from core.transpiler import PythonProgram
+    from core.output import Output
+    from core.runtime import NumberList
+    source = PROGRAMS['lists_built_by_plus'].replace('add 1.5 to xs', '')
+    for engine in (JulesInterpreter(output=Output.capture()), JulesVM(Output.capture())):
+        engine.parse_and_execute(source)
+        assert isinstance(engine.variables['xs'], NumberList), type(engine).__name__
+    program = PythonProgram(source)
+    program.run(Output.capture())
+    assert isinstance(program.variables['xs'], NumberList)
+
+
+def test_times_packs_lists_on_every_engine():
+    from core.interpreter import JulesInterpreter
+    from core.vm import JulesVM
+    from core.transpiler import PythonProgram
+    from core.output import Output
+    from core.runtime import NumberList
+    # Neither side is a literal list, so no engine can tell from the source
+    source = "xs is [1, 2]\nn is 20\nys is xs times n\nzs is n times xs\n"
+    for engine in (JulesInterpreter(output=Output.capture()), JulesVM(Output.capture())):
+        engine.parse_and_execute(source)
+        for name in ('ys', 'zs'):
+            assert isinstance(engine.variables[name], NumberList), (type(engine).__name__, name)
+    program = PythonProgram(source)
+    program.run(Output.capture())
+    for name in ('ys', 'zs'):
+        assert isinstance(program.variables[name], NumberList), name
+
+
+def test_translation_refuses_names_python_cant_use(tmp_path):
+    shown = run_source(tmp_path, "x² is 4\nshow x²\n", '--python')
+    assert shown == "Oops! Line 1: 'x²' can't be used as a variable name\n"
@@ -0,0 +1,40 @@
+"""
+Profiling: every call is counted, including those the memo cache answers
+"""
+
+import io
+
+from core import interpreter
+from core.output import Output
+from core.profiler import Profiler, HITS, SELF, REMEMBERED
+
+FIB = """make pure fib(n)
+    when n less than 2
+        return n
+    done
+    return fib(n - 1) + fib(n - 2)
+done
+show fib(20)
+show fib(20)
+"""
+
+
+def test_remembered_calls_count(tmp_path):
+    path = tmp_path / 'program.jules'
+    path.write_text(FIB)
+    report = io.StringIO()
+    profiler = Profiler(stream=report)
+    interpreter.run_file(str(path), output=Output.capture(), cache=False, profiler=profiler)
+    record = profiler.functions[('function', 'fib')]
+    # fib(0) to fib(20) run once each; every other call, the second fib(20) too, is remembered
+    assert (record[HITS], record[REMEMBERED]) == (40, 19)
+    assert record[SELF] > 0
+    assert "fib (function, 19 remembered)" in report.getvalue()
+
+
+def test_remembered_calls_take_no_time():
+    ticks = iter(range(100))
+    profiler = Profiler(stream=io.StringIO(), clock=lambda: next(ticks))
+    profiler.remembered_call('function', 'f')
+    profiler.stop()
+    assert profiler.functions[('function', 'f')][:4] == [1, 0.0, 0.0, 0]
@@ -0,0 +1,174 @@
+"""
+'jules serve': request checking, runs, timeouts and backpressure
+
+One server with a single worker and no backlog answers every test, so a
+second request while a run is going is turned away at once.
+"""
+
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from core.server import Pool, Service, main, make_server, REQUEST_SIZE_LIMIT, EXIT_OK, EXIT_ERROR, EXIT_TIMEOUT
+
+FOREVER = "x is 0\nwhile yes\n    x is x + 1\ndone\n"
+
+
+@pytest.fixture(scope='module')
+def server():
+    pool = Pool(1, 0)
+    server = make_server(Service(pool, timeout=5.0), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    pool.close()
+
+
+def request(server, method, path, body=None):
+    """The status and JSON reply for one request"""
+    connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+    connection.request(method, path, body=None if body is None else json.dumps(body),
+                       headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def raw_request(server, head, body=b''):
+    """The status line for a request written by hand"""
+    with socket.create_connection(server.server_address, timeout=30) as connection:
+        connection.sendall(head + b'\r\n\r\n' + body)
+        connection.shutdown(socket.SHUT_WR)
+        return connection.makefile('rb').readline()
+
+
+def test_run(server):
+    status, reply = request(server, 'POST', '/run', {'source': 'ask "Name?" into name\nshow "Hi " + name',
+                                                     'inputs': ['Ada']})
+    assert status == 200
+    assert (reply['status'], reply['exit_status'], reply['output']) == ('ok', EXIT_OK, 'Hi Ada\n')
+
+
+def test_compile_then_run_by_id(server):
+    status, reply = request(server, 'POST', '/compile', {'source': 'show 6 times 7'})
+    assert status == 200
+    status, reply = request(server, 'POST', '/run', {'program': reply['program']})
+    assert (status, reply['output']) == (200, '42\n')
+
+
+def test_errors_in_programs(server):
+    status, reply = request(server, 'POST', '/compile', {'source': 'while yes\n    show 1\n'})
+    assert status == 400
+    status, reply = request(server, 'POST', '/run', {'source': 'show [1][5]'})
+    assert (status, reply['status'], reply['exit_status']) == (200, 'error', EXIT_ERROR)
+
+
+def test_drawings_come_back_and_start_afresh(server, tmp_path):
+    # Both jobs go to the server's one worker
+    asked_for = tmp_path / 'picture.svg'
+    first = ('get drawing\ncreate_turtle() into t\nshow t\nmove_forward(t, 50)\n'
+             f'setup(100, 100, "svg", "{asked_for}")\ndone()\n')
+    second = 'get drawing\ncreate_turtle() into t\nshow t\nturn_left(t, 90)\nmove_forward(t, 7)\n'
+    status, reply = request(server, 'POST', '/run', {'source': first})
+    assert (status, reply['output']) == (200, 'turtle_1\n')
+    assert '50.00,-0.00' in reply['drawing']
+    assert not asked_for.exists()
+    status, reply = request(server, 'POST', '/run', {'source': second})
+    assert (status, reply['output']) == (200, 'turtle_1\n')
+    assert reply['drawing'].count('<polyline') == 1
+    assert '0.00,-7.00' in reply['drawing']
+    assert 'width="800"' in reply['drawing']
+    assert request(server, 'POST', '/run', {'source': 'show 1'})[1]['drawing'] is None
+
+
+def test_null_means_the_default(server):
+    status, reply = request(server, 'POST', '/run', {'source': 'show 1', 'inputs': None, 'timeout': None})
+    assert (status, reply['output']) == (200, '1\n')
+
+
+def test_timeout_frees_the_worker(server):
+    status, reply = request(server, 'POST', '/run', {'source': FOREVER, 'timeout': 0.3})
+    assert (status, reply['status'], reply['exit_status']) == (200, 'timeout', EXIT_TIMEOUT)
+    assert request(server, 'GET', '/health') == (200, {'workers': 1, 'running': 0, 'waiting': 0})
+    assert request(server, 'POST', '/run', {'source': 'show 1'})[1]['output'] == '1\n'
+
+
+@pytest.mark.parametrize('timeout', ['NaN', 'Infinity', '-1', '0', '"2"', 'true'])
+def test_bad_timeouts(server, timeout):
+    body = f'{{"source": "show 1", "timeout": {timeout}}}'.encode()
+    head = f"POST /run HTTP/1.0\r\nContent-Length: {len(body)}".encode()
+    assert raw_request(server, head, body).split()[1] == b'400'
+    assert request(server, 'GET', '/health')[1]['running'] == 0
+
+
+@pytest.mark.parametrize('body', [
+    {'program': [1]},
+    {'program': 7},
+    {},
+    {'source': 5},
+    {'source': 'show 1', 'inputs': 'Ada'},
+    [1, 2],
+])
+def test_bad_requests(server, body):
+    assert request(server, 'POST', '/run', body)[0] == 400
+
+
+def test_unknown_program_and_path(server):
+    assert request(server, 'POST', '/run', {'program': 'nothing'})[0] == 404
+    assert request(server, 'POST', '/nowhere', {})[0] == 404
+    assert request(server, 'GET', '/nowhere')[0] == 404
+
+
+def test_content_length(server):
+    assert raw_request(server, b'POST /run HTTP/1.0').split()[1] == b'400'
+    assert raw_request(server, b'POST /run HTTP/1.0\r\nContent-Length: -1').split()[1] == b'400'
+    assert raw_request(server, b'POST /run HTTP/1.0\r\nContent-Length: lots').split()[1] == b'400'
+    too_big = f"POST /run HTTP/1.0\r\nContent-Length: {REQUEST_SIZE_LIMIT + 1}".encode()
+    assert raw_request(server, too_big).split()[1] == b'413'
+
+
+def test_unexpected_errors_get_an_answer(server, monkeypatch):
+    def broken(source):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(server.service, 'keep', broken)
+    status, reply = request(server, 'POST', '/run', {'source': 'show 1'})
+    assert status == 500
+    assert 'broken' in reply['error']
+
+
+def test_busy(server):
+    slow = threading.Thread(target=request, args=(server, 'POST', '/run', {'source': FOREVER, 'timeout': 1}))
+    slow.start()
+    try:
+        for _ in range(100):
+            if request(server, 'GET', '/health')[1]['running']:
+                break
+            threading.Event().wait(0.01)
+        assert request(server, 'POST', '/run', {'source': 'show 1'})[0] == 503
+    finally:
+        slow.join()
+    assert request(server, 'GET', '/health')[1]['running'] == 0
+
+
+def test_socket_path_must_hold_a_socket(tmp_path):
+    # What an earlier server left behind is cleared away...
+    path = str(tmp_path / 'jules.sock')
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    make_server(None, socket_path=path).server_close()
+    # ...but nothing else is
+    (tmp_path / 'notes.txt').write_text('keep me')
+    with pytest.raises(FileExistsError):
+        make_server(None, socket_path=str(tmp_path / 'notes.txt'))
+    assert (tmp_path / 'notes.txt').read_text() == 'keep me'
+
+
+def test_backlog_cant_be_negative(capsys):
+    with pytest.raises(SystemExit):
+        main(['--backlog', '-1'])
+    assert '--backlog must be 0 or more' in capsys.readouterr().err
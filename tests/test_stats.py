@@ -0,0 +1,45 @@
+"""
+Counting: --stats tallies the same work whichever way the interpreter runs it
+
+Statements that call Jules functions run on the generator path, the rest on
+the plain one; a condition is a condition on both.
+"""
+
+import io
+import json
+
+import pytest
+
+from core import interpreter
+from core.output import Output
+
+HALF = "make half(n)\n    return n / 2\ndone\n"
+
+
+def stats(tmp_path, source):
+    """What --stats reports for a program"""
+    path = tmp_path / 'program.jules'
+    path.write_text(source)
+    written = io.StringIO()
+    interpreter.run_file(str(path), output=Output.capture(), cache=False, stats=written)
+    return json.loads(written.getvalue())
+
+
+@pytest.mark.parametrize('source, expressions', [
+    ("x is 4\nwhen x is 4\n    x is 2\ndone\n", 2),
+    # Both of these run on the generator path; 'return n / 2' is the third expression
+    (HALF + "x is 4\nwhen half(x) is 2\n    x is 2\ndone\n", 3),
+    (HALF + "x is 4\nwhen x is 4\n    x is half(x)\ndone\n", 3),
+], ids=['plain', 'call_in_condition', 'call_in_body'])
+def test_when_counts_one_condition(tmp_path, source, expressions):
+    counted = stats(tmp_path, source)
+    assert (counted['conditions'], counted['expressions']) == (1, expressions)
+
+
+@pytest.mark.parametrize('source', [
+    "x is 0\nwhile x less than 3\n    x is x + 1\ndone\n",
+    HALF + "x is 0\nwhile half(x) less than 1.5\n    x is x + 1\ndone\n",
+], ids=['plain', 'call_in_condition'])
+def test_while_counts_every_check(tmp_path, source):
+    # Three times round and once more to find it false
+    assert stats(tmp_path, source)['conditions'] == 4